@@ -0,0 +1,513 @@
+"""
+Offline analysis of recorded sample files.
+
+Reads the NDJSON or CSV written by `ping.py --headless` (or any file with
+timestamp, target, latency/rtt and packetLoss/loss columns) in chunks and
+reports, per target and per hour: RTT percentiles, loss, loss-burst
+lengths, jitter, spike counts and the quality score the dashboard shows.
+
+    python analyze.py samples.ndjson
+    python analyze.py samples.csv --json > report.json
+
+Memory stays bounded however long the capture is: every chunk is folded
+into fixed-size histograms and counters, and only the last few thousand
+samples per target are kept for the quality score. Needs NumPy; pandas is
+used for faster CSV parsing, and pyarrow or orjson for faster NDJSON
+parsing, when installed. Blank and malformed lines are skipped and counted.
+"""
+import argparse
+import csv
+import io
+import itertools
+import json
+import math
+import os
+import sys
+import time
+import warnings
+from typing import Dict, Iterator, List, Optional, Tuple
+
+try:
+    import numpy as np
+except ImportError:
+    np = None
+
+try:
+    import pandas as pd
+except ImportError:  # Optional; the csv module is used instead
+    pd = None
+
+try:
+    import pyarrow as pa
+    import pyarrow.json as pa_json
+    # Fixed types, so a chunk whose first rows hold integer losses does not fail on a fraction later
+    _ARROW_PARSE_OPTIONS = pa_json.ParseOptions(explicit_schema=pa.schema(
+        [('timestamp', pa.float64()), ('target', pa.string())]
+        + [(name, pa.float64()) for name in ('latency', 'rtt', 'packetLoss', 'loss')]))
+except ImportError:  # Optional; NDJSON is then decoded line by line
+    pa = None
+
+try:
+    from orjson import loads as _loads
+except ImportError:  # Optional; about three times faster than the json module
+    _loads = json.loads
+
+# pyarrow parses on every core; on a single one orjson's line decoder is faster
+_USE_ARROW = pa is not None and ((os.cpu_count() or 1) > 1 or _loads is json.loads)
+
+from detector import SPIKE_MIN_MS, SPIKE_MIN_RATIO, SPIKE_SIGMAS
+from stats import PERCENTILES, bucket_index, bucket_value
+
+DEFAULT_CHUNK_ROWS = 1_000_000
+# Samples behind the dashboard's quality score (maxHistoryLength in web/script.js)
+QUALITY_WINDOW = 7200
+# Same log-spaced buckets as the live statistics
+HIST_MIN = bucket_value(0)
+HIST_GROWTH = math.log(bucket_value(2) / bucket_value(1))
+HIST_BUCKETS = bucket_index(10 ** 9) + 1
+
+LATENCY_COLUMNS = ('latency', 'rtt')
+LOSS_COLUMNS = ('packetLoss', 'loss')
+
+
+def bucket_indexes(values):
+    """Vectorized stats.bucket_index"""
+    indexes = np.floor(np.log(np.maximum(values, HIST_MIN) / HIST_MIN) / HIST_GROWTH).astype(np.int64) + 1
+    indexes[values <= HIST_MIN] = 0
+    return np.minimum(indexes, HIST_BUCKETS - 1)
+
+
+def histogram_percentiles(histogram, count: int, low: float, high: float, quantiles=PERCENTILES) -> List[float]:
+    """Percentiles from bucket counts, clamped to the observed range like the store's rollups"""
+    if not count:
+        return [None] * len(quantiles)
+    ranks = [max(1, math.ceil(count * q / 100)) for q in quantiles]
+    indexes = np.searchsorted(np.cumsum(histogram), ranks)
+    return [min(max(bucket_value(int(index)), low), high) for index in indexes]
+
+
+def spike_impact(deviation):
+    """Vectorized spikeImpactOf from web/script.js"""
+    deviation = np.maximum(deviation, 0)
+    return np.where(deviation < 20, deviation * 0.5,
+                    np.where(deviation < 50, deviation ** 1.5 * 0.1, deviation ** 2 * 0.05))
+
+
+def quality_score(latency, loss) -> Optional[int]:
+    """
+    calculateQualityScore from web/script.js for the newest sample of a
+    window: latency as the dashboard sees it (0 for a lost sample) and
+    loss in percent, oldest first.
+    """
+    count = len(latency)
+    if not count:
+        return None
+    current = latency[-1]
+    weights = np.arange(1, count + 1, dtype=np.float64)
+    current_score = min(100.0, max(0.0, (100 - current) / 0.8))
+    weighted_average = float(weights @ latency) / count / (count + 1) * 2
+    historical_score = min(100.0, max(0.0, (100 - weighted_average) / 0.8))
+    baseline = float(latency.min())
+    impact = float(weights @ spike_impact(latency - baseline)) / count
+    impact += float(spike_impact(np.float64(current - baseline))) * 2
+    spike_score = max(0.0, 100 - impact / 1000)
+    recent = min(10, count)
+    recent_sum = float(loss[-recent:].sum())
+    historical_count = count - recent
+    recent_average = recent_sum / recent * 1.5
+    historical_average = (float(loss.sum()) - recent_sum) / historical_count if historical_count else 0
+    loss_score = max(0.0, 100 - (recent_average + historical_average) / 2 * 20)
+    # Math.round rounds halves up
+    return int(math.floor(current_score * 0.25 + historical_score * 0.25 + spike_score * 0.30 + loss_score * 0.20 + 0.5))
+
+
+class _Summary:
+    """Counters and an RTT histogram for one target, or one target in one hour"""
+
+    __slots__ = ('samples', 'lost', 'loss_total', 'histogram', 'rtt_total', 'rtt_min', 'rtt_max',
+                 'jitter_total', 'jitter_count', 'spikes', 'quality')
+
+    def __init__(self):
+        self.samples = 0
+        self.lost = 0  # Samples where every probe was lost
+        self.loss_total = 0.0  # Sum of loss fractions, for the loss percentage
+        self.histogram = np.zeros(HIST_BUCKETS, dtype=np.int64)
+        self.rtt_total = 0.0
+        self.rtt_min = math.inf
+        self.rtt_max = -math.inf
+        self.jitter_total = 0.0
+        self.jitter_count = 0
+        self.spikes = 0
+        self.quality = None
+
+    def add(self, rtt, loss, lost, jitter):
+        self.samples += len(loss)
+        self.loss_total += float(loss.sum())
+        self.lost += int(lost.sum())
+        received = rtt[~np.isnan(rtt)]
+        if len(received):
+            self.histogram += np.bincount(bucket_indexes(received), minlength=HIST_BUCKETS)
+            self.rtt_total += float(received.sum())
+            self.rtt_min = min(self.rtt_min, float(received.min()))
+            self.rtt_max = max(self.rtt_max, float(received.max()))
+        self.jitter_total += float(jitter.sum())
+        self.jitter_count += len(jitter)
+
+    @property
+    def received(self) -> int:
+        return int(self.histogram.sum())
+
+    def report(self) -> Dict[str, object]:
+        received = self.received
+        percentiles = histogram_percentiles(self.histogram, received, self.rtt_min, self.rtt_max)
+        return {
+            'samples': self.samples,
+            'lossPercent': round(self.loss_total * 100 / self.samples, 3) if self.samples else 0,
+            'lostSamples': self.lost,
+            'rtt': {
+                'min': _round(self.rtt_min) if received else None,
+                'mean': _round(self.rtt_total / received) if received else None,
+                'max': _round(self.rtt_max) if received else None,
+                **{f'p{q}': _round(value) for q, value in zip(PERCENTILES, percentiles)},
+            },
+            # Mean absolute difference between consecutive RTTs
+            'jitter': _round(self.jitter_total / self.jitter_count) if self.jitter_count else None,
+            'spikes': self.spikes,
+            'qualityScore': self.quality,
+        }
+
+
+def _round(value: Optional[float]) -> Optional[float]:
+    return round(value, 3) if value is not None else None
+
+
+class TargetAnalysis:
+    """Streaming analysis of one target; add() takes the target's rows of a chunk, in time order"""
+
+    def __init__(self, name: str):
+        self.name = name
+        self.total = _Summary()
+        self.hours: Dict[int, _Summary] = {}
+        self.bursts: Dict[int, int] = {}
+        self._open_burst = 0
+        self._last_rtt = math.nan
+        self._in_spike = False
+        # Dashboard view of the newest samples, for the quality score
+        self._latency_tail = np.zeros(0)
+        self._loss_tail = np.zeros(0)
+
+    def _spike_threshold(self) -> float:
+        """Robust baseline from the histogram so far: median plus deviations from the IQR"""
+        received = self.total.received
+        p25, p50, p75 = histogram_percentiles(self.total.histogram, received, self.total.rtt_min,
+                                              self.total.rtt_max, (25, 50, 75))
+        sigma = (p75 - p25) / 1.349
+        return p50 + max(SPIKE_SIGMAS * sigma, SPIKE_MIN_RATIO * p50, SPIKE_MIN_MS)
+
+    def add(self, timestamps, rtt, loss):
+        lost = loss >= 1
+        rtt = np.where(lost, np.nan, rtt)
+        received = ~np.isnan(rtt)
+
+        # Jitter: differences between consecutive replies, carried over chunk borders
+        replies = np.concatenate(([self._last_rtt], rtt[received]))
+        differences = np.abs(np.diff(replies))
+        reply_valid = ~np.isnan(differences)
+        if received.any():
+            self._last_rtt = replies[-1]
+
+        # Loss bursts: lengths of runs of fully lost samples
+        edges = np.diff(np.concatenate(([0], lost.astype(np.int8), [0])))
+        starts = np.flatnonzero(edges == 1)
+        lengths = np.flatnonzero(edges == -1) - starts
+        if self._open_burst:
+            if len(starts) and starts[0] == 0:
+                lengths[0] += self._open_burst
+            else:
+                self._count_burst(self._open_burst)
+            self._open_burst = 0
+        if lost[-1]:
+            # Still lost at the end of the chunk; finished by a later chunk or finish()
+            self._open_burst = int(lengths[-1])
+            lengths = lengths[:-1]
+        for length, count in zip(*np.unique(lengths, return_counts=True)):
+            self._count_burst(int(length), int(count))
+
+        self.total.add(rtt, loss, lost, differences[reply_valid])
+
+        # Spikes: episodes above the threshold, counted once where they start
+        above = received & (rtt > self._spike_threshold()) if self.total.received else np.zeros_like(received)
+        spike_starts = above & ~np.concatenate(([self._in_spike], above[:-1]))
+        if len(above):
+            self._in_spike = bool(above[-1])
+        self.total.spikes += int(spike_starts.sum())
+
+        # Dashboard values: latency 0 for a lost sample, loss in percent
+        latency = np.where(received, rtt, 0.0)
+        loss_percent = loss * 100
+        latency_all = np.concatenate((self._latency_tail, latency))
+        loss_all = np.concatenate((self._loss_tail, loss_percent))
+        offset = len(self._latency_tail)
+
+        hours = (timestamps // 3600).astype(np.int64)
+        boundaries = np.flatnonzero(np.diff(hours)) + 1
+        reply_hours = hours[received]
+        for start, end in zip(np.concatenate(([0], boundaries)), np.concatenate((boundaries, [len(hours)]))):
+            hour = int(hours[start])
+            summary = self.hours.get(hour)
+            if summary is None:
+                summary = self.hours[hour] = _Summary()
+            summary.add(rtt[start:end], loss[start:end], lost[start:end],
+                        differences[reply_valid & (reply_hours == hour)])
+            summary.spikes += int(spike_starts[start:end].sum())
+            window_end = offset + end
+            window_start = max(0, window_end - QUALITY_WINDOW)
+            summary.quality = quality_score(latency_all[window_start:window_end], loss_all[window_start:window_end])
+
+        self.total.quality = quality_score(latency_all[-QUALITY_WINDOW:], loss_all[-QUALITY_WINDOW:])
+        self._latency_tail = latency_all[-QUALITY_WINDOW:]
+        self._loss_tail = loss_all[-QUALITY_WINDOW:]
+
+    def _count_burst(self, length: int, count: int = 1):
+        self.bursts[length] = self.bursts.get(length, 0) + count
+
+    def finish(self):
+        if self._open_burst:
+            self._count_burst(self._open_burst)
+            self._open_burst = 0
+
+    def report(self) -> Dict[str, object]:
+        result = self.total.report()
+        result['lossBursts'] = {str(length): count for length, count in sorted(self.bursts.items())}
+        result['hours'] = {time.strftime('%Y-%m-%dT%H:00Z', time.gmtime(hour * 3600)): summary.report()
+                           for hour, summary in sorted(self.hours.items())}
+        return result
+
+
+def _column(names: List[str], choices: Tuple[str, ...], required: bool = True) -> Optional[str]:
+    for choice in choices:
+        if choice in names:
+            return choice
+    if required:
+        raise ValueError(f"No {' or '.join(choices)} column in {', '.join(names)}")
+    return None
+
+
+def _loss_fraction(values, column: str):
+    """packetLoss is a percentage, loss a fraction or 0/1 flag"""
+    values = np.nan_to_num(values.astype(np.float64), nan=0.0)
+    return values / 100 if column == 'packetLoss' else values
+
+
+def _seconds(timestamps):
+    """Timestamps in seconds, accepting milliseconds as written by the dashboard"""
+    timestamps = timestamps.astype(np.float64)
+    if len(timestamps) and np.nanmax(timestamps) > 1e11:
+        timestamps = timestamps / 1000
+    return timestamps
+
+
+def read_csv_chunks(path: str, chunk_rows: int) -> Iterator[tuple]:
+    if pd is not None:
+        reader = pd.read_csv(sys.stdin if path == '-' else path, chunksize=chunk_rows, dtype={'target': str})
+        for frame in reader:
+            names = frame.columns.tolist()
+            latency_column = _column(names, LATENCY_COLUMNS)
+            loss_column = _column(names, LOSS_COLUMNS)
+            targets = frame['target'].fillna('').to_numpy(dtype=object) if 'target' in names else None
+            yield (_seconds(frame['timestamp'].to_numpy()), targets,
+                   frame[latency_column].to_numpy(dtype=np.float64),
+                   _loss_fraction(frame[loss_column].to_numpy(dtype=np.float64), loss_column))
+        return
+
+    f = sys.stdin if path == '-' else open(path, newline='')
+    with f:
+        names = next(csv.reader([f.readline()]))
+        timestamp_index = names.index('timestamp')
+        latency_column = _column(names, LATENCY_COLUMNS)
+        loss_column = _column(names, LOSS_COLUMNS)
+        latency_index = names.index(latency_column)
+        loss_index = names.index(loss_column)
+        target_index = names.index('target') if 'target' in names else None
+        while True:
+            lines = list(itertools.islice(f, chunk_rows))
+            if not lines:
+                return
+            try:
+                # numpy's C parser; it rejects empty fields, which the slow path below handles
+                with warnings.catch_warnings():
+                    warnings.simplefilter('ignore', UserWarning)  # Blank lines
+                    numbers = np.loadtxt(lines, delimiter=',', quotechar='"', dtype=np.float64, ndmin=2,
+                                         usecols=(timestamp_index, latency_index, loss_index))
+                    targets = (np.loadtxt(lines, delimiter=',', quotechar='"', dtype=str, ndmin=1,
+                                          usecols=target_index) if target_index is not None else None)
+                timestamps, latencies, losses = numbers.T
+            except ValueError:
+                columns = list(zip(*(row for row in csv.reader(lines) if row)))
+                timestamps = np.array(columns[timestamp_index], dtype=np.float64)
+                latencies = np.array([float(value) if value else math.nan for value in columns[latency_index]])
+                losses = np.array([float(value) if value else 0.0 for value in columns[loss_index]])
+                targets = np.array(columns[target_index], dtype=object) if target_index is not None else None
+            yield _seconds(timestamps), targets, latencies, _loss_fraction(losses, loss_column)
+
+
+def _ndjson_columns_arrow(lines: List[bytes], counts: Dict[str, int]) -> Optional[tuple]:
+    """Decode a chunk of lines with pyarrow's multithreaded JSON reader; None if pyarrow rejects it"""
+    try:
+        table = pa_json.read_json(io.BytesIO(b''.join(lines)), parse_options=_ARROW_PARSE_OPTIONS)
+    except (pa.ArrowInvalid, pa.ArrowNotImplementedError):
+        return None  # Malformed lines or a field changing type; the line decoder sorts them out
+    names = table.column_names
+    samples = table.column('timestamp').is_valid().to_numpy(zero_copy_only=False)
+    events = (table.column('kind').is_valid().to_numpy(zero_copy_only=False) if 'kind' in names
+              else np.zeros(len(samples), dtype=bool))
+    # pyarrow drops blank lines; lines without a timestamp that are not spike/trend events are malformed
+    counts['skippedLines'] += len(lines) - table.num_rows + int((~samples & ~events).sum())
+    table = table.filter(pa.array(samples))
+
+    def present(choices: Tuple[str, ...]) -> Optional[str]:
+        # Every column of the explicit schema exists; the file's own ones have values
+        return next((name for name in choices if table.column(name).null_count < table.num_rows), None)
+
+    latency_column = present(LATENCY_COLUMNS) or LATENCY_COLUMNS[0]
+    loss_column = present(LOSS_COLUMNS) or LOSS_COLUMNS[0]
+    return (table.column('timestamp').to_numpy(),
+            table.column('target').fill_null('').to_numpy(),
+            table.column(latency_column).fill_null(math.nan).to_numpy(),
+            table.column(loss_column).fill_null(0.0).to_numpy(), loss_column)
+
+
+def _ndjson_columns(lines: List[bytes], counts: Dict[str, int]) -> tuple:
+    """Decode a chunk of lines into (timestamps, targets, latencies, losses, loss column)"""
+    try:
+        records = [_loads(line) for line in lines]
+        samples = [record for record in records if 'kind' not in record]
+        timestamps = np.array([record['timestamp'] for record in samples], dtype=np.float64)
+    except (ValueError, TypeError, KeyError):
+        # A blank or malformed line somewhere in the chunk: decode line by line and skip those
+        samples = []
+        for line in lines:
+            try:
+                record = _loads(line)
+            except ValueError:
+                record = None
+            if isinstance(record, dict) and 'kind' in record:
+                continue  # Spike/trend event lines
+            if not isinstance(record, dict) or not isinstance(record.get('timestamp'), (int, float)):
+                counts['skippedLines'] += 1
+                continue
+            samples.append(record)
+        timestamps = np.array([record['timestamp'] for record in samples], dtype=np.float64)
+    first = samples[0] if samples else {}
+    latency_column = 'latency' if 'latency' in first else 'rtt'
+    loss_column = 'packetLoss' if 'packetLoss' in first else 'loss'
+    # NumPy turns None into NaN in float arrays
+    return (timestamps, np.array([record.get('target', '') for record in samples], dtype=object),
+            np.array([record.get(latency_column) for record in samples], dtype=np.float64),
+            np.array([record.get(loss_column) or 0 for record in samples], dtype=np.float64), loss_column)
+
+
+def read_ndjson_chunks(path: str, chunk_rows: int, counts: Optional[Dict[str, int]] = None) -> Iterator[tuple]:
+    counts = counts if counts is not None else {}
+    counts.setdefault('skippedLines', 0)
+    f = sys.stdin.buffer if path == '-' else open(path, 'rb')
+    with f:
+        while True:
+            lines = list(itertools.islice(f, chunk_rows))
+            if not lines:
+                return
+            columns = _ndjson_columns_arrow(lines, counts) if _USE_ARROW else None
+            if columns is None:
+                columns = _ndjson_columns(lines, counts)
+            timestamps, targets, latencies, losses, loss_column = columns
+            if len(timestamps):
+                yield _seconds(timestamps), targets, latencies, _loss_fraction(losses, loss_column)
+
+
+def analyze(chunks: Iterator[tuple]) -> Dict[str, object]:
+    """Fold chunks of (timestamps, targets, rtt ms, loss fraction) into a per-target report"""
+    analyses: Dict[str, TargetAnalysis] = {}
+    rows = 0
+    started = time.perf_counter()
+    for timestamps, targets, rtt, loss in chunks:
+        rows += len(timestamps)
+        if targets is None:
+            groups = [('', slice(None))]
+        else:
+            # Group the chunk by target, keeping each target's rows in file order
+            names, codes = np.unique(targets, return_inverse=True)
+            order = np.argsort(codes, kind='stable')
+            bounds = np.searchsorted(codes[order], np.arange(len(names) + 1))
+            groups = [(name, order[bounds[index]:bounds[index + 1]]) for index, name in enumerate(names)]
+        for name, rows_of in groups:
+            analysis = analyses.get(name)
+            if analysis is None:
+                analysis = analyses[name] = TargetAnalysis(name)
+            analysis.add(timestamps[rows_of], rtt[rows_of], loss[rows_of])
+    for analysis in analyses.values():
+        analysis.finish()
+    return {
+        'rows': rows,
+        'seconds': round(time.perf_counter() - started, 3),
+        'targets': {name: analysis.report() for name, analysis in analyses.items()},
+    }
+
+
+def print_report(report: Dict[str, object], hours: bool, out=sys.stdout):
+    print(f"{report['rows']} samples analysed in {report['seconds']}s", file=out)
+    for name, target in report['targets'].items():
+        rtt = target['rtt']
+        bursts = ', '.join(f"{length}x{count}" for length, count in target['lossBursts'].items()) or 'none'
+        print(f"\n{name or '(no target)'}: {target['samples']} samples, quality {target['qualityScore']}", file=out)
+        print(f"  rtt ms     min {rtt['min']}  p50 {rtt['p50']}  p95 {rtt['p95']}  p99 {rtt['p99']}  max {rtt['max']}", file=out)
+        print(f"  loss       {target['lossPercent']}%  bursts (length x count): {bursts}", file=out)
+        print(f"  jitter ms  {target['jitter']}  spikes {target['spikes']}", file=out)
+        if hours:
+            print("  hour (UTC)          samples   loss%     p50     p95     p99  jitter  spikes  quality", file=out)
+            for hour, summary in target['hours'].items():
+                values = (summary['samples'], summary['lossPercent'], summary['rtt']['p50'], summary['rtt']['p95'],
+                          summary['rtt']['p99'], summary['jitter'], summary['spikes'], summary['qualityScore'])
+                print("  {:<18} {:>8} {:>7} {:>7} {:>7} {:>7} {:>7} {:>7} {:>8}".format(
+                    hour, *('-' if value is None else value for value in values)), file=out)
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('path', help="NDJSON or CSV sample file, '-' for stdin")
+    parser.add_argument('--format', choices=('auto', 'ndjson', 'csv'), default='auto',
+                        help="input format; auto uses the file extension (default: %(default)s)")
+    parser.add_argument('--chunk-rows', type=int, default=DEFAULT_CHUNK_ROWS,
+                        help="rows read and processed at a time (default: %(default)s)")
+    parser.add_argument('--json', action='store_true', help="print the full report as JSON")
+    parser.add_argument('--hours', action='store_true', help="include the per-hour breakdown in the text report")
+    args = parser.parse_args()
+
+    if np is None:
+        print("analyze.py needs NumPy: pip install numpy", file=sys.stderr)
+        return 2
+    fmt = args.format
+    if fmt == 'auto':
+        fmt = 'csv' if args.path.lower().endswith('.csv') else 'ndjson'
+    counts = {}
+    if fmt == 'csv':
+        chunks = read_csv_chunks(args.path, max(1, args.chunk_rows))
+    else:
+        chunks = read_ndjson_chunks(args.path, max(1, args.chunk_rows), counts)
+    try:
+        report = analyze(chunks)
+    except (OSError, ValueError, KeyError) as e:
+        print(f"Could not analyse {args.path}: {e}", file=sys.stderr)
+        return 1
+    report.update(counts)
+    if counts.get('skippedLines'):
+        print(f"Skipped {counts['skippedLines']} blank or malformed line(s)", file=sys.stderr)
+    if args.json:
+        json.dump(report, sys.stdout, indent=2)
+        print()
+    else:
+        print_report(report, args.hours)
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -0,0 +1,401 @@
+"""
+Benchmarks for the monitor's own overhead.
+
+Runs against loopback stand-in listeners so the network does not add noise:
+a TCP listener for connect probes and a UDP responder that answers after an
+injected delay, so the reported RTT can be checked against a known value.
+
+    python benchmarks/bench.py --output results.json
+    python benchmarks/bench.py --compare results.json
+
+Results are a flat JSON object of metric name -> number, plus metadata.
+With --compare, metrics that moved by more than --threshold percent are
+listed and the exit status is 1 if any of them got worse. It is also 1 if
+samples over many loopback targets were flagged as monitor stalls.
+"""
+import argparse
+import asyncio
+import json
+import os
+import platform
+import selectors
+import socket
+import statistics
+import subprocess
+import sys
+import threading
+import time
+
+try:
+    import resource
+except ImportError:  # Windows: CPU times come from os.times, context switches are not counted
+    resource = None
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT)
+os.environ.setdefault("NETWORK_MONITOR_LOG_LEVEL", "WARNING")
+
+import ping  # noqa: E402
+from engine import ProbeEngine  # noqa: E402
+from probers import ProberUnavailable, ProbeFailed, create_prober  # noqa: E402
+from scheduler import DeadlineScheduler  # noqa: E402
+from shard import ShardedProbeEngine  # noqa: E402
+from stats import StreamingStats  # noqa: E402
+from transport import BatchChannel  # noqa: E402
+
+# Metrics where a larger number is better; everything else is a cost
+HIGHER_IS_BETTER = ('_per_second',)
+
+
+class TcpStandIn:
+    """Loopback TCP listener that accepts and closes connections, on one port of each address"""
+
+    def __init__(self, addresses=('127.0.0.1',)):
+        self.selector = selectors.DefaultSelector()
+        self.socks = []
+        self.addresses = []
+        self.port = 0
+        for address in addresses:
+            sock = socket.socket(socket.AF_INET, socket.SOCK_STREAM)
+            try:
+                sock.bind((address, self.port))
+            except OSError:
+                sock.close()  # Only 127.0.0.1 is configured on some systems
+                continue
+            sock.listen(1024)
+            self.port = sock.getsockname()[1]
+            self.socks.append(sock)
+            self.addresses.append(address)
+            self.selector.register(sock, selectors.EVENT_READ)
+        self._running = True
+        self._thread = threading.Thread(target=self._run, daemon=True)
+        self._thread.start()
+
+    def _run(self):
+        while self._running:
+            for key, _ in self.selector.select(0.1):
+                try:
+                    conn, _ = key.fileobj.accept()
+                except OSError:
+                    continue
+                conn.close()
+
+    def close(self):
+        self._running = False
+        self._thread.join()
+        self.selector.close()
+        for sock in self.socks:
+            sock.close()
+
+
+class UdpStandIn:
+    """Loopback UDP responder that echoes each datagram after a fixed delay"""
+
+    def __init__(self, delay_ms: float):
+        self.delay = delay_ms / 1000
+        self.sock = socket.socket(socket.AF_INET, socket.SOCK_DGRAM)
+        self.sock.bind(('127.0.0.1', 0))
+        self.port = self.sock.getsockname()[1]
+        self._thread = threading.Thread(target=self._run, daemon=True)
+        self._thread.start()
+
+    def _run(self):
+        while True:
+            try:
+                data, address = self.sock.recvfrom(2048)
+            except OSError:
+                return
+            threading.Timer(self.delay, self._reply, (data, address)).start()
+
+    def _reply(self, data, address):
+        try:
+            self.sock.sendto(data, address)
+        except OSError:
+            pass
+
+    def close(self):
+        self.sock.close()
+
+
+def _usage():
+    """(user CPU s, system CPU s, context switches or None) for this process"""
+    if resource is None:
+        times = os.times()
+        return times.user, times.system, None
+    usage = resource.getrusage(resource.RUSAGE_SELF)
+    return usage.ru_utime, usage.ru_stime, usage.ru_nvcsw + usage.ru_nivcsw
+
+
+def _percentile(values, q):
+    ordered = sorted(values)
+    return ordered[min(len(ordered) - 1, int(len(ordered) * q / 100))]
+
+
+def bench_probers(results, probes):
+    """CPU time (user/system) and context switches per probe for each backend"""
+    tcp = TcpStandIn()
+    udp = UdpStandIn(delay_ms=0)
+    loop = asyncio.new_event_loop()
+    try:
+        for name in ('tcp', 'udp', 'icmp'):
+            try:
+                prober = create_prober(name)
+            except ProberUnavailable as e:
+                print(f"skipping {name}: {e}", file=sys.stderr)
+                continue
+            if name == 'tcp':
+                prober.ports = (tcp.port,)
+            elif name == 'udp':
+                prober.port = udp.port
+            rtts = []
+            user, system, switches = _usage()
+            start = time.perf_counter()
+            for _ in range(probes):
+                try:
+                    rtts.append(loop.run_until_complete(prober.probe('127.0.0.1')))
+                except ProbeFailed:
+                    pass
+            wall = time.perf_counter() - start
+            user2, system2, switches2 = _usage()
+            results[f'probe_{name}_user_us'] = (user2 - user) / probes * 1e6
+            results[f'probe_{name}_system_us'] = (system2 - system) / probes * 1e6
+            results[f'probe_{name}_wall_us'] = wall / probes * 1e6
+            if switches is not None:
+                results[f'probe_{name}_context_switches'] = (switches2 - switches) / probes
+            if rtts:
+                results[f'probe_{name}_loopback_rtt_ms'] = statistics.median(rtts)
+
+        # The API-level probe, including engine bookkeeping and statistics
+        api = ping.API(None, targets=['127.0.0.1'])
+        api.engine.prober.ports = (tcp.port,)
+        user, system, _ = _usage()
+        start = time.perf_counter()
+        for _ in range(probes):
+            api.optimized_socket_ping()
+        results['optimized_socket_ping_wall_us'] = (time.perf_counter() - start) / probes * 1e6
+        user2, system2, _ = _usage()
+        results['optimized_socket_ping_cpu_us'] = ((user2 - user) + (system2 - system)) / probes * 1e6
+        api.engine.close()
+    finally:
+        loop.close()
+        tcp.close()
+        udp.close()
+
+
+def bench_delay_accuracy(results, probes, delay_ms):
+    """How far the UDP backend's RTT is from a known injected delay"""
+    udp = UdpStandIn(delay_ms=delay_ms)
+    prober = create_prober('udp')
+    prober.port = udp.port
+    loop = asyncio.new_event_loop()
+    try:
+        rtts = [loop.run_until_complete(prober.probe('127.0.0.1')) for _ in range(probes)]
+    finally:
+        loop.close()
+        udp.close()
+    errors = [rtt - delay_ms for rtt in rtts]
+    results[f'udp_{int(delay_ms)}ms_error_median_ms'] = statistics.median(errors)
+    results[f'udp_{int(delay_ms)}ms_error_p99_ms'] = _percentile(errors, 99)
+
+
+def bench_update_loop(results, interval_ms, duration):
+    """Lateness and drift of update_loop ticks at a given interval"""
+    tcp = TcpStandIn()
+    api = ping.API(None, targets=['127.0.0.1'])
+    api.engine.prober.ports = (tcp.port,)
+    api.set_interval(interval_ms)
+    lateness = []
+    fired = []
+    api.add_sample_listener(lambda sample: (lateness.append(sample['tickLateness']),
+                                            fired.append(time.monotonic())))
+    api.start_update_thread()
+    time.sleep(duration)
+    api.stop_updates()
+    api.engine.close()
+    tcp.close()
+    if len(fired) < 2:
+        return
+    expected = (len(fired) - 1) * interval_ms
+    actual = (fired[-1] - fired[0]) * 1000
+    key = f'update_loop_{int(interval_ms)}ms'
+    results[f'{key}_lateness_p50_ms'] = _percentile(lateness, 50)
+    results[f'{key}_lateness_p99_ms'] = _percentile(lateness, 99)
+    results[f'{key}_lateness_max_ms'] = max(lateness)
+    results[f'{key}_drift_ms_per_minute'] = abs(actual - expected) / actual * 60000 if actual else 0
+
+
+def bench_stalls(results, targets, duration):
+    """Samples flagged as monitor stalls while probing many answering loopback targets"""
+    tcp = TcpStandIn([f'127.0.{index // 250}.{index % 250 + 1}' for index in range(targets)])
+    api = ping.API(None, targets=tcp.addresses)
+    api.engine.prober.ports = (tcp.port,)
+    api.set_interval(500)
+    flags = []
+    api.add_sample_listener(lambda sample: flags.append(sample['monitorStall']))
+    api.start_update_thread()
+    time.sleep(duration)
+    api.stop_updates()
+    api.engine.close()
+    tcp.close()
+    key = f'update_loop_{len(tcp.addresses)}t'
+    results[f'{key}_stalled_samples'] = sum(flags)
+    results[f'{key}_samples'] = len(flags)
+    # The round's cost grows with the target count; only delays to the probes themselves are stalls
+    return [f"{sum(flags)} of {len(flags)} samples over {len(tcp.addresses)} targets flagged as stalls"] if any(flags) else []
+
+
+def bench_scheduler(results, interval_ms, ticks):
+    """Lateness of the bare scheduler with no work per tick"""
+    scheduler = DeadlineScheduler(interval_ms)
+    lateness = [scheduler.wait_next().lateness_ms for _ in range(ticks)]
+    key = f'scheduler_{int(interval_ms)}ms'
+    results[f'{key}_lateness_p50_ms'] = _percentile(lateness, 50)
+    results[f'{key}_lateness_p99_ms'] = _percentile(lateness, 99)
+
+
+def bench_stats(results, samples):
+    """Throughput of the statistics path"""
+    import random
+    rng = random.Random(42)
+    values = [None if rng.random() < 0.01 else rng.lognormvariate(3, 0.4) for _ in range(samples)]
+    stats = StreamingStats()
+    start = time.perf_counter()
+    for index, value in enumerate(values):
+        stats.add(value, timestamp=index * 0.01)
+    results['stats_add_samples_per_second'] = samples / (time.perf_counter() - start)
+    start = time.perf_counter()
+    for _ in range(1000):
+        stats.snapshot()
+    results['stats_snapshot_us'] = (time.perf_counter() - start) / 1000 * 1e6
+
+
+def bench_ui_update(results, samples):
+    """
+    Cost of building the JS command per sample, one call per sample versus batched.
+
+    Only serialization and BatchChannel queuing are measured: evaluate_js
+    needs a live webview, so the bridge dispatch and the page's own work
+    are not included.
+    """
+    tcp = TcpStandIn()
+    api = ping.API(None, targets=['127.0.0.1'])
+    api.engine.prober.ports = (tcp.port,)
+    sample = api.ping_host()
+    sample.update(tickLateness=0.1, skippedTicks=0, timestamp=time.time() * 1000)
+    tcp.close()
+    api.engine.close()
+
+    sent = []
+    start = time.perf_counter()
+    for _ in range(samples):
+        sent.append(f'if(typeof window.updateMetrics === "function") {{ window.updateMetrics({json.dumps(sample)}); }}')
+    results['ui_serialize_per_sample_us'] = (time.perf_counter() - start) / samples * 1e6
+    results['ui_serialize_per_sample_bytes'] = sum(map(len, sent)) / samples
+
+    sent = []
+    channel = BatchChannel(lambda payload: sent.append(f'if(typeof window.receiveBatch === "function") {{ window.receiveBatch({payload}); }}'))
+    start = time.perf_counter()
+    for index in range(samples):
+        channel.publish(sample)
+        # Ten samples per batch, roughly a 10 ms interval with a 100 ms UI frame budget
+        if index % 10 == 9:
+            channel.flush()
+    channel.flush()
+    results['ui_serialize_batched_us'] = (time.perf_counter() - start) / samples * 1e6
+    results['ui_serialize_batched_bytes'] = sum(map(len, sent)) / samples
+
+
+def bench_sharded(results, targets, rounds):
+    """Round time over many refused loopback targets, in-process versus sharded across workers"""
+    hosts = [f'127.0.{index // 250}.{index % 250 + 2}' for index in range(targets)]
+    for workers in (1, 2, 4):
+        if workers == 1:
+            engine = ProbeEngine(hosts)
+        else:
+            engine = ShardedProbeEngine(hosts, workers)
+        try:
+            engine.run_round()  # Warm up connections and worker imports
+            start = time.perf_counter()
+            for _ in range(rounds):
+                engine.run_round()
+            elapsed = time.perf_counter() - start
+        finally:
+            engine.close()
+        results[f'sharded_{workers}w_{targets}t_round_ms'] = elapsed / rounds * 1000
+        results[f'sharded_{workers}w_targets_per_second'] = targets * rounds / elapsed
+
+
+def metadata():
+    try:
+        commit = subprocess.check_output(['git', 'rev-parse', '--short', 'HEAD'], cwd=ROOT,
+                                         stderr=subprocess.DEVNULL).decode().strip()
+    except (OSError, subprocess.CalledProcessError):
+        commit = None
+    return {
+        'commit': commit,
+        'python': platform.python_version(),
+        'platform': platform.platform(),
+        'cpus': os.cpu_count(),
+        'timestamp': time.time(),
+    }
+
+
+def compare(current, baseline, threshold):
+    """Print metrics that moved more than threshold percent; return True if any regressed"""
+    regressed = False
+    for name, value in sorted(current.items()):
+        old = baseline.get(name)
+        if not isinstance(old, (int, float)) or not old:
+            continue
+        change = (value - old) / abs(old) * 100
+        if abs(change) < threshold:
+            continue
+        worse = change < 0 if name.endswith(HIGHER_IS_BETTER) else change > 0
+        regressed |= worse
+        print(f"{'WORSE ' if worse else 'better'} {name}: {old:.3f} -> {value:.3f} ({change:+.1f}%)")
+    return regressed
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--output', help="write results JSON to this file instead of stdout")
+    parser.add_argument('--compare', help="baseline results JSON to compare against")
+    parser.add_argument('--threshold', type=float, default=10.0,
+                        help="percent change reported by --compare (default: %(default)s)")
+    parser.add_argument('--quick', action='store_true', help="fewer iterations, for smoke testing")
+    args = parser.parse_args()
+
+    probes = 200 if args.quick else 2000
+    duration = 2.0 if args.quick else 10.0
+    results = {}
+    bench_probers(results, probes)
+    bench_delay_accuracy(results, probes // 10, delay_ms=20)
+    for interval_ms in (10, 100, 500):
+        bench_scheduler(results, interval_ms, max(5, int(duration * 1000 / interval_ms / 2)))
+        bench_update_loop(results, interval_ms, duration)
+    bench_stats(results, 20000 if args.quick else 200000)
+    bench_ui_update(results, 1000 if args.quick else 10000)
+    bench_sharded(results, 500 if args.quick else 2000, 5 if args.quick else 20)
+    failures = bench_stalls(results, 300, duration * 2)
+
+    report = {'metadata': metadata(), 'results': {name: round(value, 4) for name, value in results.items()}}
+    text = json.dumps(report, indent=2)
+    if args.output:
+        with open(args.output, 'w') as f:
+            f.write(text + '\n')
+    else:
+        print(text)
+
+    for failure in failures:
+        print(f"FAILED {failure}", file=sys.stderr)
+    regressed = False
+    if args.compare:
+        with open(args.compare, 'r') as f:
+            baseline = json.load(f)
+        regressed = compare(report['results'], baseline.get('results', {}), args.threshold)
+    if failures or regressed:
+        sys.exit(1)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,129 @@
+import logging
+import os
+from typing import Dict, Optional
+
+from detector import END
+
+logger = logging.getLogger("NetworkMonitor.cadence")
+
+# Default burst and steady intervals, and probes each target may receive per minute
+DEFAULT_MIN_INTERVAL_MS = float(os.environ.get("NETWORK_MONITOR_MIN_INTERVAL_MS", "100"))
+DEFAULT_MAX_INTERVAL_MS = float(os.environ.get("NETWORK_MONITOR_MAX_INTERVAL_MS", "2000"))
+DEFAULT_BUDGET = float(os.environ.get("NETWORK_MONITOR_PROBE_BUDGET", "120"))
+# Jitter counts as instability above this fraction of the EWMA RTT and JITTER_MIN_MS
+JITTER_RATIO = 0.3
+JITTER_MIN_MS = 5.0
+# Stay at the burst rate this long after the last unstable sample
+BURST_HOLD_SECONDS = 10.0
+# Once settled, lengthen the interval by BACKOFF_FACTOR every BACKOFF_SECONDS
+BACKOFF_SECONDS = 5.0
+BACKOFF_FACTOR = 1.5
+# A throttled cadence is released once the budget has refilled to this fraction
+BUDGET_RELEASE = 0.5
+
+# Reasons reported for an interval change, besides the detector's event kinds
+LOSS = "loss"
+JITTER = "jitter"
+STABLE = "stable"
+BUDGET = "budget"
+
+
+class CadenceController:
+    """
+    Adapts the probe interval to how stable the targets are.
+
+    Loss, high jitter or an active spike/trend event on any target drops
+    the interval to min_interval_ms. After BURST_HOLD_SECONDS without
+    another one it backs off geometrically towards max_interval_ms.
+    budget is how many probes each target may get per minute on average:
+    a token bucket holding one minute's worth pays for bursts, and when it
+    runs dry the interval is held at the rate the budget sustains until
+    the bucket has refilled. 0 disables the budget.
+    """
+
+    def __init__(self, min_interval_ms: float = DEFAULT_MIN_INTERVAL_MS,
+                 max_interval_ms: float = DEFAULT_MAX_INTERVAL_MS, budget: float = DEFAULT_BUDGET):
+        min_interval_ms = float(min_interval_ms)
+        max_interval_ms = float(max_interval_ms)
+        budget = float(budget)
+        if min_interval_ms <= 0 or max_interval_ms < min_interval_ms:
+            raise ValueError("Intervals must satisfy 0 < minimum <= maximum")
+        if budget < 0:
+            raise ValueError("Probe budget cannot be negative")
+        self.min_interval_ms = min_interval_ms
+        self.max_interval_ms = max_interval_ms
+        self.budget = budget
+        # Start steady; the first unstable sample switches to the burst rate
+        self.interval_ms = max_interval_ms
+        self.reason = STABLE
+        self.changes = 0
+        self._desired_ms = max_interval_ms
+        self._tokens = budget
+        self._throttled = False
+        self._last_update: Optional[float] = None
+        self._last_unstable = float('-inf')
+        self._last_backoff = float('-inf')
+
+    def update(self, sample: Dict[str, object], now: float, probes_per_tick: int = 1) -> bool:
+        """Account for one sample taken at monotonic time now; True if the interval changed"""
+        if self._last_update is not None and self.budget:
+            self._tokens = min(self.budget, self._tokens + (now - self._last_update) * self.budget / 60)
+        self._last_update = now
+        self._tokens -= probes_per_tick
+
+        # The monitor's own stalls say nothing about the network
+        signal = None if sample.get('monitorStall') else self._signal(sample)
+        reason = None
+        if signal:
+            self._last_unstable = now
+            if self._desired_ms > self.min_interval_ms:
+                self._desired_ms = self.min_interval_ms
+                reason = signal
+        elif (self._desired_ms < self.max_interval_ms and now - self._last_unstable >= BURST_HOLD_SECONDS
+              and now - self._last_backoff >= BACKOFF_SECONDS):
+            self._desired_ms = min(self.max_interval_ms, self._desired_ms * BACKOFF_FACTOR)
+            self._last_backoff = now
+            reason = STABLE
+
+        interval_ms = self._desired_ms
+        if self.budget:
+            if self._tokens < probes_per_tick:
+                self._throttled = True
+            elif self._tokens >= self.budget * BUDGET_RELEASE:
+                self._throttled = False
+            if self._throttled:
+                # The fastest rate the budget refills at
+                interval_ms = max(interval_ms, 60000 * probes_per_tick / self.budget)
+        if interval_ms == self.interval_ms:
+            return False
+
+        logger.info(f"Probe interval {self.interval_ms:.0f}ms -> {interval_ms:.0f}ms ({reason or BUDGET})")
+        self.interval_ms = interval_ms
+        self.reason = reason or BUDGET
+        self.changes += 1
+        return True
+
+    @staticmethod
+    def _signal(sample: Dict[str, object]) -> Optional[str]:
+        """Why the targets look unstable in this sample, or None"""
+        for event in sample.get('events') or ():
+            if event['state'] != END:
+                return event['kind']
+        for metrics in (sample.get('targets') or {}).values():
+            if metrics.get('packetLoss'):
+                return LOSS
+            ewma = (metrics.get('stats') or {}).get('ewma') or 0
+            if metrics.get('jitter', 0) > max(JITTER_MIN_MS, JITTER_RATIO * ewma):
+                return JITTER
+        return None
+
+    def snapshot(self) -> Dict[str, object]:
+        return {
+            'interval': self.interval_ms,
+            'reason': self.reason,
+            'minInterval': self.min_interval_ms,
+            'maxInterval': self.max_interval_ms,
+            'budget': self.budget,
+            'budgetLeft': round(max(0.0, self._tokens), 1) if self.budget else None,
+            'changes': self.changes,
+        }
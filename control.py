@@ -0,0 +1,327 @@
+import collections
+import errno
+import json
+import logging
+import os
+import selectors
+import socket
+import threading
+from concurrent.futures import ThreadPoolExecutor
+from typing import Callable, Dict, Iterator, Optional
+
+logger = logging.getLogger("NetworkMonitor.control")
+
+# Control socket of the running instance; a second launch connects here instead of probing again
+DEFAULT_CONTROL_PATH = os.environ.get("NETWORK_MONITOR_CONTROL",
+                                      os.path.join(os.path.expanduser("~"), ".network_monitor.sock"))
+# Samples queued per subscriber; a reader that falls further behind loses the oldest
+SUBSCRIBER_BUFFER = 256
+# Longest request line accepted, so a confused client cannot grow a buffer without bound
+MAX_REQUEST = 64 * 1024
+# API commands of different connections that may run at the same time
+COMMAND_WORKERS = 4
+# Not forwarded to the API: they change the connection itself
+SUBSCRIBE = "subscribe"
+UNSUBSCRIBE = "unsubscribe"
+
+
+def available() -> bool:
+    """Unix-domain sockets exist on Linux and macOS, not in Windows builds of Python"""
+    return hasattr(socket, 'AF_UNIX')
+
+
+def connect(path: str = DEFAULT_CONTROL_PATH, timeout: float = 1.0) -> Optional[socket.socket]:
+    """Connected socket to the running instance, or None if none is listening at path"""
+    if not available():
+        return None
+    sock = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+    sock.settimeout(timeout)
+    try:
+        sock.connect(path)
+    except OSError:
+        sock.close()
+        return None
+    return sock
+
+
+class ControlClient:
+    """Blocking client for a ControlServer: one request at a time, or a sample stream"""
+
+    def __init__(self, sock: socket.socket):
+        self.sock = sock
+        self._reader = sock.makefile('rb')
+
+    def request(self, method: str, *args) -> Dict[str, object]:
+        """Call an API method of the running instance and return its decoded reply"""
+        self.sock.sendall(json.dumps({'method': method, 'args': list(args)}).encode('utf-8') + b'\n')
+        line = self._reader.readline()
+        if not line:
+            raise ConnectionError("Control connection closed")
+        return json.loads(line)
+
+    def subscribe(self) -> Iterator[Dict[str, object]]:
+        """Yield every sample the running instance takes, until it closes the connection"""
+        reply = self.request(SUBSCRIBE)
+        if not reply.get('success'):
+            raise ConnectionError(reply.get('error', "Subscription refused"))
+        self.sock.settimeout(None)
+        for line in self._reader:
+            message = json.loads(line)
+            if 'dropped' in message:
+                logger.warning(f"Fell behind the running instance, {message['dropped']} sample(s) dropped")
+                continue
+            yield message
+
+    def close(self):
+        self._reader.close()
+        self.sock.close()
+
+
+class _Client:
+    __slots__ = ('sock', 'inbox', 'requests', 'busy', 'replies', 'samples', 'sending', 'subscribed', 'dropped')
+
+    def __init__(self, sock: socket.socket):
+        self.sock = sock
+        self.inbox = bytearray()
+        self.requests = collections.deque()  # Request lines waiting for the previous one to finish
+        self.busy = False  # One of its requests is running on a worker
+        self.replies = collections.deque()
+        self.samples = collections.deque(maxlen=SUBSCRIBER_BUFFER)
+        self.sending = b''
+        self.subscribed = False
+        self.dropped = 0
+
+
+class ControlServer:
+    """
+    Line-delimited JSON control socket for the running instance.
+
+    Each request is {"method": name, "args": [...]} and gets the API
+    method's JSON reply on one line. After "subscribe" the connection also
+    receives every sample as a JSON line. publish() serializes a sample
+    once and only appends it to each subscriber's bounded queue; a single
+    selector thread does all socket I/O, so a slow reader loses its oldest
+    samples (announced with a {"dropped": n} line) instead of holding up
+    the update loop. API commands run on worker threads, one at a time per
+    connection so replies keep the order of the requests, and a command
+    that probes or waits for the ping lock never pauses the stream.
+    """
+
+    def __init__(self, commands: Dict[str, Callable[..., str]], path: str = DEFAULT_CONTROL_PATH):
+        self._remove_stale(path)
+        self.commands = commands
+        self.path = path
+        self.subscribers = 0
+        self._clients: Dict[int, _Client] = {}
+        self._lock = threading.Lock()
+        self._selector = selectors.DefaultSelector()
+        self._wake_r, self._wake_w = socket.socketpair()
+        self._wake_r.setblocking(False)
+        self._wake_w.setblocking(False)
+        self._listener = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+        self._listener.bind(path)
+        # Owner only: the socket can change what is probed. Nobody can connect before listen()
+        os.chmod(path, 0o600)
+        self._listener.listen()
+        self._listener.setblocking(False)
+        self._selector.register(self._listener, selectors.EVENT_READ)
+        self._selector.register(self._wake_r, selectors.EVENT_READ)
+        self._running = False
+        self._thread: Optional[threading.Thread] = None
+        self._commands = ThreadPoolExecutor(max_workers=COMMAND_WORKERS, thread_name_prefix="ControlCommand")
+
+    @staticmethod
+    def _remove_stale(path: str):
+        """Unlink a socket left behind by a crashed instance; raise if one is still listening"""
+        probe = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+        try:
+            probe.connect(path)
+        except OSError as e:
+            if e.errno == errno.ECONNREFUSED:
+                os.unlink(path)
+            # Anything else (usually no such file) is left for bind to report
+            return
+        finally:
+            probe.close()
+        raise OSError(errno.EADDRINUSE, "Another instance is serving this control socket", path)
+
+    def start(self):
+        self._running = True
+        self._thread = threading.Thread(target=self._serve, name="ControlServer", daemon=True)
+        self._thread.start()
+        logger.info(f"Control socket listening on {self.path}")
+
+    def stop(self):
+        self._running = False
+        self._wake()
+        if self._thread is not None:
+            self._thread.join(timeout=1.0)
+        self._commands.shutdown(wait=False)
+        for client in list(self._clients.values()):
+            self._drop(client)
+        self._selector.close()
+        self._listener.close()
+        self._wake_r.close()
+        self._wake_w.close()
+        try:
+            os.unlink(self.path)
+        except OSError:
+            pass
+
+    def publish(self, sample: Dict[str, object]):
+        """Queue a sample for every subscriber; never blocks on a client"""
+        if not self.subscribers:
+            return
+        line = json.dumps(sample, separators=(',', ':')).encode('utf-8') + b'\n'
+        with self._lock:
+            for client in self._clients.values():
+                if client.subscribed:
+                    if len(client.samples) == SUBSCRIBER_BUFFER:
+                        client.dropped += 1
+                    client.samples.append(line)
+        self._wake()
+
+    def _wake(self):
+        try:
+            self._wake_w.send(b'\0')
+        except (BlockingIOError, OSError):
+            pass  # A wake-up is already pending, or the server is stopping
+
+    def _serve(self):
+        while self._running:
+            for key, events in self._selector.select():
+                if key.fileobj is self._listener:
+                    self._accept()
+                elif key.fileobj is self._wake_r:
+                    try:
+                        while self._wake_r.recv(4096):
+                            pass
+                    except BlockingIOError:
+                        pass
+                else:
+                    client = key.data
+                    if events & selectors.EVENT_READ:
+                        self._read(client)
+            for client in list(self._clients.values()):
+                self._next_request(client)
+                self._write(client)
+
+    def _accept(self):
+        try:
+            sock, _ = self._listener.accept()
+        except BlockingIOError:
+            return
+        sock.setblocking(False)
+        client = _Client(sock)
+        with self._lock:
+            self._clients[sock.fileno()] = client
+        self._selector.register(sock, selectors.EVENT_READ, client)
+        logger.info(f"Control client connected ({len(self._clients)} open)")
+
+    def _read(self, client: _Client):
+        try:
+            data = client.sock.recv(65536)
+        except BlockingIOError:
+            return
+        except OSError:
+            data = b''
+        if not data:
+            self._drop(client)
+            return
+        client.inbox += data
+        while b'\n' in client.inbox:
+            line, _, rest = bytes(client.inbox).partition(b'\n')
+            client.inbox = bytearray(rest)
+            if line.strip():
+                client.requests.append(line)
+        if len(client.inbox) > MAX_REQUEST:
+            logger.warning("Dropping control client: request too long")
+            self._drop(client)
+
+    def _next_request(self, client: _Client):
+        """Start the client's queued requests, unless one of them is still running"""
+        while client.requests and not client.busy:
+            line = client.requests.popleft()
+            try:
+                command = json.loads(line).get('method') in self.commands
+            except (ValueError, AttributeError):
+                command = False
+            if command:
+                client.busy = True
+                self._commands.submit(self._run_command, client, line)
+            else:
+                # Subscriptions and errors are answered here, without waiting for a worker
+                reply = self._handle(client, line)
+                with self._lock:
+                    client.replies.append(reply)
+
+    def _run_command(self, client: _Client, line: bytes):
+        """Worker thread: run one API command and hand its reply to the selector thread"""
+        reply = self._handle(client, line)
+        with self._lock:
+            client.replies.append(reply)
+            client.busy = False
+        self._wake()
+
+    def _handle(self, client: _Client, line: bytes) -> bytes:
+        """Run one request and return its reply line"""
+        try:
+            request = json.loads(line)
+            method = request['method']
+            args = request.get('args') or []
+            if method == SUBSCRIBE or method == UNSUBSCRIBE:
+                with self._lock:
+                    if client.subscribed != (method == SUBSCRIBE):
+                        client.subscribed = method == SUBSCRIBE
+                        self.subscribers += 1 if client.subscribed else -1
+                reply = json.dumps({"success": True, "subscribed": client.subscribed})
+            elif method in self.commands:
+                logger.debug("Control request: %s %s", method, args)
+                reply = self.commands[method](*args)
+            else:
+                reply = json.dumps({"success": False, "error": f"Unknown method '{method}'",
+                                    "methods": sorted(self.commands) + [SUBSCRIBE, UNSUBSCRIBE]})
+        except Exception as e:
+            # Malformed JSON, missing method or bad arguments
+            reply = json.dumps({"success": False, "error": str(e) or type(e).__name__})
+        return reply.encode('utf-8') + b'\n'
+
+    def _write(self, client: _Client):
+        if not client.sending:
+            with self._lock:
+                if client.replies or client.samples or client.dropped:
+                    parts = list(client.replies)
+                    client.replies.clear()
+                    if client.dropped:
+                        parts.append(json.dumps({"dropped": client.dropped}).encode('utf-8') + b'\n')
+                        client.dropped = 0
+                    parts.extend(client.samples)
+                    client.samples.clear()
+                    client.sending = b''.join(parts)
+        if not client.sending:
+            return
+        try:
+            sent = client.sock.send(client.sending)
+        except BlockingIOError:
+            sent = 0
+        except OSError:
+            self._drop(client)
+            return
+        client.sending = client.sending[sent:]
+        # Only ask for writability while something is stuck in the socket buffer
+        wanted = selectors.EVENT_READ | (selectors.EVENT_WRITE if client.sending else 0)
+        if self._selector.get_key(client.sock).events != wanted:
+            self._selector.modify(client.sock, wanted, client)
+
+    def _drop(self, client: _Client):
+        with self._lock:
+            if self._clients.pop(client.sock.fileno(), None) is None:
+                return
+            if client.subscribed:
+                self.subscribers -= 1
+        try:
+            self._selector.unregister(client.sock)
+        except (KeyError, ValueError):
+            pass
+        client.sock.close()
+        logger.info(f"Control client disconnected ({len(self._clients)} open)")
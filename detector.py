@@ -0,0 +1,168 @@
+import itertools
+import math
+from typing import Dict, List, Optional
+
+# Event kinds and the states an event goes through
+SPIKE = "spike"  # Short excursion well above the baseline
+TREND = "trend"  # Sustained increase found by the CUSUM change-point test
+START = "start"
+UPDATE = "update"
+END = "end"
+
+WARMUP_SAMPLES = 10
+# Baseline EWMA weight per sample; about the last 20 normal samples dominate
+BASELINE_ALPHA = 0.05
+# A spike is this many deviations above the baseline, and at least
+# SPIKE_MIN_RATIO of the baseline and SPIKE_MIN_MS above it
+SPIKE_SIGMAS = 6.0
+SPIKE_MIN_RATIO = 0.8
+SPIKE_MIN_MS = 15.0
+# Peak growth that is worth an update event for an active spike
+SPIKE_UPDATE_RATIO = 1.1
+# CUSUM slack and decision threshold, in deviations
+CUSUM_SLACK = 1.0
+CUSUM_THRESHOLD = 8.0
+# Per-sample CUSUM increments are clipped so a lone spike cannot raise a trend
+CUSUM_CLIP = 3.0
+# A trend longer than this is taken as the new normal and the baseline moves to it
+TREND_ADAPT_SECONDS = 60.0
+# Floor for the deviation estimate, so a very steady target is not over-sensitive
+MIN_DEVIATION_MS = 1.0
+MIN_DEVIATION_RATIO = 0.05
+
+_event_ids = itertools.count(1)
+
+
+class _Event:
+    __slots__ = ('id', 'kind', 'start', 'baseline', 'peak', 'peak_time', 'last', 'total', 'count', 'reported_peak')
+
+    def __init__(self, kind: str, start: float, baseline: float, value: float):
+        self.id = next(_event_ids)
+        self.kind = kind
+        self.start = start
+        self.baseline = baseline
+        self.peak = value
+        self.peak_time = start
+        self.last = start
+        self.total = 0.0
+        self.count = 0
+        self.reported_peak = value
+
+    def add(self, timestamp: float, value: float):
+        self.last = timestamp
+        self.total += value
+        self.count += 1
+        if value > self.peak:
+            self.peak = value
+            self.peak_time = timestamp
+
+
+class EventDetector:
+    """
+    Streaming spike and change-point detector for one target, O(1) per sample.
+
+    The baseline is an EWMA of the RTT and of its absolute deviation, fed
+    only with samples outside events so a spike does not drag it up. Spikes
+    are samples far above the baseline; trends are sustained increases
+    found by a one-sided CUSUM test with clipped increments. A trend that
+    outlasts TREND_ADAPT_SECONDS becomes the new baseline.
+
+    add() returns event dicts: a 'start' when an event begins, an 'update'
+    when a spike's peak grows and an 'end' with the final peak and duration.
+    """
+
+    def __init__(self, target: str):
+        self.target = target
+        self.samples = 0
+        self.mean = 0.0
+        self.deviation = 0.0
+        self.cusum = 0.0
+        self._cusum_start: Optional[float] = None
+        self.spike: Optional[_Event] = None
+        self.trend: Optional[_Event] = None
+
+    def _sigma(self) -> float:
+        return max(self.deviation, MIN_DEVIATION_MS, self.mean * MIN_DEVIATION_RATIO)
+
+    def _spike_threshold(self) -> float:
+        return self.mean + max(SPIKE_SIGMAS * self._sigma(), self.mean * SPIKE_MIN_RATIO, SPIKE_MIN_MS)
+
+    def _update_baseline(self, value: float):
+        if self.samples == 0:
+            self.mean = value
+        else:
+            self.deviation += BASELINE_ALPHA * (abs(value - self.mean) - self.deviation)
+            self.mean += BASELINE_ALPHA * (value - self.mean)
+        self.samples += 1
+
+    def _event(self, event: _Event, state: str, timestamp: float) -> Dict[str, object]:
+        result = {
+            'id': event.id,
+            'kind': event.kind,
+            'state': state,
+            'target': self.target,
+            'start': round(event.start * 1000, 1),
+            'baseline': round(event.baseline, 1),
+            'peak': round(event.peak, 1),
+            'peakTime': round(event.peak_time * 1000, 1),
+            'duration': round((timestamp - event.start) * 1000, 1),
+        }
+        if event.kind == TREND and event.count:
+            result['level'] = round(event.total / event.count, 1)
+        return result
+
+    def add(self, rtt: Optional[float], timestamp: float) -> List[Dict[str, object]]:
+        """Feed one sample (None for a lost probe, which is skipped)"""
+        if rtt is None or math.isnan(rtt):
+            return []
+        if self.samples < WARMUP_SAMPLES:
+            self._update_baseline(rtt)
+            return []
+
+        events = []
+        sigma = self._sigma()
+        spike_threshold = self._spike_threshold()
+
+        # Spikes: start above the threshold, end once back within half of it
+        if self.spike is None:
+            if rtt > spike_threshold:
+                self.spike = _Event(SPIKE, timestamp, self.mean, rtt)
+                self.spike.add(timestamp, rtt)
+                events.append(self._event(self.spike, START, timestamp))
+        else:
+            self.spike.add(timestamp, rtt)
+            if rtt <= (self.mean + spike_threshold) / 2:
+                events.append(self._event(self.spike, END, timestamp))
+                self.spike = None
+            elif self.spike.peak >= self.spike.reported_peak * SPIKE_UPDATE_RATIO:
+                self.spike.reported_peak = self.spike.peak
+                events.append(self._event(self.spike, UPDATE, timestamp))
+
+        # Trends: one-sided CUSUM on increases, each increment clipped
+        increment = min(rtt - self.mean, CUSUM_CLIP * sigma) - CUSUM_SLACK * sigma
+        if self.cusum == 0.0 and increment > 0:
+            self._cusum_start = timestamp
+        # Capped, so the end of a long shift is noticed within a few samples
+        self.cusum = min(max(0.0, self.cusum + increment), 2 * CUSUM_THRESHOLD * sigma)
+
+        if self.trend is None:
+            if self.cusum > CUSUM_THRESHOLD * sigma:
+                self.trend = _Event(TREND, self._cusum_start or timestamp, self.mean, rtt)
+                self.trend.add(timestamp, rtt)
+                events.append(self._event(self.trend, START, timestamp))
+        else:
+            self.trend.add(timestamp, rtt)
+            if self.cusum == 0.0:
+                events.append(self._event(self.trend, END, timestamp))
+                self.trend = None
+            elif timestamp - self.trend.start >= TREND_ADAPT_SECONDS:
+                # The shift has lasted: accept the new level as normal
+                events.append(self._event(self.trend, END, timestamp))
+                self.mean = self.trend.total / self.trend.count
+                self.deviation = max(self.deviation, abs(rtt - self.mean))
+                self.cusum = 0.0
+                self.trend = None
+
+        if self.spike is None and self.trend is None:
+            self._update_baseline(min(rtt, self.mean + CUSUM_CLIP * sigma))
+        return events
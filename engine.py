@@ -0,0 +1,240 @@
+import asyncio
+import logging
+import statistics
+import time
+from typing import Dict, Iterable, List, Optional, Tuple
+
+from detector import EventDetector
+from instrumentation import PROBE_OVERHEAD, Instrumentation
+from probers import DNS, ERROR, TIMEOUT, Prober, ProbeFailed, TcpConnectProber
+from resolver import DnsCache, is_address
+from stats import StreamingStats
+
+logger = logging.getLogger("NetworkMonitor.engine")
+
+
+class TargetState:
+    """Per-target streaming statistics and spike/trend detection"""
+
+    def __init__(self, host: str):
+        self.host = host
+        self.stats = StreamingStats()
+        self.detector = EventDetector(host)
+        self.last_rtt: Optional[float] = None
+        # Hostname targets: which of the name's addresses is probed, moved on after a round with no replies
+        self.literal = is_address(host)
+        self.address_index = 0
+
+    def record(self, rtt: Optional[float], error: Optional[str] = None) -> Dict[str, object]:
+        """Record one probe outcome (None means lost) and return the UI metrics"""
+        self.stats.add(rtt)
+        self.last_rtt = rtt
+        result = {
+            'latency': round(rtt, 1) if rtt is not None else 0,
+            'jitter': round(self.stats.jitter, 1) if rtt is not None else 0,
+            'packetLoss': 0 if rtt is not None else 100,
+            'stats': self.stats.snapshot()
+        }
+        if error:
+            result['error'] = error
+        return result
+
+    def record_train(self, outcomes: List[Tuple[Optional[float], Optional[str]]]) -> Dict[str, object]:
+        """Record one probe train, in send order, and return the UI metrics for the tick"""
+        rtts = []
+        errors: Dict[str, int] = {}
+        for rtt, error in outcomes:
+            self.stats.add(rtt)
+            if rtt is None:
+                errors[error or ERROR] = errors.get(error or ERROR, 0) + 1
+            else:
+                rtts.append(rtt)
+        size = len(outcomes)
+        median = statistics.median(rtts) if rtts else None
+        self.last_rtt = median
+        train = {
+            'size': size,
+            'received': len(rtts),
+            'min': round(min(rtts), 1) if rtts else None,
+            'median': round(median, 1) if rtts else None,
+            'max': round(max(rtts), 1) if rtts else None,
+            # Mean difference between consecutive replies within the train
+            'jitter': round(sum(abs(b - a) for a, b in zip(rtts, rtts[1:])) / (len(rtts) - 1), 1)
+            if len(rtts) > 1 else 0,
+            'rtts': [round(rtt, 3) for rtt in rtts],
+            'errors': errors,
+        }
+        result = {
+            'latency': round(median, 1) if rtts else 0,
+            'jitter': round(self.stats.jitter, 1) if rtts else 0,
+            'packetLoss': round((size - len(rtts)) / size * 100, 1),
+            'stats': self.stats.snapshot(),
+            'train': train,
+        }
+        if not rtts:
+            result['error'] = max(errors, key=errors.get)
+        return result
+
+
+class ProbeEngine:
+    """
+    Probes many targets concurrently from a private asyncio event loop.
+
+    A round fires one non-blocking probe per target, capped by a semaphore,
+    so it takes about as long as the slowest target rather than the sum.
+    With a train size above one, each target gets that many probes per
+    round, spaced train_spacing_ms apart and sharing a single deadline.
+    Hostname targets are resolved through a DnsCache before any probe
+    starts, so lookups never count towards a measured RTT.
+    """
+
+    def __init__(self, targets: Iterable[str], concurrency: int = 64,
+                 prober: Optional[Prober] = None, instruments: Optional[Instrumentation] = None,
+                 train_size: int = 1, train_spacing_ms: float = 0.0, resolver: Optional[DnsCache] = None):
+        self.concurrency = max(1, int(concurrency))
+        self.prober = prober or TcpConnectProber()
+        self.instruments = instruments
+        self.resolver = resolver or DnsCache()
+        self.set_train(train_size, train_spacing_ms)
+        # Median probe call time outside the measured RTT in the last round. The
+        # largest grows with the target count, as concurrent probes queue on the loop
+        self.last_overhead_ms = 0.0
+        self._states: Dict[str, TargetState] = {}
+        self._loop = None
+        self.set_targets(targets)
+
+    @property
+    def targets(self) -> List[str]:
+        return list(self._states)
+
+    def set_targets(self, targets: Iterable[str]):
+        """Replace the target list, keeping history for targets that remain"""
+        states = {}
+        for host in targets:
+            host = host.strip()
+            if host and host not in states:
+                states[host] = self._states.get(host) or TargetState(host)
+        if not states:
+            raise ValueError("At least one target is required")
+        self._states = states
+        # Start resolving new names now, so the first round rarely has to wait
+        for state in states.values():
+            if not state.literal:
+                self.resolver.lookup(state.host)
+
+    def set_prober(self, prober: Prober):
+        """Switch probe backend; takes effect from the next round"""
+        previous, self.prober = self.prober, prober
+        if previous is not prober:
+            previous.close()
+
+    def set_train(self, size: int, spacing_ms: float = 0.0):
+        """Probes per target per round and the gap between their sends; takes effect next round"""
+        size = int(size)
+        spacing_ms = float(spacing_ms)
+        if size < 1:
+            raise ValueError("Train size must be at least 1")
+        if spacing_ms < 0:
+            raise ValueError("Train spacing cannot be negative")
+        self.train_size = size
+        self.train_spacing = spacing_ms / 1000
+
+    def run_round(self) -> Dict[str, Dict[str, object]]:
+        """Probe every target once and return metrics keyed by target"""
+        if self._loop is None or self._loop.is_closed():
+            self._loop = asyncio.new_event_loop()
+        return self._loop.run_until_complete(self.probe_round())
+
+    def _address(self, state: TargetState):
+        """(address, None) to probe, (None, DNS) if the name did not resolve, (None, None) while resolving"""
+        if state.literal:
+            return state.host, None
+        entry = self.resolver.lookup(state.host)
+        if entry is None:
+            return None, None
+        if not entry.addresses:
+            return None, DNS
+        return entry.addresses[state.address_index % len(entry.addresses)], None
+
+    async def probe_round(self) -> Dict[str, Dict[str, object]]:
+        states = list(self._states.values())
+        semaphore = asyncio.Semaphore(self.concurrency)
+        prober = self.prober
+        size, spacing = self.train_size, self.train_spacing
+        overheads = []
+        loop = asyncio.get_running_loop()
+
+        # Cached names cost a dict lookup; only a name seen for the first
+        # time is waited for, at most one probe timeout
+        addresses = [self._address(state) for state in states]
+        resolving = [asyncio.wrap_future(self.resolver.resolve(state.host))
+                     for state, (address, error) in zip(states, addresses) if address is None and error is None]
+        if resolving:
+            await asyncio.wait(resolving, timeout=prober.timeout)
+            addresses = [(address, error) if address or error else self._address(state)
+                         for state, (address, error) in zip(states, addresses)]
+
+        # One deadline for the whole train, so lost probes cost one timeout in
+        # total instead of one each and a round stays about one timeout long
+        deadline = loop.time() + (size - 1) * spacing + prober.timeout
+
+        async def bounded(state, address, offset):
+            if address is None:
+                return None, DNS
+            if offset:
+                await asyncio.sleep(offset)
+            async with semaphore:
+                try:
+                    start = time.perf_counter()
+                    rtt = await asyncio.wait_for(prober.probe(address), max(0.0, deadline - loop.time()))
+                    # Socket setup, teardown and event loop delays the RTT does not include
+                    overheads.append(max(0.0, (time.perf_counter() - start) * 1000 - rtt))
+                    return rtt, None
+                except asyncio.TimeoutError:
+                    return None, TIMEOUT
+                except ProbeFailed as e:
+                    return None, e.reason
+                except Exception as e:
+                    logger.error(f"Probe of {state.host} failed unexpectedly: {e}")
+                    return None, ERROR
+
+        outcomes = await asyncio.gather(*(bounded(state, address, index * spacing)
+                                          for state, (address, _) in zip(states, addresses)
+                                          for index in range(size)))
+        self.last_overhead_ms = statistics.median(overheads) if overheads else 0.0
+        if self.instruments is not None:
+            for overhead in overheads:
+                self.instruments.observe(PROBE_OVERHEAD, overhead)
+
+        results = {}
+        for index, (state, (address, _)) in enumerate(zip(states, addresses)):
+            if size == 1:
+                result = state.record(*outcomes[index])
+            else:
+                result = state.record_train(outcomes[index * size:(index + 1) * size])
+            if not state.literal:
+                entry = self.resolver.lookup(state.host)
+                result['address'] = address
+                result['dnsTime'] = round(entry.duration_ms, 1) if entry is not None else None
+                if address is not None and result['packetLoss'] == 100:
+                    # Try the name's next address (e.g. IPv4 after IPv6) in the next round
+                    state.address_index += 1
+            results[state.host] = result
+        return results
+
+    def detect_events(self, timestamp: float) -> List[Dict[str, object]]:
+        """Feed the last round to each target's detector and return any spike/trend events"""
+        events = []
+        for state in self._states.values():
+            events.extend(state.detector.add(state.last_rtt, timestamp))
+        return events
+
+    def close(self):
+        """Release the prober's sockets and close the private event loop"""
+        self.prober.close()
+        self.resolver.close()
+        if self._loop is not None and not self._loop.is_closed():
+            # Let cancelled background tasks (e.g. reconnects) finish
+            self._loop.run_until_complete(asyncio.sleep(0))
+            self._loop.close()
+        self._loop = None
@@ -0,0 +1,263 @@
+import asyncio
+import ipaddress
+import logging
+import os
+import socket
+import struct
+import sys
+import threading
+import time
+from typing import Dict, List, Optional, Tuple
+
+from probers import ProberUnavailable, address_family
+from resolver import DnsCache, is_address
+from scheduler import DeadlineScheduler
+from stats import StreamingStats
+
+logger = logging.getLogger("NetworkMonitor.hops")
+
+MAX_HOPS = 30
+# How often the whole path is probed
+DEFAULT_PATH_INTERVAL_MS = float(os.environ.get("NETWORK_MONITOR_PATH_INTERVAL_MS", "1000"))
+# traceroute's first port; each TTL uses its own, so replies never mix up
+BASE_PORT = 33434
+PAYLOAD = b'NetworkMonitor hop probe'
+# TTLs probed past the destination's distance, in case the path gets longer
+EXTRA_HOPS = 2
+# Samples kept per hop; enough for the 15 minute window at one round a second
+HOP_CAPACITY = 1024
+
+# Linux values, for Python builds that do not export them
+IP_RECVERR = getattr(socket, 'IP_RECVERR', 11)
+IPV6_RECVERR = getattr(socket, 'IPV6_RECVERR', 25)
+SO_EE_ORIGIN_ICMP = 2
+SO_EE_ORIGIN_ICMP6 = 3
+# struct sock_extended_err; the offending router's sockaddr follows it
+_EXTENDED_ERR = struct.Struct('=IBBBBII')
+
+HAS_RECVERR = sys.platform.startswith('linux') and hasattr(socket, 'MSG_ERRQUEUE')
+
+# (address that answered, RTT in ms, True if it was the destination itself)
+HopReply = Tuple[str, float, bool]
+
+
+def parse_error(ancdata) -> Optional[str]:
+    """Address of the router or host that sent an ICMP error read from MSG_ERRQUEUE"""
+    for level, kind, data in ancdata:
+        if (level, kind) not in ((socket.IPPROTO_IP, IP_RECVERR), (socket.IPPROTO_IPV6, IPV6_RECVERR)):
+            continue
+        _, origin, _, _, _, _, _ = _EXTENDED_ERR.unpack_from(data)
+        if origin not in (SO_EE_ORIGIN_ICMP, SO_EE_ORIGIN_ICMP6):
+            continue  # A local error, such as no route; counts as lost
+        # Time exceeded from a router on the way, or unreachable (normally the
+        # port) from the destination or a router that will not forward further
+        offender = data[_EXTENDED_ERR.size:]
+        if struct.unpack_from('=H', offender)[0] == socket.AF_INET6:
+            return socket.inet_ntop(socket.AF_INET6, offender[8:24])
+        return socket.inet_ntop(socket.AF_INET, offender[4:8])
+    return None
+
+
+class Hop:
+    """Rolling statistics of one TTL along the path"""
+
+    __slots__ = ('ttl', 'stats', 'address', 'addresses', 'last')
+
+    def __init__(self, ttl: int):
+        self.ttl = ttl
+        self.stats = StreamingStats(capacity=HOP_CAPACITY)
+        self.address: Optional[str] = None
+        # Every router seen at this TTL, as load balancing can alternate them
+        self.addresses: Dict[str, int] = {}
+        self.last: Optional[float] = None
+
+    def add(self, reply: Optional[HopReply], timestamp: float):
+        if reply is None:
+            self.stats.add(None, timestamp)
+            self.last = None
+            return
+        address, rtt, _ = reply
+        self.stats.add(rtt, timestamp)
+        self.last = rtt
+        self.address = address
+        self.addresses[address] = self.addresses.get(address, 0) + 1
+
+    def snapshot(self) -> Dict[str, object]:
+        result = {
+            'ttl': self.ttl,
+            'address': self.address,
+            'last': round(self.last, 1) if self.last is not None else None,
+        }
+        if len(self.addresses) > 1:
+            result['addresses'] = sorted(self.addresses, key=self.addresses.get, reverse=True)
+        result.update(self.stats.snapshot())
+        return result
+
+
+class PathMonitor:
+    """
+    Continuous, mtr-style latency and loss for every hop to one target.
+
+    Each round sends one TTL-limited UDP datagram per hop, all at once,
+    on its own socket with IP_RECVERR set, so the routers' ICMP time
+    exceeded replies can be read from the error queue without raw
+    sockets or root. The first TTL that draws a reply from the destination
+    (port unreachable) is the path length; later rounds stop a couple of
+    hops past it. A round takes about as long as the slowest hop, and
+    runs on its own thread and event loop next to the probe loop.
+
+    Many routers rate-limit time exceeded replies, so loss at a middle hop
+    that does not carry on to the later hops is usually not real loss.
+    """
+
+    def __init__(self, target: str, interval_ms: float = DEFAULT_PATH_INTERVAL_MS,
+                 timeout: float = 1.0, max_hops: int = MAX_HOPS):
+        if not HAS_RECVERR:
+            raise ProberUnavailable("Hop probing needs IP_RECVERR, which only Linux has")
+        self.timeout = timeout
+        self.max_hops = max_hops
+        self.scheduler = DeadlineScheduler(interval_ms)
+        self._lock = threading.Lock()
+        self._thread: Optional[threading.Thread] = None
+        self._resolver: Optional[DnsCache] = None
+        self.set_target(target)
+
+    def set_target(self, target: str):
+        """Start over on a new target; hop history does not carry over"""
+        with self._lock:
+            self.target = target
+            self.address: Optional[str] = None
+            self.distance: Optional[int] = None
+            self.max_ttl = self.max_hops
+            self.rounds = 0
+            self._hops: Dict[int, Hop] = {}
+        if not is_address(target) and self._resolver is None:
+            self._resolver = DnsCache(workers=1)
+
+    def start(self):
+        self._thread = threading.Thread(target=self._run, name="PathMonitor", daemon=True)
+        self._thread.start()
+        logger.info(f"Probing the path to {self.target} every {self.scheduler.interval_ms:.0f}ms")
+
+    def stop(self):
+        self.scheduler.stop()
+        if self._thread is not None:
+            self._thread.join(timeout=self.timeout + 1)
+        if self._resolver is not None:
+            self._resolver.close()
+
+    def _run(self):
+        loop = asyncio.new_event_loop()
+        try:
+            while self.scheduler.wait_next() is not None:
+                try:
+                    loop.run_until_complete(self.probe_round())
+                except Exception as e:
+                    logger.error(f"Path probe round to {self.target} failed: {e}")
+        finally:
+            loop.close()
+
+    def _resolve(self, target: str) -> Optional[str]:
+        if is_address(target):
+            return target
+        entry = self._resolver.lookup(target)
+        return entry.addresses[0] if entry is not None and entry.addresses else None
+
+    async def probe_round(self):
+        """Probe every hop once and fold the replies into the hop statistics"""
+        target = self.target
+        address = self._resolve(target)
+        if address is None:
+            return
+        # The form inet_ntop gives replies in, so the destination can be recognised
+        address = ipaddress.ip_address(address).compressed
+        loop = asyncio.get_running_loop()
+        deadline = loop.time() + self.timeout
+        ttls = range(1, self.max_ttl + 1)
+        family = address_family(address)
+        replies = await asyncio.gather(*(self._probe_hop(loop, family, address, ttl, deadline) for ttl in ttls))
+        # Every probe that gets as far as the destination draws a reply from it; the first marks the distance
+        distance = next((ttl for ttl, reply in zip(ttls, replies) if reply is not None and reply[2]), None)
+        now = time.monotonic()
+        with self._lock:
+            if target != self.target:
+                return  # Retargeted while the round was running
+            self.address = address
+            for ttl, reply in zip(ttls, replies):
+                if distance is not None and ttl > distance:
+                    break
+                hop = self._hops.get(ttl)
+                if hop is None:
+                    hop = self._hops[ttl] = Hop(ttl)
+                hop.add(reply, now)
+            if distance is not None:
+                for ttl in [ttl for ttl in self._hops if ttl > distance]:
+                    del self._hops[ttl]
+                if distance != self.distance:
+                    logger.info(f"Path to {target} ({address}) is {distance} hop(s)")
+                self.max_ttl = min(self.max_hops, distance + EXTRA_HOPS)
+            else:
+                # Destination silent (e.g. UDP filtered): keep probing the full range
+                self.max_ttl = self.max_hops
+            self.distance = distance
+            self.rounds += 1
+
+    async def _probe_hop(self, loop, family: int, address: str, ttl: int, deadline: float) -> Optional[HopReply]:
+        s = socket.socket(family, socket.SOCK_DGRAM)
+        s.setblocking(False)
+        try:
+            if family == socket.AF_INET6:
+                s.setsockopt(socket.IPPROTO_IPV6, socket.IPV6_UNICAST_HOPS, ttl)
+                s.setsockopt(socket.IPPROTO_IPV6, IPV6_RECVERR, 1)
+            else:
+                s.setsockopt(socket.IPPROTO_IP, socket.IP_TTL, ttl)
+                s.setsockopt(socket.IPPROTO_IP, IP_RECVERR, 1)
+            s.connect((address, BASE_PORT + ttl))
+            reply = loop.create_future()
+
+            def readable():
+                # Queued errors make the socket readable (EPOLLERR)
+                if reply.done():
+                    return
+                try:
+                    _, ancdata, _, _ = s.recvmsg(512, 1024, socket.MSG_ERRQUEUE)
+                except BlockingIOError:
+                    try:
+                        s.recv(512)  # A service on the port itself answered
+                    except OSError:
+                        return
+                    reply.set_result((time.perf_counter(), address))
+                    return
+                except OSError:
+                    return
+                sender = parse_error(ancdata)
+                if sender is not None:
+                    reply.set_result((time.perf_counter(), sender))
+
+            loop.add_reader(s.fileno(), readable)
+            try:
+                start = time.perf_counter()
+                s.send(PAYLOAD)
+                received, sender = await asyncio.wait_for(reply, max(0.0, deadline - loop.time()))
+            finally:
+                loop.remove_reader(s.fileno())
+            return sender, (received - start) * 1000, sender == address
+        except (asyncio.TimeoutError, OSError):
+            return None
+        finally:
+            s.close()
+
+    def snapshot(self) -> Dict[str, object]:
+        """Per-hop statistics in TTL order, up to the destination or the last hop that answered"""
+        with self._lock:
+            hops: List[Hop] = [self._hops[ttl] for ttl in sorted(self._hops)]
+            answered = [hop.ttl for hop in hops if hop.address is not None]
+            if self.distance is None and answered:
+                hops = [hop for hop in hops if hop.ttl <= answered[-1] + 1]
+            return {
+                'target': self.target,
+                'address': self.address,
+                'distance': self.distance,
+                'rounds': self.rounds,
+                'hops': [hop.snapshot() for hop in hops],
+            }
@@ -0,0 +1,227 @@
+import json
+import logging
+import os
+import sys
+import threading
+import time
+from array import array
+from contextlib import contextmanager
+from typing import Dict, Iterable, Optional
+
+from stats import PERCENTILES, bucket_index, bucket_value
+
+# Internal delays above this many milliseconds mark a sample as taken while
+# the monitor itself was stalled, so its latency may not be the network's
+STALL_THRESHOLD_MS = float(os.environ.get("NETWORK_MONITOR_STALL_MS", "25"))
+
+# Timers recorded by the application
+SCHEDULER_LAG = "scheduler_lag"  # How late the update loop woke up
+PROBE_ROUND = "probe_round"  # Wall time of one probe round over all targets
+PROBE_CPU = "probe_cpu"  # CPU time the probe round spent in this thread
+PROBE_OVERHEAD = "probe_overhead"  # Probe call time outside the measured RTT
+LOCK_WAIT = "lock_wait"  # Waiting for the ping lock
+SERIALIZE = "serialize"  # Encoding a batch for the UI
+BRIDGE = "bridge"  # evaluate_js round trip
+LISTENERS = "listeners"  # Sample listeners (store, metrics, writers)
+
+# Startup phases, in the order a windowed launch passes them
+INTERPRETER = "interpreter"  # The launcher script starts running
+IMPORTS = "imports"  # Module level imports done
+LOGGING = "logging"  # Log file set up
+WINDOW = "window"  # Window created, before the toolkit starts
+BRIDGE_READY = "bridge"  # The page's JS bridge called js_ready
+FIRST_SAMPLE = "first_sample"  # First probe round finished
+FIRST_SHOWN = "first_shown"  # First sample handed to the window
+DASHBOARD = "dashboard"  # Charts and settings initialised in the page
+
+_BUCKETS = bucket_index(10 ** 9) + 1
+
+logger = logging.getLogger("NetworkMonitor.instrumentation")
+
+
+class TimingHistogram:
+    """Count, sum, max and log-bucket histogram of durations in milliseconds"""
+
+    __slots__ = ('count', 'total', 'max', 'last', 'buckets')
+
+    def __init__(self):
+        self.count = 0
+        self.total = 0.0
+        self.max = 0.0
+        self.last = 0.0
+        self.buckets = array('L', bytes(_BUCKETS * array('L').itemsize))
+
+    def observe(self, value_ms: float):
+        self.count += 1
+        self.total += value_ms
+        self.last = value_ms
+        if value_ms > self.max:
+            self.max = value_ms
+        self.buckets[bucket_index(value_ms)] += 1
+
+    def snapshot(self) -> Dict[str, float]:
+        result = {
+            'count': self.count,
+            'mean': round(self.total / self.count, 3) if self.count else None,
+            'max': round(self.max, 3),
+            'last': round(self.last, 3),
+        }
+        pending = list(PERCENTILES)
+        seen = 0
+        for index, bucket_count in enumerate(self.buckets):
+            seen += bucket_count
+            while pending and self.count and seen >= self.count * pending[0] / 100:
+                # The first bucket holds everything below the histogram's resolution
+                value = min(bucket_value(index), self.max) if index else 0.0
+                result[f'p{pending.pop(0)}'] = round(value, 3)
+            if not pending or seen == self.count:
+                break
+        for q in pending:
+            result[f'p{q}'] = None
+        return result
+
+
+class Instrumentation:
+    """
+    The monitor's own timings and counters, kept separate from the network
+    measurements so a spike on the dashboard can be traced to either.
+
+    Every operation is a dict lookup and a few additions under one lock, so
+    it is cheap enough to call from the probe loop on every tick.
+    """
+
+    def __init__(self, stall_threshold_ms: float = STALL_THRESHOLD_MS):
+        self.stall_threshold_ms = stall_threshold_ms
+        self._timers: Dict[str, TimingHistogram] = {}
+        self._counters: Dict[str, int] = {}
+        self._lock = threading.Lock()
+        self.started = time.time()
+
+    def observe(self, name: str, value_ms: float):
+        with self._lock:
+            timer = self._timers.get(name)
+            if timer is None:
+                timer = self._timers[name] = TimingHistogram()
+            timer.observe(value_ms)
+
+    def count(self, name: str, increment: int = 1):
+        with self._lock:
+            self._counters[name] = self._counters.get(name, 0) + increment
+
+    @contextmanager
+    def timer(self, name: str):
+        start = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.observe(name, (time.perf_counter() - start) * 1000)
+
+    def last(self, name: str) -> float:
+        """Most recent value of a timer, 0 if it never ran"""
+        timer = self._timers.get(name)
+        return timer.last if timer else 0.0
+
+    def stall_reason(self, delays: Dict[str, float]) -> Optional[str]:
+        """Name of the largest internal delay above the threshold, or None"""
+        name, value = max(delays.items(), key=lambda item: item[1], default=(None, 0))
+        return name if value > self.stall_threshold_ms else None
+
+    def reset(self):
+        with self._lock:
+            self._timers.clear()
+            self._counters.clear()
+            self.started = time.time()
+
+    def snapshot(self) -> Dict[str, object]:
+        with self._lock:
+            return {
+                'since': self.started,
+                'stallThresholdMs': self.stall_threshold_ms,
+                'timers': {name: timer.snapshot() for name, timer in self._timers.items()},
+                'counters': dict(self._counters),
+            }
+
+
+def process_start_time(pid: Optional[int] = None) -> Optional[float]:
+    """Epoch time the process (default: this one) was created, or None where that cannot be read"""
+    pid = pid or os.getpid()
+    try:
+        if sys.platform == 'win32':
+            import ctypes
+            from ctypes import wintypes
+            PROCESS_QUERY_LIMITED_INFORMATION = 0x1000
+            kernel32 = ctypes.windll.kernel32
+            handle = kernel32.OpenProcess(PROCESS_QUERY_LIMITED_INFORMATION, False, pid)
+            if not handle:
+                return None
+            try:
+                times = [wintypes.FILETIME() for _ in range(4)]
+                if not kernel32.GetProcessTimes(handle, *(ctypes.byref(t) for t in times)):
+                    return None
+            finally:
+                kernel32.CloseHandle(handle)
+            created = (times[0].dwHighDateTime << 32) | times[0].dwLowDateTime
+            # FILETIME counts 100ns steps from 1601
+            return created / 10 ** 7 - 11644473600
+        with open(f'/proc/{pid}/stat') as f:
+            # Field 22, after the parenthesised command name, is the start in clock ticks since boot
+            ticks = int(f.read().rsplit(')', 1)[1].split()[19])
+        # /proc/stat's btime is whole seconds; the boot clock gives the age precisely
+        age = time.clock_gettime(time.CLOCK_BOOTTIME) - ticks / os.sysconf('SC_CLK_TCK')
+        return time.time() - age
+    except (OSError, ValueError, IndexError, AttributeError):
+        return None
+
+
+class StartupTimer:
+    """
+    Wall clock phases of one launch, in milliseconds since the process started.
+
+    Each phase keeps its first mark. Once every phase in `until` is marked,
+    the report is logged and appended to path as one JSON line; finish()
+    writes whatever was reached if the launch ends before that.
+    """
+
+    def __init__(self, started: float, path: Optional[str] = None):
+        self.started = started
+        self.path = path
+        self.phases: Dict[str, float] = {}
+        self.details: Dict[str, object] = {}
+        self.until = set()
+        self._written = False
+        self._lock = threading.Lock()
+
+    def mark(self, phase: str, at: Optional[float] = None):
+        if phase in self.phases:
+            return
+        with self._lock:
+            self.phases.setdefault(phase, round(((at or time.time()) - self.started) * 1000, 1))
+            complete = not self._written and self.until and self.until.issubset(self.phases)
+        if complete:
+            self.finish()
+
+    def expect(self, phases: Iterable[str], **details):
+        """Write the report once these phases are marked, with details such as the launch mode"""
+        self.until = set(phases)
+        self.details.update(details)
+
+    def report(self) -> Dict[str, object]:
+        report = {'started': round(self.started, 3)}
+        report.update(self.details)
+        report['phases'] = dict(sorted(self.phases.items(), key=lambda item: item[1]))
+        return report
+
+    def finish(self):
+        with self._lock:
+            if self._written or not self.until:
+                return
+            self._written = True
+        report = self.report()
+        logger.info("Startup: " + ", ".join(f"{phase} {ms:.0f}ms" for phase, ms in report['phases'].items()))
+        if not self.path:
+            return
+        try:
+            with open(self.path, 'a') as f:
+                f.write(json.dumps(report) + '\n')
+        except OSError as e:
+            logger.error(f"Could not write startup report to {self.path}: {e}")
@@ -0,0 +1,171 @@
+import atexit
+import glob
+import gzip
+import logging
+import logging.handlers
+import os
+import queue
+import shutil
+import sys
+import time
+from typing import Optional
+
+LOG_FORMAT = '%(asctime)s - %(name)s - %(levelname)s - %(message)s'
+LOG_FILE_NAME = "network_monitor.log"
+
+# Rotation and retention, overridable through the environment
+DEFAULT_LEVEL = os.environ.get("NETWORK_MONITOR_LOG_LEVEL", "INFO")
+MAX_BYTES = int(os.environ.get("NETWORK_MONITOR_LOG_MAX_BYTES", str(5 * 1024 * 1024)))
+MAX_AGE_SECONDS = float(os.environ.get("NETWORK_MONITOR_LOG_MAX_AGE_HOURS", "24")) * 3600
+BACKUP_COUNT = int(os.environ.get("NETWORK_MONITOR_LOG_BACKUPS", "5"))
+RETENTION_SECONDS = float(os.environ.get("NETWORK_MONITOR_LOG_RETENTION_DAYS", "14")) * 86400
+
+_listener: Optional[logging.handlers.QueueListener] = None
+
+
+class CompressingRotatingFileHandler(logging.handlers.RotatingFileHandler):
+    """
+    Rotates when the file exceeds max_bytes or gets older than max_age
+    seconds, and gzips the rotated files. Only backup_count files are kept.
+    """
+
+    def __init__(self, filename: str, max_bytes: int, max_age: float, backup_count: int):
+        super().__init__(filename, maxBytes=max_bytes, backupCount=backup_count, delay=True)
+        self.max_age = max_age
+        try:
+            self._opened_at = os.path.getmtime(filename)
+        except OSError:
+            self._opened_at = time.time()
+        self.namer = lambda name: name + '.gz'
+        self.rotator = self._compress
+
+    @staticmethod
+    def _compress(source: str, dest: str):
+        with open(source, 'rb') as f_in, gzip.open(dest, 'wb') as f_out:
+            shutil.copyfileobj(f_in, f_out)
+        os.remove(source)
+
+    def shouldRollover(self, record) -> bool:
+        if self.max_age and time.time() - self._opened_at >= self.max_age and os.path.exists(self.baseFilename):
+            return True
+        return bool(super().shouldRollover(record))
+
+    def doRollover(self):
+        super().doRollover()
+        self._opened_at = time.time()
+
+
+class RateLimitedLog:
+    """
+    Hot-path logging helper.
+
+    Checks the level before doing anything, so a disabled call costs one
+    method call, and emits at most one record per interval. Arguments are
+    only formatted when a record is actually written.
+    """
+
+    def __init__(self, logger: logging.Logger, interval: float = 1.0):
+        self.logger = logger
+        self.interval = interval
+        self._next = 0.0
+        self.suppressed = 0
+
+    def debug(self, msg: str, *args):
+        if not self.logger.isEnabledFor(logging.DEBUG):
+            return
+        now = time.monotonic()
+        if now < self._next:
+            self.suppressed += 1
+            return
+        self._next = now + self.interval
+        if self.suppressed:
+            msg += " (%d similar suppressed)"
+            args += (self.suppressed,)
+            self.suppressed = 0
+        self.logger.debug(msg, *args)
+
+
+def _remove_expired_logs(log_dir: str, retention: float):
+    """Delete old log files, including the per-start files older versions left behind"""
+    cutoff = time.time() - retention
+    for path in glob.glob(os.path.join(log_dir, "network_monitor*.log*")):
+        try:
+            if os.path.getmtime(path) < cutoff:
+                os.remove(path)
+        except OSError:
+            pass
+
+
+def setup_logging(log_dir: str, level: str = DEFAULT_LEVEL, console: bool = True) -> str:
+    """
+    Route all records through a queue to a background thread that writes
+    the rotating log file (and stderr when there is one). Returns the log
+    file path.
+    """
+    global _listener
+
+    os.makedirs(log_dir, exist_ok=True)
+    _remove_expired_logs(log_dir, RETENTION_SECONDS)
+    log_file = os.path.join(log_dir, LOG_FILE_NAME)
+
+    formatter = logging.Formatter(LOG_FORMAT)
+    handlers = [CompressingRotatingFileHandler(log_file, MAX_BYTES, MAX_AGE_SECONDS, BACKUP_COUNT)]
+    # Windowed PyInstaller builds have no stderr
+    if console and sys.stderr is not None:
+        handlers.append(logging.StreamHandler())
+    for handler in handlers:
+        handler.setFormatter(formatter)
+
+    if _listener is not None:
+        _listener.stop()
+    log_queue = queue.SimpleQueue()
+    _listener = logging.handlers.QueueListener(log_queue, *handlers, respect_handler_level=True)
+    _listener.start()
+
+    root = logging.getLogger()
+    for handler in root.handlers[:]:
+        root.removeHandler(handler)
+    root.addHandler(logging.handlers.QueueHandler(log_queue))
+    set_level(level)
+    atexit.register(shutdown_logging)
+    return log_file
+
+
+def set_level(level: str):
+    """Change the level of the root logger, e.g. from --log-level"""
+    resolved = logging.getLevelName(str(level).upper())
+    if not isinstance(resolved, int):
+        logging.getLogger("NetworkMonitor").warning(f"Unknown log level '{level}', using INFO")
+        resolved = logging.INFO
+    logging.getLogger().setLevel(resolved)
+
+
+class _ForwardHandler(logging.Handler):
+    """Hands records from worker processes to the logger they were created on"""
+
+    def emit(self, record):
+        logging.getLogger(record.name).handle(record)
+
+
+def setup_worker_logging(log_queue, level: int):
+    """Send a worker process's records to the main process, which owns the log file"""
+    root = logging.getLogger()
+    for handler in root.handlers[:]:
+        root.removeHandler(handler)
+    root.addHandler(logging.handlers.QueueHandler(log_queue))
+    root.setLevel(level)
+
+
+def forward_worker_logs(log_queue) -> logging.handlers.QueueListener:
+    """Replay records that worker processes put on log_queue; stop() the returned listener when done"""
+    listener = logging.handlers.QueueListener(log_queue, _ForwardHandler())
+    listener.start()
+    return listener
+
+
+def shutdown_logging():
+    """Flush queued records and stop the writer thread"""
+    global _listener
+    if _listener is not None:
+        _listener.stop()
+        _listener = None
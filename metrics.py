@@ -0,0 +1,189 @@
+import bisect
+import logging
+import threading
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from typing import Dict, Iterable, Optional
+
+from probers import DNS, ERROR, REFUSED, TIMEOUT, UNREACHABLE
+
+logger = logging.getLogger("NetworkMonitor.metrics")
+
+# Upper bounds of the RTT histogram buckets, in seconds
+DEFAULT_BUCKETS = (0.001, 0.0025, 0.005, 0.01, 0.02, 0.03, 0.05, 0.075, 0.1, 0.15, 0.2, 0.3, 0.5, 1.0)
+ERROR_REASONS = (TIMEOUT, REFUSED, UNREACHABLE, DNS, ERROR)
+
+OPENMETRICS_TYPE = 'application/openmetrics-text; version=1.0.0; charset=utf-8'
+PROMETHEUS_TYPE = 'text/plain; version=0.0.4; charset=utf-8'
+
+
+class _TargetMetrics:
+    __slots__ = ('bucket_counts', 'rtt_sum', 'rtt_count', 'probes', 'lost', 'errors', 'jitter', 'last_rtt', 'dns_time')
+
+    def __init__(self, bucket_count: int):
+        # Non-cumulative counts; the last slot is the +Inf overflow
+        self.bucket_counts = [0] * (bucket_count + 1)
+        self.rtt_sum = 0.0
+        self.rtt_count = 0
+        self.probes = 0
+        self.lost = 0
+        self.errors = dict.fromkeys(ERROR_REASONS, 0)
+        self.jitter = 0.0
+        self.last_rtt = None
+        self.dns_time = None
+
+
+def _escape(value: str) -> str:
+    return value.replace('\\', '\\\\').replace('\n', '\\n').replace('"', '\\"')
+
+
+def _number(value: float) -> str:
+    return repr(float(value)) if value != int(value) else f"{int(value)}.0"
+
+
+class MetricsRegistry:
+    """
+    Pre-aggregated per-target probe metrics.
+
+    observe() is called with every sample from the update loop and only bumps
+    counters. render() copies them under a short lock, so a scrape never
+    triggers a probe or holds up the loop.
+    """
+
+    def __init__(self, buckets: Iterable[float] = DEFAULT_BUCKETS):
+        self.buckets = tuple(sorted(float(bucket) for bucket in buckets))
+        if not self.buckets:
+            raise ValueError("At least one histogram bucket is required")
+        self._targets: Dict[str, _TargetMetrics] = {}
+        self._lock = threading.Lock()
+
+    def observe(self, sample: Dict[str, object]):
+        with self._lock:
+            for target, result in (sample.get('targets') or {}).items():
+                metrics = self._targets.get(target)
+                if metrics is None:
+                    metrics = self._targets[target] = _TargetMetrics(len(self.buckets))
+                if result.get('dnsTime') is not None:
+                    metrics.dns_time = float(result['dnsTime']) / 1000
+                train = result.get('train')
+                if train is not None:
+                    # Every probe of a train counts, so loss is a true fraction
+                    metrics.probes += train['size']
+                    metrics.lost += train['size'] - train['received']
+                    for reason, count in train['errors'].items():
+                        metrics.errors[reason] = metrics.errors.get(reason, 0) + count
+                    rtts = [rtt / 1000 for rtt in train['rtts']]
+                else:
+                    metrics.probes += 1
+                    if result.get('packetLoss') == 100:
+                        metrics.lost += 1
+                        reason = result.get('error', ERROR)
+                        metrics.errors[reason] = metrics.errors.get(reason, 0) + 1
+                        continue
+                    rtts = [float(result.get('latency') or 0) / 1000]
+                for rtt in rtts:
+                    metrics.bucket_counts[bisect.bisect_left(self.buckets, rtt)] += 1
+                    metrics.rtt_sum += rtt
+                    metrics.rtt_count += 1
+                    metrics.last_rtt = rtt
+                if rtts:
+                    metrics.jitter = float(result.get('jitter') or 0) / 1000
+
+    def _copy(self):
+        with self._lock:
+            return [(target, metrics.bucket_counts[:], metrics.rtt_sum, metrics.rtt_count,
+                     metrics.probes, metrics.lost, dict(metrics.errors), metrics.jitter, metrics.last_rtt,
+                     metrics.dns_time)
+                    for target, metrics in self._targets.items()]
+
+    def render(self, openmetrics: bool = False) -> str:
+        """Exposition text in the Prometheus 0.0.4 or OpenMetrics 1.0 format"""
+        snapshot = self._copy()
+        lines = []
+
+        def family(name, kind, help_text):
+            lines.append(f"# HELP {name} {help_text}")
+            lines.append(f"# TYPE {name} {kind}")
+
+        family('network_monitor_rtt_seconds', 'histogram', 'Probe round trip time.')
+        for target, counts, rtt_sum, rtt_count, *_ in snapshot:
+            label = f'target="{_escape(target)}"'
+            cumulative = 0
+            for bound, count in zip(self.buckets, counts):
+                cumulative += count
+                lines.append(f'network_monitor_rtt_seconds_bucket{{{label},le="{_number(bound)}"}} {cumulative}')
+            lines.append(f'network_monitor_rtt_seconds_bucket{{{label},le="+Inf"}} {rtt_count}')
+            lines.append(f'network_monitor_rtt_seconds_sum{{{label}}} {rtt_sum}')
+            lines.append(f'network_monitor_rtt_seconds_count{{{label}}} {rtt_count}')
+
+        # OpenMetrics names the counter family without the _total suffix
+        counter_suffix = '' if openmetrics else '_total'
+        family(f'network_monitor_probes{counter_suffix}', 'counter', 'Probes sent.')
+        for target, _, _, _, probes, *_ in snapshot:
+            lines.append(f'network_monitor_probes_total{{target="{_escape(target)}"}} {probes}')
+
+        family(f'network_monitor_probes_lost{counter_suffix}', 'counter', 'Probes without a reply.')
+        for target, _, _, _, _, lost, *_ in snapshot:
+            lines.append(f'network_monitor_probes_lost_total{{target="{_escape(target)}"}} {lost}')
+
+        family(f'network_monitor_probe_errors{counter_suffix}', 'counter', 'Failed probes by reason.')
+        for target, _, _, _, _, _, errors, *_ in snapshot:
+            for reason, count in errors.items():
+                lines.append(f'network_monitor_probe_errors_total{{target="{_escape(target)}",reason="{_escape(reason)}"}} {count}')
+
+        family('network_monitor_jitter_seconds', 'gauge', 'RFC 3550 interarrival jitter of the RTT.')
+        for target, *_, jitter, _, _ in snapshot:
+            lines.append(f'network_monitor_jitter_seconds{{target="{_escape(target)}"}} {jitter}')
+
+        family('network_monitor_last_rtt_seconds', 'gauge', 'Most recent successful round trip time.')
+        for target, *_, last_rtt, _ in snapshot:
+            if last_rtt is not None:
+                lines.append(f'network_monitor_last_rtt_seconds{{target="{_escape(target)}"}} {last_rtt}')
+
+        family('network_monitor_dns_resolution_seconds', 'gauge', 'Duration of the most recent lookup of a hostname target.')
+        for target, *_, dns_time in snapshot:
+            if dns_time is not None:
+                lines.append(f'network_monitor_dns_resolution_seconds{{target="{_escape(target)}"}} {dns_time}')
+
+        if openmetrics:
+            lines.append('# EOF')
+        return '\n'.join(lines) + '\n'
+
+
+class MetricsServer:
+    """Serves a MetricsRegistry on /metrics from a background thread"""
+
+    def __init__(self, registry: MetricsRegistry, port: int, host: str = '127.0.0.1'):
+        self.registry = registry
+
+        class Handler(BaseHTTPRequestHandler):
+            def do_GET(handler):
+                if handler.path.split('?')[0] != '/metrics':
+                    handler.send_error(404)
+                    return
+                openmetrics = 'application/openmetrics-text' in handler.headers.get('Accept', '')
+                body = registry.render(openmetrics).encode('utf-8')
+                handler.send_response(200)
+                handler.send_header('Content-Type', OPENMETRICS_TYPE if openmetrics else PROMETHEUS_TYPE)
+                handler.send_header('Content-Length', str(len(body)))
+                handler.end_headers()
+                handler.wfile.write(body)
+
+            def log_message(handler, format, *args):
+                logger.debug(f"Scrape from {handler.address_string()}: {format % args}")
+
+        self._server = ThreadingHTTPServer((host, port), Handler)
+        self._server.daemon_threads = True
+        self._thread: Optional[threading.Thread] = None
+
+    @property
+    def address(self):
+        return self._server.server_address
+
+    def start(self):
+        self._thread = threading.Thread(target=self._server.serve_forever, name="MetricsServer", daemon=True)
+        self._thread.start()
+        logger.info(f"Metrics endpoint listening on http://{self.address[0]}:{self.address[1]}/metrics")
+
+    def stop(self):
+        self._server.shutdown()
+        self._server.server_close()
@@ -0,0 +1,86 @@
+import csv
+import io
+import json
+import sys
+import time
+from typing import Dict, List, Optional
+
+# Columns written for every target of every sample
+FIELDS = ('timestamp', 'target', 'latency', 'jitter', 'packetLoss', 'dnsTime', 'monitorStall', 'interval', 'intervalReason')
+FORMATS = ('ndjson', 'csv')
+
+
+def sample_records(sample: Dict[str, object]) -> List[Dict[str, object]]:
+    """Flatten one ping_host result into one record per target"""
+    timestamp = sample.get('timestamp')
+    timestamp = round(timestamp / 1000, 3) if timestamp is not None else round(time.time(), 3)
+    targets = sample.get('targets') or {}
+    return [{
+        'timestamp': timestamp,
+        'target': target,
+        'latency': metrics.get('latency'),
+        'jitter': metrics.get('jitter'),
+        'packetLoss': metrics.get('packetLoss'),
+        'dnsTime': metrics.get('dnsTime'),
+        'monitorStall': sample.get('monitorStall', 0),
+        'interval': sample.get('interval'),
+        'intervalReason': sample.get('intervalReason'),
+    } for target, metrics in targets.items()]
+
+
+class SampleWriter:
+    """
+    Streams samples as NDJSON or CSV with buffered writes.
+
+    Lines are collected in memory and written in one call once the buffer
+    holds max_buffered records or flush_interval seconds have passed, so a
+    fast probe loop does not pay for a syscall per sample.
+    """
+
+    def __init__(self, path: Optional[str] = None, fmt: str = 'ndjson',
+                 flush_interval: float = 1.0, max_buffered: int = 512):
+        if fmt not in FORMATS:
+            raise ValueError(f"Unknown output format '{fmt}', expected one of {', '.join(FORMATS)}")
+        self.fmt = fmt
+        self.flush_interval = flush_interval
+        self.max_buffered = max_buffered
+        self._owns_stream = path not in (None, '-')
+        self.stream = open(path, 'a', newline='', buffering=1 << 16) if self._owns_stream else sys.stdout
+        self._lines = []
+        self._last_flush = time.monotonic()
+        self.records_written = 0
+        if fmt == 'csv' and (not self._owns_stream or self.stream.tell() == 0):
+            self._lines.append(','.join(FIELDS) + '\r\n')
+
+    def _format(self, record: Dict[str, object]) -> str:
+        if self.fmt == 'ndjson':
+            return json.dumps(record, separators=(',', ':')) + '\n'
+        line = io.StringIO()
+        csv.writer(line).writerow(record.get(field) for field in FIELDS)
+        return line.getvalue()
+
+    def write(self, sample: Dict[str, object]):
+        records = sample_records(sample)
+        for record in records:
+            self._lines.append(self._format(record))
+        self.records_written += len(records)
+        # Spike/trend events go inline as their own NDJSON lines, told apart
+        # from samples by their 'kind' field; CSV has no room for them
+        if self.fmt == 'ndjson':
+            for event in sample.get('events') or ():
+                self._lines.append(json.dumps(event, separators=(',', ':')) + '\n')
+        now = time.monotonic()
+        if len(self._lines) >= self.max_buffered or now - self._last_flush >= self.flush_interval:
+            self.flush()
+
+    def flush(self):
+        if self._lines:
+            self.stream.write(''.join(self._lines))
+            self._lines = []
+        self.stream.flush()
+        self._last_flush = time.monotonic()
+
+    def close(self):
+        self.flush()
+        if self._owns_stream:
+            self.stream.close()
@@ -1,31 +1,47 @@
-import webview
+import time
+# Taken before anything else is imported, for the startup report
+_launched = time.time()
 import os
 import threading
-import time
-import subprocess
-import platform
 import json
 import sys
-import traceback
 import logging
-import socket
+import gzip
+import hashlib
+import html
 from datetime import datetime
-from typing import List, Dict
-import re
+from typing import Dict
+import argparse
+import multiprocessing
+from engine import ProbeEngine
+from probers import PROBERS, ProberUnavailable, create_prober
+from scheduler import DeadlineScheduler, MIN_INTERVAL_MS
+from hops import DEFAULT_PATH_INTERVAL_MS, PathMonitor
+from cadence import DEFAULT_BUDGET, DEFAULT_MAX_INTERVAL_MS, DEFAULT_MIN_INTERVAL_MS, CadenceController
+from transport import BatchChannel
+from output import FORMATS, SampleWriter
+from store import DEFAULT_MAX_POINTS, TimeSeriesStore, parse_retention
+from control import DEFAULT_CONTROL_PATH, ControlClient, ControlServer, available as control_available, connect as connect_control
+from log_config import RateLimitedLog, set_level, setup_logging
+from instrumentation import (BRIDGE, BRIDGE_READY, DASHBOARD, FIRST_SAMPLE, FIRST_SHOWN, IMPORTS, INTERPRETER,
+                             LISTENERS, LOCK_WAIT, LOGGING, PROBE_CPU, PROBE_OVERHEAD, PROBE_ROUND, SCHEDULER_LAG,
+                             WINDOW, Instrumentation, StartupTimer, process_start_time)
+try:
+    import brotli
+except ImportError:  # Optional; without it assets are precompressed with gzip only
+    brotli = None
 
-# Set up logging
+# Set up logging: records are written from a background thread to a rotating file
 log_dir = os.path.join(os.path.expanduser("~"), "NetworkMonitor_Logs")
-os.makedirs(log_dir, exist_ok=True)
-log_file = os.path.join(log_dir, f"network_monitor_{datetime.now().strftime('%Y%m%d_%H%M%S')}.log")
-
-logging.basicConfig(
-    level=logging.DEBUG,
-    format='%(asctime)s - %(name)s - %(levelname)s - %(message)s',
-    handlers=[
-        logging.FileHandler(log_file),
-        logging.StreamHandler()
-    ]
-)
+# Startup phases, timed from process creation. A onefile build runs in a child of the
+# bootloader that unpacked it to _MEIPASS, so there the parent's start covers the unpacking
+startup = StartupTimer(process_start_time(os.getppid() if hasattr(sys, '_MEIPASS') else None) or _launched,
+                       os.path.join(log_dir, "startup.ndjson"))
+startup.mark(INTERPRETER, _launched)
+startup.mark(IMPORTS)
+# Probe worker processes (shard.py) import this module too; only the main process writes the log
+log_file = setup_logging(log_dir) if multiprocessing.parent_process() is None else None
+startup.mark(LOGGING)
 
 logger = logging.getLogger("NetworkMonitor")
 
@@ -33,6 +49,7 @@ logger = logging.getLogger("NetworkMonitor")
 def global_exception_handler(exctype, value, tb):
     logger.error("Uncaught exception:", exc_info=(exctype, value, tb))
     # Also write to a specific error file that's easy to find
+    import traceback
     with open(os.path.join(log_dir, "CRITICAL_ERROR.txt"), "a") as f:
         f.write(f"\n\n--- {datetime.now()} ---\n")
         f.write("".join(traceback.format_exception(exctype, value, tb)))
@@ -43,7 +60,14 @@ sys.excepthook = global_exception_handler
 
 # Log startup info
 logger.info(f"Application starting up, Python version: {sys.version}")
-logger.info(f"Platform: {platform.platform()}")
+
+def log_platform():
+    # platform.platform() can take a while on Windows, so it is logged off the startup path
+    import platform
+    logger.info(f"Platform: {platform.platform()}")
+
+if multiprocessing.parent_process() is None:
+    threading.Thread(target=log_platform, name="PlatformInfo", daemon=True).start()
 
 # Flag to determine if running as executable
 is_frozen = getattr(sys, 'frozen', False) and hasattr(sys, '_MEIPASS')
@@ -51,6 +75,32 @@ is_frozen = getattr(sys, 'frozen', False) and hasattr(sys, '_MEIPASS')
 # Use a lock file approach instead of mutex for the executable
 lock_file_path = os.path.join(os.path.expanduser("~"), ".network_monitor.lock")
 
+# Targets to monitor, comma separated IPv4/IPv6 addresses or hostnames; the first one drives the dashboard cards
+DEFAULT_TARGETS = os.environ.get("NETWORK_MONITOR_TARGETS", "8.8.8.8")
+# Maximum number of probes in flight at once
+DEFAULT_CONCURRENCY = int(os.environ.get("NETWORK_MONITOR_CONCURRENCY", "64"))
+# How often queued samples are pushed to the UI as one batch
+DEFAULT_FLUSH_INTERVAL_MS = float(os.environ.get("NETWORK_MONITOR_FLUSH_MS", "16"))
+# Sample history directory; set to "off" to keep history in memory only
+DEFAULT_STORE_PATH = os.environ.get("NETWORK_MONITOR_STORE", os.path.join(os.path.expanduser("~"), "NetworkMonitor_Data"))
+# How long each resolution is kept, e.g. "raw=1d,1s=7d"; unlisted ones keep the store's defaults
+DEFAULT_STORE_RETENTION = os.environ.get("NETWORK_MONITOR_STORE_RETENTION", "")
+# Local port for the Prometheus/OpenMetrics endpoint, 0 to disable
+DEFAULT_METRICS_PORT = int(os.environ.get("NETWORK_MONITOR_METRICS_PORT", "0"))
+# Port the window's web assets are served on; 0 picks a free one
+DEFAULT_ASSET_PORT = int(os.environ.get("NETWORK_MONITOR_ASSET_PORT", "0"))
+# Probe backend: tcp (connect handshake), persistent (one long-lived connection), icmp or udp
+DEFAULT_PROBE_METHOD = os.environ.get("NETWORK_MONITOR_PROBE", "tcp")
+# Probes per target per tick and the gap between them; above 1 the loss card shows a true fraction
+DEFAULT_TRAIN_SIZE = int(os.environ.get("NETWORK_MONITOR_TRAIN_SIZE", "1"))
+DEFAULT_TRAIN_SPACING_MS = float(os.environ.get("NETWORK_MONITOR_TRAIN_SPACING_MS", "5"))
+# Adapt the interval to target stability (see cadence.py for its bounds and budget)
+DEFAULT_ADAPTIVE = os.environ.get("NETWORK_MONITOR_ADAPTIVE", "").lower() in ("1", "true", "yes", "on")
+# Probe every hop to the primary target next to the probe loop (Linux only)
+DEFAULT_PATH_PROBING = os.environ.get("NETWORK_MONITOR_PATH", "").lower() in ("1", "true", "yes", "on")
+# Probe worker processes; 0 or 1 probes in-process, more splits the targets across processes
+DEFAULT_WORKERS = int(os.environ.get("NETWORK_MONITOR_WORKERS", "0"))
+
 # IMPORTANT: Global thread reference to prevent garbage collection
 _update_thread = None
 
@@ -111,7 +161,7 @@ def check_single_instance():
 
 def is_process_running(pid):
     """Check if a process with given PID is running"""
-    if platform.system().lower() == "windows":
+    if sys.platform == "win32":
         try:
             # Windows-specific way to check process
             import ctypes
@@ -126,6 +176,7 @@ def is_process_running(pid):
             # Fallback if the above fails
             try:
                 # Alternative method using tasklist
+                import subprocess
                 output = subprocess.check_output(f'tasklist /FI "PID eq {pid}" /NH', shell=True)
                 return str(pid) in str(output)
             except:
@@ -151,148 +202,269 @@ def remove_lock_file():
         logger.error(f"Error removing lock file: {str(e)}")
 
 class API:
-    def __init__(self, window):
+    def __init__(self, window, targets=None, concurrency=DEFAULT_CONCURRENCY,
+                 probe_method=DEFAULT_PROBE_METHOD, train_size=DEFAULT_TRAIN_SIZE,
+                 train_spacing_ms=DEFAULT_TRAIN_SPACING_MS, workers=DEFAULT_WORKERS):
         self.window = window
         # Default to 500 milliseconds for testing, can be adjusted via UI
         self.current_interval = 500 
+        self.scheduler = DeadlineScheduler(self.current_interval)
+        self.cadence = None  # Optional CadenceController that overrides current_interval
         self.update_thread = None
         self.should_run = False  # Start as False until explicitly started
         self.js_is_ready = False
-        self.TARGET_HOST = "8.8.8.8"  # Google DNS server
+        if targets is None:
+            targets = DEFAULT_TARGETS.split(',')
+        self.instruments = Instrumentation()  # The monitor's own timings, see get_instrumentation
+        self._round_delays = {}  # Internal delays of the last probe round, by timer name
+        if workers > 1:
+            # Thousands of targets: probing and statistics run in worker processes
+            from shard import ShardedProbeEngine  # Only needed for large target lists
+            self.engine = ShardedProbeEngine(targets, workers, concurrency=concurrency,
+                                             train_size=train_size, train_spacing_ms=train_spacing_ms)
+        else:
+            self.engine = ProbeEngine(targets, concurrency=concurrency, instruments=self.instruments,
+                                      train_size=train_size, train_spacing_ms=train_spacing_ms)
+        self.probe_method = self.engine.prober.name
+        self.TARGET_HOST = self.engine.targets[0]  # Primary target shown in the cards
         self._exit_flag = threading.Event()
         self._thread_started = False
         self._last_ping_data = None  # Cache for the most recent ping data
+        self._last_ping_json = None  # Serialized form of the cache, built on first request
+        self.channel = BatchChannel(self._push_batch, flush_interval_ms=DEFAULT_FLUSH_INTERVAL_MS,
+                                    instruments=self.instruments)
+        self._sample_listeners = []  # Callbacks receiving every sample, e.g. headless writers
+        self.store = None  # Optional TimeSeriesStore keeping history on disk
+        self.metrics_server = None  # Optional MetricsServer for Prometheus scrapes
+        self.control_server = None  # Optional ControlServer other processes attach to
+        self.path_monitor = None  # Optional PathMonitor probing every hop to the primary target
         self._ping_lock = threading.Lock()  # Add a lock to prevent concurrent pings
-        self._ping_history = []  # Store recent ping times for jitter calculation
-        self._max_history = 5  # Keep last 5 pings for calculations
+        self._probe_log = RateLimitedLog(logger)  # Hot-path debug output, at most once a second
+        self._tick_log = RateLimitedLog(logger)
+        if probe_method != self.probe_method:
+            self.set_probe_method(probe_method)
 
     def get_ping_data(self):
         """Get ping metrics and return as JSON string"""
         # Return cached data instead of triggering a new ping
         if self._last_ping_data:
-            return json.dumps(self._last_ping_data)
+            if self._last_ping_json is None:
+                self._last_ping_json = json.dumps(self._last_ping_data)
+            return self._last_ping_json
         else:
             # Only if we don't have data yet, do a ping
+            self.instruments.count('fallback_pings')
             return json.dumps(self.ping_host())
     
     def set_interval(self, new_interval):
         """Update the ping interval"""
         logger.info(f"Received new interval: {new_interval}ms")
+        try:
+            self.scheduler.set_interval(new_interval)
+        except (TypeError, ValueError) as e:
+            logger.error(f"Rejected interval {new_interval}: {e}")
+            return json.dumps({"success": False, "error": str(e), "minInterval": MIN_INTERVAL_MS})
+        if self.cadence is not None:
+            # A fixed interval chosen by hand replaces the adaptive one
+            self.cadence = None
+            logger.info("Adaptive interval disabled")
         self.current_interval = new_interval
         logger.info(f"Updated interval to: {self.current_interval}ms")
         return json.dumps({"success": True})
     
+    def set_adaptive_interval(self, enabled=True, min_interval=DEFAULT_MIN_INTERVAL_MS,
+                              max_interval=DEFAULT_MAX_INTERVAL_MS, budget=DEFAULT_BUDGET):
+        """Let the probe interval follow target stability between min_interval and max_interval ms"""
+        if not enabled:
+            self.cadence = None
+            logger.info(f"Adaptive interval disabled, staying at {self.current_interval}ms")
+            return json.dumps({"success": True, "adaptive": False})
+        try:
+            if float(min_interval) < MIN_INTERVAL_MS:
+                raise ValueError(f"Interval must be at least {MIN_INTERVAL_MS}ms")
+            cadence = CadenceController(min_interval, max_interval, budget)
+        except (TypeError, ValueError) as e:
+            logger.error(f"Rejected adaptive interval ({min_interval}-{max_interval}ms, budget {budget}): {e}")
+            return json.dumps({"success": False, "error": str(e), "minInterval": MIN_INTERVAL_MS})
+        self.scheduler.set_interval(cadence.interval_ms)
+        self.current_interval = cadence.interval_ms
+        self.cadence = cadence
+        logger.info(f"Adaptive interval {cadence.min_interval_ms:.0f}-{cadence.max_interval_ms:.0f}ms, "
+                    f"budget {cadence.budget:g} probes per target per minute")
+        result = cadence.snapshot()
+        result.update(success=True, adaptive=True)
+        return json.dumps(result)
+    
+    def add_sample_listener(self, callback):
+        """Register a callable that receives every sample dict from the update loop"""
+        self._sample_listeners.append(callback)
+
+    def attach_store(self, store):
+        """Persist every sample to an on-disk TimeSeriesStore"""
+        self.store = store
+        store.start()
+        self.add_sample_listener(store.append)
+
+    def attach_metrics(self, registry, server):
+        """Feed a MetricsRegistry from every sample and serve it until shutdown"""
+        self.add_sample_listener(registry.observe)
+        self.metrics_server = server
+        server.start()
+
+    def attach_control(self, server):
+        """Stream every sample to the control socket's subscribers and serve it until shutdown"""
+        self.add_sample_listener(server.publish)
+        self.control_server = server
+        server.start()
+
+    def get_history(self, range_seconds, target=None, max_points=DEFAULT_MAX_POINTS, resolution=None):
+        """Return stored history for the last range_seconds, using rollups for long ranges"""
+        if not self.store:
+            return json.dumps({"success": False, "error": "History store is disabled"})
+        end = time.time()
+        try:
+            history = self.store.query(target or self.TARGET_HOST, end - float(range_seconds), end,
+                                       resolution=resolution, max_points=int(max_points))
+        except (TypeError, ValueError) as e:
+            logger.error(f"Invalid history request: {e}")
+            return json.dumps({"success": False, "error": str(e)})
+        history['success'] = True
+        return json.dumps(history)
+
+    def set_targets(self, targets):
+        """Replace the monitored targets (list or comma separated string)"""
+        if isinstance(targets, str):
+            targets = targets.split(',')
+        try:
+            with self._ping_lock:
+                self.engine.set_targets(targets)
+                self.TARGET_HOST = self.engine.targets[0]
+        except ValueError as e:
+            logger.error(f"Rejected targets {targets}: {e}")
+            return json.dumps({"success": False, "error": str(e)})
+        logger.info(f"Monitoring {len(self.engine.targets)} target(s), primary: {self.TARGET_HOST}")
+        if self.path_monitor is not None and self.path_monitor.target != self.TARGET_HOST:
+            self.path_monitor.set_target(self.TARGET_HOST)
+        return json.dumps({"success": True})
+
+    def set_path_probing(self, enabled=True, interval_ms=DEFAULT_PATH_INTERVAL_MS):
+        """Probe every hop to the primary target continuously, mtr style"""
+        if self.path_monitor is not None:
+            self.path_monitor.stop()
+            self.path_monitor = None
+        if not enabled:
+            logger.info("Path probing stopped")
+            return json.dumps({"success": True, "enabled": False})
+        try:
+            monitor = PathMonitor(self.TARGET_HOST, interval_ms)
+        except (ProberUnavailable, TypeError, ValueError) as e:
+            logger.error(f"Cannot probe the path to {self.TARGET_HOST}: {e}")
+            return json.dumps({"success": False, "error": str(e)})
+        monitor.start()
+        self.path_monitor = monitor
+        return json.dumps({"success": True, "enabled": True})
+
+    def get_path(self):
+        """Per-hop latency and loss to the primary target"""
+        if self.path_monitor is None:
+            return json.dumps({"success": False, "error": "Path probing is off"})
+        path = self.path_monitor.snapshot()
+        path['success'] = True
+        return json.dumps(path)
+
+    def set_probe_method(self, method):
+        """Switch the probe backend (tcp, persistent, icmp or udp)"""
+        try:
+            prober = create_prober(method)
+        except ProberUnavailable as e:
+            logger.error(f"Cannot use probe method '{method}': {e}")
+            return json.dumps({"success": False, "error": str(e), "method": self.probe_method})
+        try:
+            with self._ping_lock:
+                self.engine.set_prober(prober)
+                self.probe_method = prober.name
+        except ValueError as e:
+            # Sharded engine: a worker could not build the prober
+            logger.error(f"Cannot use probe method '{method}': {e}")
+            return json.dumps({"success": False, "error": str(e), "method": self.probe_method})
+        logger.info(f"Probe method set to: {self.probe_method}")
+        return json.dumps({"success": True, "method": self.probe_method})
+
+    def set_probe_train(self, size, spacing_ms=DEFAULT_TRAIN_SPACING_MS):
+        """Send size probes per target each tick, spacing_ms apart, 1 for a single probe"""
+        try:
+            with self._ping_lock:
+                self.engine.set_train(size, spacing_ms)
+        except (TypeError, ValueError) as e:
+            logger.error(f"Rejected probe train (size {size}, spacing {spacing_ms}ms): {e}")
+            return json.dumps({"success": False, "error": str(e)})
+        spacing_ms = self.engine.train_spacing * 1000
+        logger.info(f"Probe train set to {self.engine.train_size} probe(s), {spacing_ms}ms apart")
+        return json.dumps({"success": True, "size": self.engine.train_size, "spacingMs": spacing_ms})
+
+    def get_probe_methods(self):
+        """List the available probe backends and the active one"""
+        return json.dumps({"methods": list(PROBERS), "current": self.probe_method})
+
+    def get_instrumentation(self, reset=False):
+        """Timings and counters of the monitor itself, optionally starting a new measurement period"""
+        snapshot = self.instruments.snapshot()
+        snapshot['counters']['batches_sent'] = self.channel.batches_sent
+        snapshot['counters']['samples_dropped'] = self.channel.samples_dropped
+        snapshot['success'] = True
+        if reset:
+            self.instruments.reset()
+        return json.dumps(snapshot)
+
     def ping_host(self) -> Dict[str, float]:
-        """Ping the target host using optimized socket method"""
+        """Probe all targets concurrently and return the primary target's metrics"""
+        requested = time.perf_counter()
         with self._ping_lock:
-            logger.debug(f"Using socket ping to {self.TARGET_HOST}")
-            logger.debug(f"PING REQUEST from {traceback.extract_stack()[-2][2]} at {datetime.now().strftime('%H:%M:%S.%f')}")
-            result = self.optimized_socket_ping()
+            started = time.perf_counter()
+            cpu_started = time.thread_time()
+            self._probe_log.debug("Probing %d target(s), primary: %s", len(self.engine.targets), self.TARGET_HOST)
+            results = self.engine.run_round()
+            finished = time.perf_counter()
+            # Only delays that hold up an individual probe; the round's CPU time
+            # grows with the number of targets, so it is recorded but never a stall
+            self._round_delays = {
+                LOCK_WAIT: (started - requested) * 1000,
+                PROBE_OVERHEAD: self.engine.last_overhead_ms,
+            }
+            self.instruments.observe(LOCK_WAIT, self._round_delays[LOCK_WAIT])
+            self.instruments.observe(PROBE_CPU, (time.thread_time() - cpu_started) * 1000)
+            self.instruments.observe(PROBE_ROUND, (finished - started) * 1000)
+            result = dict(results[self.TARGET_HOST])
+            result['targets'] = results
+            result['primary'] = self.TARGET_HOST
+            result['method'] = self.probe_method
             # Cache the result
             self._last_ping_data = result
+            self._last_ping_json = None
             return result
     
     def optimized_socket_ping(self) -> Dict[str, float]:
         """
-        Improved socket ping with better accuracy
+        Single probe round, kept for callers that only want the primary target
         """
-        times = []
-        losses = 0
-        
-        try:
-            # Try a faster approach with a fixed port
-            # Port 443 (HTTPS) is commonly open
-            port = 443
-            s = socket.socket(socket.AF_INET, socket.SOCK_STREAM)
-            s.settimeout(1.0)  # 1 second timeout
-            
-            # Time just the connection
-            start_time = time.time()
-            try:
-                s.connect((self.TARGET_HOST, port))
-                end_time = time.time()
-                s.close()
-                # Calculate round trip time in ms
-                rtt = (end_time - start_time) * 1000
-                times.append(rtt)
-            except:
-                # If first attempt fails, try alternative ports
-                s.close()  # Close the failed socket
-                
-                # Try alternative common ports
-                alternate_ports = [80, 53]
-                for alt_port in alternate_ports:
-                    try:
-                        s = socket.socket(socket.AF_INET, socket.SOCK_STREAM)
-                        s.settimeout(1.0)
-                        start_time = time.time()
-                        s.connect((self.TARGET_HOST, alt_port))
-                        end_time = time.time()
-                        s.close()
-                        rtt = (end_time - start_time) * 1000
-                        times.append(rtt)
-                        break
-                    except:
-                        s.close()
-                
-                if not times:
-                    losses += 1
-            
-        except Exception as e:
-            logger.error(f"Socket ping error: {str(e)}")
-            losses += 1
-        
-        # Calculate metrics
-        if times:
-            latency = times[0]
-            
-            # Add to history for jitter calculation
-            self._ping_history.append(latency)
-            # Keep history at max size
-            if len(self._ping_history) > self._max_history:
-                self._ping_history.pop(0)
-            
-            # Calculate jitter if we have enough history
-            jitter = 0
-            if len(self._ping_history) >= 2:
-                # Calculate variation between consecutive samples
-                variations = [abs(self._ping_history[i] - self._ping_history[i-1]) 
-                             for i in range(1, len(self._ping_history))]
-                jitter = sum(variations) / len(variations)
-            
-            packet_loss = 0
-        else:
-            latency = 0
-            jitter = 0
-            packet_loss = 100
-            # Add a failed ping to history
-            self._ping_history.append(0)
-            if len(self._ping_history) > self._max_history:
-                self._ping_history.pop(0)
-        
-        # Apply calibration based on typical difference between socket and ICMP ping
-        # Typical socket ping is ~15ms higher than ICMP ping for same target
-        calibration_factor = 0.7  # Empirical factor to get closer to ICMP ping values
-        calibrated_latency = latency * calibration_factor if latency > 0 else 0
-        
-        return {
-            'latency': round(calibrated_latency, 1),
-            'jitter': round(jitter, 1),
-            'packetLoss': round(packet_loss, 1)
-        }
+        return self.engine.run_round()[self.TARGET_HOST]
 
     def js_ready(self):
         """Signal that JavaScript is ready"""
         logger.info("JavaScript is ready!")
+        startup.mark(BRIDGE_READY)
         self.js_is_ready = True
         
         # Start update thread if not already running
         if not self._thread_started:
             self.start_update_thread()
+        # Samples taken while the page loaded are delivered now
+        if self.window:
+            self.channel.start()
         
         # Send an initial empty metrics to kickstart the UI without causing a ping
         try:
-            if self.window:
+            if self.window and self._last_ping_data is None:
                 js_command = f'if(typeof window.updateMetrics === "function") {{ window.updateMetrics({json.dumps({"latency": 0, "jitter": 0, "packetLoss": 0})}); }}'
                 self.window.evaluate_js(js_command)
         except Exception as e:
@@ -300,6 +472,13 @@ class API:
         
         return json.dumps({"success": True})
     
+    def mark_startup(self, phase):
+        """Record a startup phase reached in the page"""
+        if phase != DASHBOARD:
+            return json.dumps({"success": False, "error": f"Unknown startup phase '{phase}'"})
+        startup.mark(phase)
+        return json.dumps({"success": True})
+    
     def start_update_thread(self):
         """Start the update thread only once"""
         global _update_thread
@@ -320,57 +499,110 @@ class API:
         _update_thread = self.update_thread
 
     def update_loop(self):
-        """The main ping update loop - completely rewritten for accurate timing"""
+        """The main ping update loop, paced by a monotonic deadline scheduler"""
         thread_id = threading.get_ident()
         logger.info(f"Starting update loop in thread {thread_id}...")
         
-        # Initial delay to give JS time to initialize basic components
-        time.sleep(0.5)
-        
         ping_counter = 0
-        last_log_time = time.time()
-        next_ping_time = time.time()  # Initialize for first run
+        last_log_time = time.monotonic()
         
         while self.should_run and not self._exit_flag.is_set():
             try:
-                current_time = time.time()
+                # Sleeps exactly until the next deadline; wakes early on set_interval or stop
+                tick = self.scheduler.wait_next()
+                if tick is None:
+                    break
                 
-                # Only ping if it's time to do so
-                if current_time >= next_ping_time:
-                    logger.debug(f"PING TIMING: About to ping at {datetime.now().strftime('%H:%M:%S.%f')}, interval: {self.current_interval}ms")
-                    
-                    # Log periodically to reduce log size
-                    if current_time - last_log_time > 10:
-                        logger.debug(f"Thread {thread_id} still running (ping count: {ping_counter})")
-                        last_log_time = current_time
-                    
-                    ping_counter += 1
-                    
-                    # Get ping data
-                    ping_data = self.ping_host()
-                    
-                    # Update the next ping time - ensure even spacing regardless of processing time
-                    next_ping_time = current_time + (self.current_interval / 1000)
-                    
-                    # Check if window exists before trying to use it
-                    if self.window and not self._exit_flag.is_set():
-                        js_command = f'if(typeof window.updateMetrics === "function") {{ window.updateMetrics({json.dumps(ping_data)}); }}'
+                self._tick_log.debug("PING TIMING: tick %d fired %.2fms late (%d skipped), interval: %sms",
+                                     tick.index, tick.lateness_ms, tick.skipped, self.current_interval)
+                
+                # Log periodically to reduce log size
+                if tick.fired - last_log_time > 10:
+                    logger.debug("Thread %s still running (ping count: %d)", thread_id, ping_counter)
+                    last_log_time = tick.fired
+                
+                ping_counter += 1
+                
+                # Get ping data
+                ping_data = self.ping_host()
+                startup.mark(FIRST_SAMPLE)
+                ping_data['tickLateness'] = round(tick.lateness_ms, 2)
+                ping_data['skippedTicks'] = tick.skipped
+                ping_data['timestamp'] = round(time.time() * 1000, 1)
+                self.instruments.observe(SCHEDULER_LAG, tick.lateness_ms)
+                
+                # Flag samples taken while the monitor itself was held up, so
+                # the spikes they may show can be told apart from the network's
+                stall = self.instruments.stall_reason(dict(self._round_delays, **{SCHEDULER_LAG: tick.lateness_ms}))
+                ping_data['monitorStall'] = 1 if stall else 0
+                if stall:
+                    ping_data['stallReason'] = stall
+                    self.instruments.count('stalled_samples')
+                
+                # Stalled samples are kept away from the spike/trend detectors
+                ping_data['events'] = [] if stall else self.engine.detect_events(ping_data['timestamp'] / 1000)
+                for event in ping_data['events']:
+                    if event['state'] == 'end':
+                        logger.info(f"{event['kind'].capitalize()} on {event['target']}: {event['baseline']} -> "
+                                    f"{event['peak']}ms for {event['duration'] / 1000:.1f}s")
+                
+                # Adaptive cadence: burst while unstable, back off once settled
+                cadence = self.cadence
+                if cadence is not None:
+                    if cadence.update(ping_data, tick.fired, self.engine.train_size):
+                        self.scheduler.set_interval(cadence.interval_ms)
+                        self.current_interval = cadence.interval_ms
+                    ping_data['intervalReason'] = cadence.reason
+                ping_data['interval'] = self.current_interval
+                
+                # Queue for the UI; the channel pushes batches from its own thread
+                if self.window:
+                    self.channel.publish(ping_data)
+                with self.instruments.timer(LISTENERS):
+                    for listener in self._sample_listeners:
                         try:
-                            self.window.evaluate_js(js_command)
+                            listener(ping_data)
                         except Exception as e:
-                            # Log and continue, don't crash the thread
-                            logger.error(f"Failed to update UI: {e}")
-                
-                # Sleep for a short time, then check again - this allows for responsive exit
-                # and for interval changes to take effect quickly
-                time.sleep(0.1)
+                            logger.error(f"Sample listener failed: {e}")
                     
             except Exception as e:
                 logger.error(f"Error in update_loop: {str(e)}")
-                time.sleep(1)
+                self._exit_flag.wait(1)
         
         logger.info(f"Update thread {thread_id} exiting...")
 
+    def _push_batch(self, payload):
+        """Deliver one serialized sample batch to the UI"""
+        # Check if window exists before trying to use it
+        if self.window and not self._exit_flag.is_set():
+            with self.instruments.timer(BRIDGE):
+                self.window.evaluate_js(f'if(typeof window.receiveBatch === "function") {{ window.receiveBatch({payload}); }}')
+            startup.mark(FIRST_SHOWN)
+
+    def stop_updates(self):
+        """Stop the update loop, waking it immediately if it is sleeping"""
+        self.should_run = False
+        self._exit_flag.set()
+        self.scheduler.stop()
+        
+        # Wait for the update thread to finish if it exists
+        if self.update_thread and self.update_thread.is_alive():
+            logger.info("Waiting for update thread to finish...")
+            self.update_thread.join(timeout=1.0)  # Wait up to 1 second
+        
+        self.channel.stop()
+        if self.store:
+            self.store.close()
+        if self.metrics_server:
+            self.metrics_server.stop()
+            self.metrics_server = None
+        if self.control_server:
+            self.control_server.stop()
+            self.control_server = None
+        if self.path_monitor:
+            self.path_monitor.stop()
+            self.path_monitor = None
+
     def minimize_window(self):
         """Minimize the window"""
         self.window.minimize()
@@ -391,13 +623,10 @@ class API:
         logger.info("Closing window and stopping threads...")
         
         # Stop thread processing
-        self.should_run = False
-        self._exit_flag.set()
+        self.stop_updates()
         
-        # Wait for the update thread to finish if it exists
-        if self.update_thread and self.update_thread.is_alive():
-            logger.info("Waiting for update thread to finish...")
-            self.update_thread.join(timeout=1.0)  # Wait up to 1 second
+        if not (self.update_thread and self.update_thread.is_alive()):
+            self.engine.close()
         
         # Cleanup lock file
         remove_lock_file()
@@ -406,71 +635,472 @@ class API:
         self.window.destroy()
         return json.dumps({"success": True})
 
-# Custom handler for locating resources
+# API methods other processes may call over the control socket
+CONTROL_COMMANDS = ('get_ping_data', 'set_interval', 'set_adaptive_interval', 'set_targets', 'set_probe_method',
+                    'set_probe_train', 'get_probe_methods', 'get_history', 'get_instrumentation',
+                    'set_path_probing', 'get_path')
+
+class AttachedAPI:
+    """Window API of a second launch: the running instance probes, this window only displays"""
+    
+    def __init__(self, window, sock, path):
+        self.window = window
+        self.path = path
+        self._client = ControlClient(sock)
+        self._client_lock = threading.Lock()  # JS calls arrive on several threads
+        self._stream_thread = None
+        self._exit_flag = threading.Event()
+        self.channel = BatchChannel(self._push_batch, flush_interval_ms=DEFAULT_FLUSH_INTERVAL_MS,
+                                    instruments=Instrumentation())
+    
+    def _request(self, method, *args):
+        try:
+            with self._client_lock:
+                return json.dumps(self._client.request(method, *args))
+        except (OSError, ValueError) as e:
+            logger.error(f"Control request {method} failed: {e}")
+            return json.dumps({"success": False, "error": str(e)})
+    
+    def js_ready(self):
+        """Start streaming the running instance's samples into the window"""
+        logger.info("JavaScript is ready, streaming from the running instance")
+        if self._stream_thread is None:
+            self.channel.start()
+            self._stream_thread = threading.Thread(target=self._stream, name="ControlStream", daemon=True)
+            self._stream_thread.start()
+        return json.dumps({"success": True})
+    
+    def _stream(self):
+        sock = connect_control(self.path)
+        if sock is None:
+            logger.error(f"Running instance at {self.path} is gone")
+            return
+        client = ControlClient(sock)
+        try:
+            for sample in client.subscribe():
+                if self._exit_flag.is_set():
+                    break
+                self.channel.publish(sample)
+        except (OSError, ValueError) as e:
+            logger.error(f"Sample stream from the running instance ended: {e}")
+        finally:
+            client.close()
+    
+    def _push_batch(self, payload):
+        if not self._exit_flag.is_set():
+            self.window.evaluate_js(f'if(typeof window.receiveBatch === "function") {{ window.receiveBatch({payload}); }}')
+    
+    def detach(self):
+        """Stop streaming; the running instance keeps probing"""
+        self._exit_flag.set()
+        self.channel.stop()
+        with self._client_lock:
+            self._client.close()
+    
+    minimize_window = API.minimize_window
+    maximize_window = API.maximize_window
+    restore_window = API.restore_window
+    
+    def close_window(self):
+        """Close this window only"""
+        self.detach()
+        self.window.destroy()
+        return json.dumps({"success": True})
+
+def _forward(method):
+    def forward(self, *args):
+        return self._request(method, *args)
+    forward.__name__ = method
+    forward.__doc__ = f"{method} of the running instance"
+    return forward
+
+for _method in CONTROL_COMMANDS:
+    setattr(AttachedAPI, _method, _forward(_method))
+
+# Content types for the web bundle; anything else is served as application/octet-stream
+CONTENT_TYPES = {
+    '.html': 'text/html; charset=utf-8',
+    '.css': 'text/css; charset=utf-8',
+    '.js': 'application/javascript; charset=utf-8',
+    '.json': 'application/json',
+    '.png': 'image/png',
+    '.jpg': 'image/jpeg',
+    '.jpeg': 'image/jpeg',
+    '.gif': 'image/gif',
+    '.svg': 'image/svg+xml',
+    '.ico': 'image/x-icon',
+}
+
+class Asset:
+    """One preloaded file of the web bundle with its precompressed variants"""
+    
+    __slots__ = ('content_type', 'etag', 'variants')
+    
+    def __init__(self, path, content):
+        self.content_type = CONTENT_TYPES.get(os.path.splitext(path)[1].lower(), 'application/octet-stream')
+        self.etag = hashlib.sha1(content).hexdigest()[:16]
+        # Encoding -> body, identity always present; compressed ones only if they are smaller
+        self.variants = {'identity': content}
+        for encoding, compressed in (('br', brotli.compress(content) if brotli else None),
+                                     ('gzip', gzip.compress(content, compresslevel=9, mtime=0))):
+            if compressed is not None and len(compressed) < len(content) * 0.9:
+                self.variants[encoding] = compressed
+    
+    def select(self, accept_encoding):
+        """Best encoding the client accepts and its body"""
+        accepted = {part.split(';')[0].strip().lower() for part in accept_encoding.split(',')}
+        for encoding in ('br', 'gzip'):
+            if encoding in self.variants and encoding in accepted:
+                return encoding, self.variants[encoding]
+        return 'identity', self.variants['identity']
+
+# Serves the web bundle from memory
 class LocalFileHandler:
     def __init__(self):
         self.base_path = get_base_path()
-        logger.info(f"Static file handler base path: {self.base_path}")
-
-    def serve(self, request):
-        # Extract relative path from the URL
-        path = request.path.lstrip('/')
-        
-        # Map it to a file in our resources directory
-        if not path or path == '/':
-            path = 'web/index.html'
-        elif not path.startswith('web/'):
-            path = f'web/{path}'
+        self.assets = self._preload(os.path.join(self.base_path, 'web'))
+        logger.info(f"Static file handler base path: {self.base_path}, {len(self.assets)} asset(s) in memory")
+    
+    @staticmethod
+    def _preload(web_dir):
+        """Read and compress every file under web_dir once; keys are URL paths"""
+        assets = {}
+        for root, _, files in os.walk(web_dir):
+            for name in files:
+                full_path = os.path.join(root, name)
+                with open(full_path, 'rb') as f:
+                    content = f.read()
+                url_path = '/' + os.path.relpath(full_path, web_dir).replace(os.sep, '/')
+                assets[url_path] = Asset(full_path, content)
+        if '/index.html' in assets:
+            assets['/'] = assets['/index.html']
+        return assets
+    
+    def serve(self, path, headers):
+        """Return (status, headers, body) for a GET of path with the given request headers"""
+        path = path.split('?')[0].split('#')[0]
+        if path.startswith('/web/'):
+            path = path[len('/web'):]
+        asset = self.assets.get(path)
+        if asset is None:
+            logger.error(f"File not found: {path}")
+            body = f"<html><body><h1>404 Not Found</h1><p>The requested file {html.escape(path)} could not be found.</p></body></html>".encode('utf-8')
+            return 404, {'Content-Type': 'text/html; charset=utf-8', 'Content-Length': str(len(body))}, body
         
-        full_path = os.path.join(self.base_path, path)
-        logger.debug(f"Requested: {request.path}, Mapped to: {full_path}")
+        encoding, body = asset.select(headers.get('Accept-Encoding', ''))
+        etag = f'"{asset.etag}-{encoding}"'
+        response_headers = {
+            'Content-Type': asset.content_type,
+            'ETag': etag,
+            # Revalidate every load: the files are not fingerprinted, and a 304 from memory is cheap
+            'Cache-Control': 'no-cache',
+            'Vary': 'Accept-Encoding',
+        }
+        if_none_match = headers.get('If-None-Match', '')
+        if if_none_match.strip() == '*' or etag in (tag.strip().removeprefix('W/') for tag in if_none_match.split(',')):
+            return 304, response_headers, b''
+        if encoding != 'identity':
+            response_headers['Content-Encoding'] = encoding
+        response_headers['Content-Length'] = str(len(body))
+        return 200, response_headers, body
+
+class AssetServer:
+    """Serves a LocalFileHandler over HTTP from a background thread, for the window and remote viewers"""
+    
+    def __init__(self, handler: LocalFileHandler, port: int = 0, host: str = '127.0.0.1'):
+        # http.server pulls in the email and http.client packages; headless runs skip it
+        from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
         
-        if os.path.exists(full_path) and os.path.isfile(full_path):
-            with open(full_path, 'rb') as f:
-                content = f.read()
+        class Handler(BaseHTTPRequestHandler):
+            protocol_version = 'HTTP/1.1'
             
-            content_type = self._get_content_type(full_path)
+            def do_GET(request, send_body=True):
+                status, headers, body = handler.serve(request.path, request.headers)
+                request.send_response(status)
+                for name, value in headers.items():
+                    request.send_header(name, value)
+                request.end_headers()
+                if send_body:
+                    request.wfile.write(body)
             
-            return webview.http.Response(
-                status=200,
-                headers={'Content-Type': content_type},
-                content=content
-            )
-        else:
-            logger.error(f"File not found: {full_path}")
-            return webview.http.Response(
-                status=404,
-                headers={'Content-Type': 'text/html'},
-                content=f"<html><body><h1>404 Not Found</h1><p>The requested file {path} could not be found.</p></body></html>".encode('utf-8')
-            )
-
-    def _get_content_type(self, path):
-        # Keep the content type logic the same
-        extension = os.path.splitext(path)[1].lower()
-        
-        content_types = {
-            '.html': 'text/html',
-            '.css': 'text/css',
-            '.js': 'application/javascript',
-            '.json': 'application/json',
-            '.png': 'image/png',
-            '.jpg': 'image/jpeg',
-            '.jpeg': 'image/jpeg',
-            '.gif': 'image/gif',
-            '.svg': 'image/svg+xml',
-            '.ico': 'image/x-icon',
-        }
+            def do_HEAD(request):
+                request.do_GET(send_body=False)
+            
+            def log_message(request, format, *args):
+                logger.debug(f"Asset request from {request.address_string()}: {format % args}")
         
-        return content_types.get(extension, 'application/octet-stream')
+        self._server = ThreadingHTTPServer((host, port), Handler)
+        self._server.daemon_threads = True
+        self._thread = None
+    
+    @property
+    def url(self):
+        host, port = self._server.server_address[:2]
+        # The window connects locally even when remote viewers are allowed in
+        return f"http://{'127.0.0.1' if host == '0.0.0.0' else host}:{port}/"
+    
+    def start(self):
+        self._thread = threading.Thread(target=self._server.serve_forever, name="AssetServer", daemon=True)
+        self._thread.start()
+        logger.info(f"Serving web assets on {self.url}")
+    
+    def stop(self):
+        self._server.shutdown()
+        self._server.server_close()
 
 # Cleanup function to ensure lock file is removed at exit
 def cleanup():
     logger.info("Performing cleanup before exit")
     remove_lock_file()
 
+def parse_args(argv=None):
+    parser = argparse.ArgumentParser(description="Network Monitor")
+    parser.add_argument('--headless', action='store_true',
+                        help="run without a window and stream samples to stdout or a file")
+    parser.add_argument('--targets', default=DEFAULT_TARGETS,
+                        help="comma separated addresses or hostnames to probe (default: %(default)s)")
+    parser.add_argument('--interval', type=float, default=500,
+                        help="probe interval in milliseconds (default: %(default)s)")
+    parser.add_argument('--probe', default=DEFAULT_PROBE_METHOD, choices=list(PROBERS),
+                        help="probe method (default: %(default)s)")
+    parser.add_argument('--adaptive', action='store_true', default=DEFAULT_ADAPTIVE,
+                        help="adapt the interval to stability between --min-interval and --max-interval")
+    parser.add_argument('--min-interval', type=float, default=DEFAULT_MIN_INTERVAL_MS,
+                        help="adaptive burst interval in milliseconds (default: %(default)s)")
+    parser.add_argument('--max-interval', type=float, default=DEFAULT_MAX_INTERVAL_MS,
+                        help="adaptive steady interval in milliseconds (default: %(default)s)")
+    parser.add_argument('--probe-budget', type=float, default=DEFAULT_BUDGET,
+                        help="adaptive probes per target per minute on average, 0 for no limit (default: %(default)s)")
+    parser.add_argument('--train-size', type=int, default=DEFAULT_TRAIN_SIZE,
+                        help="probes per target per tick, sent concurrently (default: %(default)s)")
+    parser.add_argument('--train-spacing', type=float, default=DEFAULT_TRAIN_SPACING_MS,
+                        help="milliseconds between the probes of a train (default: %(default)s)")
+    parser.add_argument('--workers', type=int, default=DEFAULT_WORKERS,
+                        help="probe worker processes for large target lists, 0 for none (default: %(default)s)")
+    parser.add_argument('--path', action='store_true', default=DEFAULT_PATH_PROBING,
+                        help="also probe every hop to the primary target (Linux)")
+    parser.add_argument('--path-interval', type=float, default=DEFAULT_PATH_INTERVAL_MS,
+                        help="milliseconds between hop probe rounds (default: %(default)s)")
+    parser.add_argument('--format', default='ndjson', choices=FORMATS,
+                        help="headless output format (default: %(default)s)")
+    parser.add_argument('--output', default='-',
+                        help="headless output file, '-' for stdout (default: %(default)s)")
+    parser.add_argument('--store', default=DEFAULT_STORE_PATH,
+                        help="directory for on-disk history, 'off' to disable (default: %(default)s)")
+    parser.add_argument('--store-retention', type=retention_arg, default=DEFAULT_STORE_RETENTION,
+                        help="history kept per resolution, e.g. raw=1d,1s=7d,1m=90d,1h=2y; unlisted ones keep their defaults")
+    parser.add_argument('--metrics-port', type=int, default=DEFAULT_METRICS_PORT,
+                        help="serve Prometheus metrics on this port, 0 to disable (default: %(default)s)")
+    parser.add_argument('--metrics-bind', default='127.0.0.1',
+                        help="address for the metrics endpoint (default: %(default)s)")
+    parser.add_argument('--metrics-buckets', default=None,
+                        help="comma separated RTT histogram bucket bounds in milliseconds")
+    parser.add_argument('--asset-port', type=int, default=DEFAULT_ASSET_PORT,
+                        help="port for the window's web assets, 0 for any free port (default: %(default)s)")
+    parser.add_argument('--asset-bind', default='127.0.0.1',
+                        help="address for the web assets, 0.0.0.0 to let other machines load them (default: %(default)s)")
+    parser.add_argument('--control', default=DEFAULT_CONTROL_PATH,
+                        help="control socket of the running instance, 'off' to disable (default: %(default)s)")
+    parser.add_argument('--standalone', action='store_true',
+                        help="probe in this process even if another instance is running")
+    parser.add_argument('--command', nargs='+', metavar=('METHOD', 'ARG'),
+                        help="call an API method of the running instance, e.g. --command set_interval 1000")
+    parser.add_argument('--log-level', default=None,
+                        help="DEBUG, INFO, WARNING or ERROR (default: NETWORK_MONITOR_LOG_LEVEL or INFO)")
+    parser.add_argument('--count', type=int, default=0,
+                        help="stop after this many samples, 0 to run until interrupted")
+    # PyInstaller and the OS may add arguments of their own to windowed launches
+    args, _ = parser.parse_known_args(argv)
+    return args
+
+def retention_arg(value):
+    """argparse type for --store-retention"""
+    try:
+        return parse_retention(value)
+    except ValueError as e:
+        raise argparse.ArgumentTypeError(str(e))
+
+def attach_store(api, path, retention=None):
+    """Give the API an on-disk history store unless disabled"""
+    if not path or path.lower() == 'off':
+        logger.info("History store disabled")
+        return
+    try:
+        api.attach_store(TimeSeriesStore(path, retention=retention))
+        logger.info(f"History store: {path}")
+    except OSError as e:
+        # History is a convenience; keep monitoring without it
+        logger.error(f"Could not open history store at {path}: {e}")
+
+def attach_metrics(api, args):
+    """Start the metrics endpoint if a port was given"""
+    if not args.metrics_port:
+        return
+    from metrics import MetricsRegistry, MetricsServer
+    try:
+        if args.metrics_buckets:
+            registry = MetricsRegistry(float(bound) / 1000 for bound in args.metrics_buckets.split(','))
+        else:
+            registry = MetricsRegistry()
+        api.attach_metrics(registry, MetricsServer(registry, args.metrics_port, args.metrics_bind))
+    except (OSError, ValueError) as e:
+        logger.error(f"Could not start metrics endpoint on port {args.metrics_port}: {e}")
+
+def attach_control(api, args):
+    """Serve the control socket so later launches attach to this instance"""
+    if args.standalone or args.control.lower() == 'off' or not control_available():
+        return  # A standalone run leaves the socket to the instance already serving it
+    try:
+        api.attach_control(ControlServer({method: getattr(api, method) for method in CONTROL_COMMANDS}, args.control))
+    except OSError as e:
+        logger.error(f"Could not open control socket at {args.control}: {e}")
+
+def find_running_instance(args):
+    """Socket connected to a running instance's control socket, or None"""
+    if args.standalone or args.control.lower() == 'off':
+        return None
+    return connect_control(args.control)
+
+def run_command(args):
+    """Call one API method of the running instance and print its reply"""
+    sock = None if args.control.lower() == 'off' else connect_control(args.control)
+    if sock is None:
+        print(f"No running instance at {args.control}", file=sys.stderr)
+        return 1
+    method, *values = args.command
+    params = []
+    for value in values:
+        try:
+            params.append(json.loads(value))
+        except ValueError:
+            params.append(value)  # Bare strings such as target lists
+    client = ControlClient(sock)
+    try:
+        reply = client.request(method, *params)
+    finally:
+        client.close()
+    print(json.dumps(reply, indent=2))
+    return 0 if reply.get('success', True) else 1
+
+def run_attached(args, sock):
+    """Stream the running instance's samples like a headless run, without probing again"""
+    import signal
+    
+    if hasattr(signal, 'SIGTERM'):
+        signal.signal(signal.SIGTERM, lambda *_: sys.exit(0))
+    client = ControlClient(sock)
+    writer = SampleWriter(args.output, fmt=args.format)
+    samples = 0
+    logger.info(f"Attached to the running instance at {args.control}, {args.format} to {args.output} "
+                f"(its targets and interval apply; --standalone probes separately)")
+    try:
+        for sample in client.subscribe():
+            writer.write(sample)
+            samples += 1
+            if args.count and samples >= args.count:
+                break
+    except KeyboardInterrupt:
+        pass
+    except (OSError, ValueError) as e:
+        logger.error(f"Sample stream from the running instance ended: {e}")
+    finally:
+        client.close()
+        writer.close()
+    logger.info(f"Attached run finished after {samples} samples")
+    return 0
+
+def run_attached_window(args, sock):
+    """Open a dashboard window fed by the running instance"""
+    import webview
+    
+    logger.info(f"Another instance is running, attaching a window to it at {args.control}")
+    asset_server = AssetServer(LocalFileHandler())
+    asset_server.start()
+    window = webview.create_window(
+        'Network Monitor',
+        url=asset_server.url,
+        width=1050,
+        height=670,
+        min_size=(800, 650),
+        frameless=True
+    )
+    api = AttachedAPI(window, sock, args.control)
+    for method in CONTROL_COMMANDS + ('js_ready', 'minimize_window', 'maximize_window', 'restore_window', 'close_window'):
+        window.expose(getattr(api, method))
+    window.events.closing += api.detach
+    webview.start(debug=False)
+    asset_server.stop()
+    return 0
+
+def run_headless(args):
+    """Probe and stream samples without pywebview, the window or the file handler"""
+    import signal
+    
+    sock = find_running_instance(args)
+    if sock is not None:
+        return run_attached(args, sock)
+    
+    api = API(None, targets=args.targets.split(','), probe_method=args.probe, workers=args.workers)
+    if (api.probe_method != args.probe
+            or not json.loads(api.set_probe_train(args.train_size, args.train_spacing))["success"]
+            or not json.loads(api.set_interval(args.interval))["success"]
+            or args.adaptive and not json.loads(api.set_adaptive_interval(True, args.min_interval, args.max_interval,
+                                                                          args.probe_budget))["success"]
+            or args.path and not json.loads(api.set_path_probing(True, args.path_interval))["success"]):
+        api.engine.close()
+        return 1
+    
+    writer = SampleWriter(args.output, fmt=args.format)
+    attach_store(api, args.store, args.store_retention)
+    attach_metrics(api, args)
+    attach_control(api, args)
+    done = threading.Event()
+    samples = 0
+    
+    def on_sample(sample):
+        nonlocal samples
+        if done.is_set():
+            return
+        writer.write(sample)
+        samples += 1
+        if args.count and samples >= args.count:
+            done.set()
+    
+    api.add_sample_listener(on_sample)
+    signal.signal(signal.SIGINT, lambda *_: done.set())
+    if hasattr(signal, 'SIGTERM'):
+        signal.signal(signal.SIGTERM, lambda *_: done.set())
+    
+    startup.expect((FIRST_SAMPLE,), mode='headless', frozen=is_frozen)
+    logger.info(f"Running headless: {len(api.engine.targets)} target(s) every {api.current_interval}ms{' (adaptive)' if api.cadence else ''}, {args.format} to {args.output}")
+    api.start_update_thread()
+    # Wake up periodically so signals are handled promptly on every platform
+    while not done.wait(0.5):
+        pass
+    
+    api.stop_updates()
+    api.engine.close()
+    writer.close()
+    startup.finish()
+    logger.info(f"Headless run finished after {samples} samples")
+    return 0
+
 # Main application code
 def main():
+    args = parse_args()
+    if args.log_level:
+        set_level(args.log_level)
+    if args.command:
+        sys.exit(run_command(args))
+    if args.headless:
+        sys.exit(run_headless(args))
+    
     try:
+        # A dashboard for a monitor that is already probing, rather than a second probe loop
+        sock = find_running_instance(args)
+        if sock is not None:
+            sys.exit(run_attached_window(args, sock))
+        
         # Check if another instance is running
         if not check_single_instance():
             logger.warning("Another instance is already running. Exiting.")
@@ -482,16 +1112,12 @@ def main():
         
         # Get the correct base path
         base_path = get_base_path()
-        logger.info(f"Base path: {base_path}")
-        
-        # List files in the web directory to verify
         web_dir = os.path.join(base_path, 'web')
-        logger.info(f"Web directory: {web_dir}")
-        if os.path.exists(web_dir):
-            logger.info("Web directory contents:")
-            for item in os.listdir(web_dir):
-                logger.info(f"  - {item}")
-        else:
+        index_path = os.path.join(web_dir, 'index.html')
+        
+        # One pass over web/ loads the bundle into memory and doubles as the check that it was packaged
+        assets = LocalFileHandler()
+        if not assets.assets:
             logger.error(f"Web directory not found at {web_dir}!")
             # Create a marker file to indicate this specific error
             with open(os.path.join(log_dir, "MISSING_WEB_DIR.txt"), "w") as f:
@@ -507,11 +1133,8 @@ def main():
             remove_lock_file()  # Release lock file on error
             sys.exit(1)
         
-        # Convert the path to a file:// URL
-        index_path = os.path.join(web_dir, 'index.html')
-        
         # Verify the index file exists
-        if not os.path.exists(index_path):
+        if '/index.html' not in assets.assets:
             logger.error(f"ERROR: Index file not found at {index_path}")
             # Create a marker file to indicate this specific error
             with open(os.path.join(log_dir, "MISSING_INDEX.txt"), "w") as f:
@@ -525,15 +1148,23 @@ def main():
             remove_lock_file()  # Release lock file on error
             sys.exit(1)
         
-        logger.info(f"Index file found at: {index_path}")
+        # Serve the bundle from memory; file:// remains as a fallback if the port is taken
+        asset_server = None
+        try:
+            asset_server = AssetServer(assets, args.asset_port, args.asset_bind)
+            asset_server.start()
+            file_url = asset_server.url
+        except OSError as e:
+            logger.error(f"Could not start asset server on port {args.asset_port}: {e}")
+            if sys.platform == "win32":
+                file_url = f"file:///{index_path.replace(os.sep, '/')}"
+            else:
+                file_url = f"file://{index_path}"
         
-        # Convert the path to a file:// URL
-        if platform.system().lower() == "windows":
-            file_url = f"file:///{index_path.replace(os.sep, '/')}"
-        else:
-            file_url = f"file://{index_path}"
+        logger.info(f"Loading URL: {file_url}")
         
-        logger.info(f"Loading file URL: {file_url}")
+        # Only windowed runs pay for importing the GUI toolkit
+        import webview
         
         # Create the window
         logger.info("Creating window...")
@@ -545,26 +1176,49 @@ def main():
             min_size=(800, 650),
             frameless=True
         )
+        startup.mark(WINDOW)
+        startup.expect((FIRST_SHOWN, DASHBOARD), mode='window', frozen=is_frozen)
         
         # Create the API instance
         logger.info("Creating API instance...")
-        api = API(window)
+        api = API(window, targets=args.targets.split(','), probe_method=args.probe, workers=args.workers)
+        api.set_interval(args.interval)
+        if args.adaptive:
+            api.set_adaptive_interval(True, args.min_interval, args.max_interval, args.probe_budget)
+        if args.path:
+            api.set_path_probing(True, args.path_interval)
+        api.set_probe_train(args.train_size, args.train_spacing)
+        attach_store(api, args.store, args.store_retention)
+        attach_metrics(api, args)
+        attach_control(api, args)
         
         # Register a clean shutdown handler
         def on_closing():
             logger.info("Application is closing...")
-            api.should_run = False
-            api._exit_flag.set()
-            if api.update_thread and api.update_thread.is_alive():
-                api.update_thread.join(timeout=1.0)
+            api.stop_updates()
+            if not (api.update_thread and api.update_thread.is_alive()):
+                api.engine.close()  # Also stops probe worker processes
+            if asset_server is not None:
+                asset_server.stop()
             remove_lock_file()  # Remove lock file on close
+            startup.finish()
             logger.info("Threads stopped")
         
         # Expose individual methods using the window object
         logger.info("Exposing API methods...")
         window.expose(api.get_ping_data)
         window.expose(api.set_interval)
+        window.expose(api.set_adaptive_interval)
+        window.expose(api.set_targets)
+        window.expose(api.set_probe_method)
+        window.expose(api.set_probe_train)
+        window.expose(api.get_probe_methods)
+        window.expose(api.get_history)
+        window.expose(api.get_instrumentation)
+        window.expose(api.set_path_probing)
+        window.expose(api.get_path)
         window.expose(api.js_ready)
+        window.expose(api.mark_startup)
         
         window.expose(api.minimize_window)
         window.expose(api.maximize_window)
@@ -574,6 +1228,9 @@ def main():
         # Set the closing event handler
         window.events.closing += on_closing
         
+        # Probe while the page loads; samples wait in the channel until js_ready
+        api.start_update_thread()
+        
         # Start the application
         logger.info("Starting webview application...")
         webview.start(debug=False)
@@ -583,6 +1240,7 @@ def main():
         # Write to an easy-to-find error file
         with open(os.path.join(log_dir, "FATAL_ERROR.txt"), "w") as f:
             f.write(f"Fatal error occurred: {e}\n\n")
+            import traceback
             f.write(traceback.format_exc())
         
         # If possible, show a message box
@@ -599,6 +1257,8 @@ def main():
         sys.exit(1)
 
 if __name__ == '__main__':
+    # Lets frozen builds start probe worker processes
+    multiprocessing.freeze_support()
     logger.info("Script started")
     main()
     logger.info("Script exited normally")
@@ -0,0 +1,460 @@
+import asyncio
+import errno
+import itertools
+import logging
+import os
+import socket
+import struct
+import time
+from typing import Awaitable, Callable, Dict, Iterable, Optional, Type
+
+logger = logging.getLogger("NetworkMonitor.probers")
+
+ICMP_ECHO_REQUEST = 8
+ICMP_ECHO_REPLY = 0
+ICMPV6_ECHO_REQUEST = 128
+ICMPV6_ECHO_REPLY = 129
+
+
+# Reasons a probe can fail, used to label error counters
+TIMEOUT = "timeout"
+REFUSED = "refused"
+UNREACHABLE = "unreachable"
+DNS = "dns"  # The target's name did not resolve
+ERROR = "error"
+
+_UNREACHABLE_ERRNOS = {errno.ENETUNREACH, errno.EHOSTUNREACH, errno.ENETDOWN, errno.EHOSTDOWN}
+
+# Seconds before the next fallback port is tried while the previous one is still pending
+PORT_STAGGER = 0.25
+
+
+class ProberUnavailable(Exception):
+    """Raised when a probe backend cannot be used on this system"""
+
+
+class ProbeFailed(Exception):
+    """Raised by Prober.probe() when the target did not answer"""
+
+    def __init__(self, reason: str, detail: str = ""):
+        super().__init__(f"{reason}: {detail}" if detail else reason)
+        self.reason = reason
+
+
+def failure_reason(exc: BaseException) -> str:
+    """Map a socket exception onto one of the failure reasons"""
+    if isinstance(exc, (asyncio.TimeoutError, socket.timeout)):
+        return TIMEOUT
+    if isinstance(exc, ConnectionRefusedError):
+        return REFUSED
+    if isinstance(exc, OSError) and exc.errno in _UNREACHABLE_ERRNOS:
+        return UNREACHABLE
+    return ERROR
+
+
+def address_family(host: str) -> int:
+    """Socket family for an address literal: AF_INET6 if it is IPv6, else AF_INET"""
+    return socket.AF_INET6 if ':' in host else socket.AF_INET
+
+
+class Prober:
+    """
+    Base class for probe backends.
+
+    probe() takes an IPv4 or IPv6 address and returns the round trip time
+    in milliseconds, or raises ProbeFailed with a reason when the target
+    did not answer in time.
+    """
+
+    name = None
+
+    def __init__(self, timeout: float = 1.0):
+        self.timeout = timeout
+
+    async def probe(self, host: str) -> float:
+        raise NotImplementedError
+
+    def close(self):
+        """Release sockets held between probes"""
+
+
+async def race_ports(connect: Callable[[int], Awaitable], ports: Iterable[int], timeout: float,
+                     discard: Optional[Callable] = None, stagger: float = PORT_STAGGER):
+    """
+    Return the first successful connect(port), trying ports concurrently.
+
+    The next port starts as soon as the previous attempt fails or after
+    stagger seconds, so a filtered port costs at most one stagger instead
+    of a full timeout. Raises the last ProbeFailed, or a timeout once the
+    overall deadline passes. Extra successes are handed to discard().
+    """
+    loop = asyncio.get_running_loop()
+    deadline = loop.time() + timeout
+    remaining = list(ports)
+    pending = set()
+    failure = ProbeFailed(ERROR, "no ports to try")
+    try:
+        while remaining or pending:
+            if remaining:
+                pending.add(asyncio.ensure_future(connect(remaining.pop(0))))
+            wait = deadline - loop.time()
+            if remaining:
+                wait = min(wait, stagger)
+            if wait <= 0:
+                raise ProbeFailed(TIMEOUT, f"no answer within {timeout}s")
+            done, pending = await asyncio.wait(pending, timeout=wait, return_when=asyncio.FIRST_COMPLETED)
+            winner = None
+            for task in done:
+                if task.exception() is not None:
+                    failure = task.exception()
+                elif winner is None:
+                    winner = task
+                elif discard is not None:
+                    discard(task.result())
+            if winner is not None:
+                return winner.result()
+        raise failure
+    finally:
+        for task in pending:
+            task.cancel()
+        if pending:
+            await asyncio.gather(*pending, return_exceptions=True)
+
+
+class TcpConnectProber(Prober):
+    """Times the TCP three-way handshake, racing the ports with a short stagger"""
+
+    name = "tcp"
+
+    def __init__(self, timeout: float = 1.0, ports: Iterable[int] = (443, 80, 53)):
+        super().__init__(timeout)
+        self.ports = tuple(ports)
+
+    async def probe(self, host: str) -> float:
+        return await race_ports(lambda port: self._connect(host, port), self.ports, self.timeout)
+
+    async def _connect(self, host: str, port: int) -> float:
+        loop = asyncio.get_running_loop()
+        try:
+            s = socket.socket(address_family(host), socket.SOCK_STREAM)
+        except OSError as e:
+            logger.error(f"Socket creation failed: {e}")
+            raise ProbeFailed(ERROR, str(e))
+        s.setblocking(False)
+        try:
+            start_time = time.perf_counter()
+            await asyncio.wait_for(loop.sock_connect(s, (host, port)), self.timeout)
+            return (time.perf_counter() - start_time) * 1000
+        except (OSError, asyncio.TimeoutError) as e:
+            raise ProbeFailed(failure_reason(e), str(e))
+        finally:
+            s.close()
+
+
+def _icmp_checksum(data: bytes) -> int:
+    if len(data) % 2:
+        data += b'\x00'
+    total = sum(struct.unpack(f'!{len(data) // 2}H', data))
+    total = (total >> 16) + (total & 0xFFFF)
+    total += total >> 16
+    return ~total & 0xFFFF
+
+
+class IcmpEchoProber(Prober):
+    """
+    Sends real ICMP echo requests through an unprivileged datagram socket.
+
+    On Linux this needs the user's group inside net.ipv4.ping_group_range;
+    the kernel owns the identifier field, so replies are matched by sequence.
+    """
+
+    name = "icmp"
+
+    def __init__(self, timeout: float = 1.0, payload_size: int = 16):
+        super().__init__(timeout)
+        self.payload = os.urandom(payload_size)
+        self._sequence = itertools.count(1)
+        # Fail early so the caller can fall back to another backend
+        try:
+            socket.socket(socket.AF_INET, socket.SOCK_DGRAM, socket.IPPROTO_ICMP).close()
+        except OSError as e:
+            raise ProberUnavailable(f"ICMP datagram sockets are not permitted: {e}")
+
+    def _packet(self, sequence: int, ipv6: bool = False) -> bytes:
+        if ipv6:
+            # The kernel fills in the ICMPv6 checksum, which covers a pseudo-header
+            return struct.pack('!BBHHH', ICMPV6_ECHO_REQUEST, 0, 0, 0, sequence) + self.payload
+        header = struct.pack('!BBHHH', ICMP_ECHO_REQUEST, 0, 0, 0, sequence)
+        checksum = _icmp_checksum(header + self.payload)
+        return struct.pack('!BBHHH', ICMP_ECHO_REQUEST, 0, checksum, 0, sequence) + self.payload
+
+    async def probe(self, host: str) -> float:
+        loop = asyncio.get_running_loop()
+        sequence = next(self._sequence) & 0xFFFF
+        ipv6 = address_family(host) == socket.AF_INET6
+        try:
+            if ipv6:
+                s = socket.socket(socket.AF_INET6, socket.SOCK_DGRAM, socket.IPPROTO_ICMPV6)
+            else:
+                s = socket.socket(socket.AF_INET, socket.SOCK_DGRAM, socket.IPPROTO_ICMP)
+        except OSError as e:
+            raise ProbeFailed(ERROR, str(e))
+        s.setblocking(False)
+        try:
+            s.connect((host, 0))
+            start_time = time.perf_counter()
+            await loop.sock_sendall(s, self._packet(sequence, ipv6))
+            reply_type = ICMPV6_ECHO_REPLY if ipv6 else ICMP_ECHO_REPLY
+            return await asyncio.wait_for(self._wait_reply(s, sequence, start_time, reply_type), self.timeout)
+        except (OSError, asyncio.TimeoutError) as e:
+            raise ProbeFailed(failure_reason(e), str(e))
+        finally:
+            s.close()
+
+    async def _wait_reply(self, s, sequence, start_time, reply_type=ICMP_ECHO_REPLY) -> float:
+        loop = asyncio.get_running_loop()
+        while True:
+            data = await loop.sock_recv(s, 1024)
+            end_time = time.perf_counter()
+            # Some platforms hand back the IP header as well
+            if data and data[0] >> 4 == 4 and len(data) >= 20:
+                data = data[(data[0] & 0x0F) * 4:]
+            if len(data) < 8:
+                continue
+            icmp_type, _, _, _, reply_sequence = struct.unpack('!BBHHH', data[:8])
+            if icmp_type == reply_type and reply_sequence == sequence:
+                return (end_time - start_time) * 1000
+
+
+class UdpProber(Prober):
+    """
+    Sends a small UDP datagram and times the first response.
+
+    Either an answer from the service (the default payload is a DNS query
+    for the root zone) or an ICMP port unreachable counts as a reply.
+    """
+
+    name = "udp"
+
+    # Standard query, id 0x4e4d, recursion desired, one question: ". IN NS"
+    DNS_QUERY = bytes.fromhex('4e4d01000001000000000000' '00' '0002' '0001')
+
+    def __init__(self, timeout: float = 1.0, port: int = 53, payload: bytes = DNS_QUERY):
+        super().__init__(timeout)
+        self.port = port
+        self.payload = payload
+
+    async def probe(self, host: str) -> float:
+        loop = asyncio.get_running_loop()
+        try:
+            s = socket.socket(address_family(host), socket.SOCK_DGRAM)
+        except OSError as e:
+            raise ProbeFailed(ERROR, str(e))
+        s.setblocking(False)
+        try:
+            s.connect((host, self.port))
+            start_time = time.perf_counter()
+            await loop.sock_sendall(s, self.payload)
+            try:
+                await asyncio.wait_for(loop.sock_recv(s, 512), self.timeout)
+            except ConnectionRefusedError:
+                # ICMP port unreachable still proves the host answered
+                pass
+            return (time.perf_counter() - start_time) * 1000
+        except (OSError, asyncio.TimeoutError) as e:
+            raise ProbeFailed(failure_reason(e), str(e))
+        finally:
+            s.close()
+
+
+# struct tcp_info (Linux): u32 tcpi_unacked at byte 24, u32 tcpi_rtt (microseconds) at byte 68
+_TCP_INFO_SIZE = 104
+_TCPI_UNACKED_OFFSET = 24
+_TCPI_RTT_OFFSET = 68
+HAS_TCP_INFO = hasattr(socket, 'TCP_INFO')
+
+
+def tcp_info(s: socket.socket) -> Optional[tuple]:
+    """(smoothed RTT in ms, unacknowledged segments) from the kernel, or None where unsupported"""
+    if not HAS_TCP_INFO:
+        return None
+    try:
+        info = s.getsockopt(socket.IPPROTO_TCP, socket.TCP_INFO, _TCP_INFO_SIZE)
+    except OSError:
+        return None
+    if len(info) < _TCPI_RTT_OFFSET + 4:
+        return None
+    rtt_us, = struct.unpack_from('I', info, _TCPI_RTT_OFFSET)
+    unacked, = struct.unpack_from('I', info, _TCPI_UNACKED_OFFSET)
+    return rtt_us / 1000, unacked
+
+
+class _Connection:
+    __slots__ = ('sock', 'port', 'query_id')
+
+    def __init__(self, sock: socket.socket, port: int):
+        self.sock = sock
+        self.port = port
+        self.query_id = 0
+
+
+class PersistentTcpProber(Prober):
+    """
+    Keeps one long-lived TCP connection per target instead of a handshake per sample.
+
+    On the DNS port the RTT is an application-level echo: a tiny query over
+    the open connection, timed to its answer. On other ports (Linux only)
+    it is the kernel's smoothed RTT from TCP_INFO, refreshed by sending a
+    blank line, which HTTP servers ignore before a request. Broken
+    connections are re-established in the background, racing the ports.
+    """
+
+    name = "persistent"
+
+    DNS_PORT = 53
+    # Blank line that keeps ACKs, and so TCP_INFO RTT samples, coming on HTTP ports
+    NUDGE = b"\r\n"
+    # How often to look for the nudge's ACK while waiting on the kernel
+    ACK_POLL = 0.001
+
+    def __init__(self, timeout: float = 1.0, ports: Optional[Iterable[int]] = None):
+        super().__init__(timeout)
+        if ports is None:
+            ports = (self.DNS_PORT, 80) if HAS_TCP_INFO else (self.DNS_PORT,)
+        self.ports = tuple(ports)
+        if not HAS_TCP_INFO and any(port != self.DNS_PORT for port in self.ports):
+            raise ProberUnavailable("TCP_INFO is not available here; only the DNS port can be used")
+        self._connections: Dict[str, _Connection] = {}
+        self._connecting: Dict[str, asyncio.Future] = {}
+        # Probes of a train take turns on the target's single connection
+        self._locks: Dict[str, asyncio.Lock] = {}
+        self.reconnects = 0
+
+    async def _open(self, host: str, port: int) -> _Connection:
+        loop = asyncio.get_running_loop()
+        s = socket.socket(address_family(host), socket.SOCK_STREAM)
+        s.setblocking(False)
+        s.setsockopt(socket.IPPROTO_TCP, socket.TCP_NODELAY, 1)
+        try:
+            await asyncio.wait_for(loop.sock_connect(s, (host, port)), self.timeout)
+        except BaseException as e:
+            s.close()
+            if isinstance(e, (OSError, asyncio.TimeoutError)):
+                raise ProbeFailed(failure_reason(e), str(e))
+            raise
+        return _Connection(s, port)
+
+    async def _connect(self, host: str):
+        connection = await race_ports(lambda port: self._open(host, port), self.ports, self.timeout,
+                                      discard=lambda extra: extra.sock.close())
+        self._connections[host] = connection
+        logger.info(f"Persistent connection to {host}:{connection.port} established")
+
+    def _drop(self, host: str):
+        connection = self._connections.pop(host, None)
+        if connection is not None:
+            connection.sock.close()
+            self.reconnects += 1
+
+    async def _connection(self, host: str) -> _Connection:
+        """The open connection, waiting at most one timeout for a (re)connect"""
+        connection = self._connections.get(host)
+        if connection is not None:
+            return connection
+        task = self._connecting.get(host)
+        if task is None or task.done():
+            task = self._connecting[host] = asyncio.ensure_future(self._connect(host))
+            # Retrieve the outcome so a failed background attempt is not reported as unhandled
+            task.add_done_callback(lambda t: t.cancelled() or t.exception())
+        try:
+            # The attempt keeps running in the background if this probe gives up on it
+            await asyncio.wait_for(asyncio.shield(task), self.timeout)
+        except asyncio.TimeoutError:
+            raise ProbeFailed(TIMEOUT, f"still connecting to {host}")
+        return self._connections[host]
+
+    async def probe(self, host: str) -> float:
+        lock = self._locks.get(host)
+        if lock is None:
+            lock = self._locks[host] = asyncio.Lock()
+        async with lock:
+            return await self._probe(host)
+
+    async def _probe(self, host: str) -> float:
+        for attempt in range(2):
+            connection = await self._connection(host)
+            try:
+                if connection.port == self.DNS_PORT:
+                    return await asyncio.wait_for(self._echo(connection), self.timeout)
+                return await asyncio.wait_for(self._kernel_rtt(connection), self.timeout)
+            except (asyncio.IncompleteReadError, ConnectionResetError, BrokenPipeError) as e:
+                self._drop(host)
+                if attempt:
+                    raise ProbeFailed(ERROR, f"connection closed by peer: {e}")
+                # Servers close idle connections; reconnect once rather than report a loss
+            except (OSError, asyncio.TimeoutError) as e:
+                # A stuck connection is replaced on the next probe
+                self._drop(host)
+                raise ProbeFailed(failure_reason(e), str(e))
+
+    async def _recv_exactly(self, s: socket.socket, size: int) -> bytes:
+        loop = asyncio.get_running_loop()
+        data = b''
+        while len(data) < size:
+            chunk = await loop.sock_recv(s, size - len(data))
+            if not chunk:
+                raise asyncio.IncompleteReadError(data, size)
+            data += chunk
+        return data
+
+    async def _echo(self, connection: _Connection) -> float:
+        loop = asyncio.get_running_loop()
+        connection.query_id = (connection.query_id + 1) & 0xFFFF
+        query = struct.pack('!H', connection.query_id) + UdpProber.DNS_QUERY[2:]
+        start_time = time.perf_counter()
+        await loop.sock_sendall(connection.sock, struct.pack('!H', len(query)) + query)
+        while True:
+            length, = struct.unpack('!H', await self._recv_exactly(connection.sock, 2))
+            answer = await self._recv_exactly(connection.sock, length)
+            end_time = time.perf_counter()
+            # Skip a late answer to an earlier query that timed out
+            if length >= 2 and struct.unpack('!H', answer[:2])[0] == connection.query_id:
+                return (end_time - start_time) * 1000
+
+    async def _kernel_rtt(self, connection: _Connection) -> float:
+        loop = asyncio.get_running_loop()
+        await loop.sock_sendall(connection.sock, self.NUDGE)
+        while True:
+            info = tcp_info(connection.sock)
+            if info is None:
+                raise ProbeFailed(ERROR, "TCP_INFO unavailable")
+            rtt, unacked = info
+            if not unacked:
+                return rtt
+            await asyncio.sleep(self.ACK_POLL)
+
+    def close(self):
+        for task in self._connecting.values():
+            task.cancel()
+        self._connecting.clear()
+        for connection in self._connections.values():
+            connection.sock.close()
+        self._connections.clear()
+        self._locks.clear()
+
+
+PROBERS: Dict[str, Type[Prober]] = {
+    TcpConnectProber.name: TcpConnectProber,
+    IcmpEchoProber.name: IcmpEchoProber,
+    UdpProber.name: UdpProber,
+    PersistentTcpProber.name: PersistentTcpProber,
+}
+
+
+def create_prober(name: str, timeout: float = 1.0) -> Prober:
+    """Create a prober by name, raising ProberUnavailable if it cannot run here"""
+    try:
+        prober_class = PROBERS[name.lower()]
+    except KeyError:
+        raise ProberUnavailable(f"Unknown probe method '{name}', expected one of {', '.join(PROBERS)}")
+    return prober_class(timeout=timeout)
@@ -0,0 +1,165 @@
+import ipaddress
+import logging
+import os
+import socket
+import threading
+import time
+from concurrent.futures import Future, ThreadPoolExecutor
+from typing import Dict, Optional, Tuple
+
+try:
+    import dns.exception
+    import dns.resolver
+except ImportError:  # Optional; without it cache lifetimes fall back to DEFAULT_TTL
+    dns = None
+
+logger = logging.getLogger("NetworkMonitor.resolver")
+
+# getaddrinfo does not expose record TTLs, so its answers are kept this long
+DEFAULT_TTL = float(os.environ.get("NETWORK_MONITOR_DNS_TTL", "60"))
+# Bounds applied to record TTLs, so a TTL of 0 does not mean a lookup per tick
+MIN_TTL = 5.0
+MAX_TTL = 3600.0
+# How long a failed lookup is remembered before trying again
+NEGATIVE_TTL = float(os.environ.get("NETWORK_MONITOR_DNS_NEGATIVE_TTL", "30"))
+# Refresh in the background once this fraction of the TTL has passed
+REFRESH_AT = 0.8
+RESOLVE_TIMEOUT = 5.0
+
+
+def is_address(host: str) -> bool:
+    """True for IPv4/IPv6 literals, which need no lookup"""
+    try:
+        ipaddress.ip_address(host)
+        return True
+    except ValueError:
+        return False
+
+
+class DnsEntry:
+    """One resolution result: the addresses in preference order, or an error"""
+
+    __slots__ = ('addresses', 'error', 'duration_ms', 'resolved', 'expires')
+
+    def __init__(self, addresses: Tuple[str, ...], error: Optional[str], duration_ms: float, ttl: float):
+        self.addresses = addresses
+        self.error = error
+        self.duration_ms = duration_ms
+        self.resolved = time.monotonic()
+        self.expires = self.resolved + ttl
+
+    @property
+    def ttl(self) -> float:
+        return self.expires - self.resolved
+
+
+class DnsCache:
+    """
+    Resolves hostnames on a small thread pool, off the probe loop.
+
+    lookup() never blocks: it returns the cached entry, starting a
+    background refresh once REFRESH_AT of the TTL has passed and serving
+    the old addresses until the new ones arrive. A refresh that fails
+    keeps the last good addresses for another NEGATIVE_TTL. Names that
+    never resolved are cached as errors for NEGATIVE_TTL. Only the first
+    lookup of a name has nothing to return; resolve() gives its future.
+
+    Addresses always come from getaddrinfo, in its order. With dnspython
+    installed, the records' TTLs set the cache lifetime; names DNS does
+    not know (hosts file, mDNS) and installs without it use DEFAULT_TTL.
+    """
+
+    def __init__(self, workers: int = 4):
+        self._entries: Dict[str, DnsEntry] = {}
+        self._pending: Dict[str, Future] = {}
+        self._lock = threading.Lock()
+        self._executor = ThreadPoolExecutor(max_workers=workers, thread_name_prefix="DnsResolver")
+        self.lookups = 0
+        self.failures = 0
+
+    def lookup(self, name: str) -> Optional[DnsEntry]:
+        """Cached entry for name, or None while its first resolution is running"""
+        with self._lock:
+            entry = self._entries.get(name)
+            now = time.monotonic()
+            if entry is None or now >= entry.expires - (1 - REFRESH_AT) * entry.ttl:
+                self._start(name)
+            return entry
+
+    def resolve(self, name: str) -> Future:
+        """Future of the next DnsEntry for name, starting a resolution if none is running"""
+        with self._lock:
+            return self._start(name)
+
+    def _start(self, name: str) -> Future:
+        future = self._pending.get(name)
+        if future is None:
+            future = self._pending[name] = self._executor.submit(self._resolve, name)
+        return future
+
+    def _resolve(self, name: str) -> DnsEntry:
+        start = time.perf_counter()
+        try:
+            addresses, ttl = _query(name)
+            error = None
+        except Exception as e:
+            # gaierror, or OSError when a name has no usable addresses
+            addresses, ttl, error = (), NEGATIVE_TTL, str(e) or type(e).__name__
+        duration_ms = (time.perf_counter() - start) * 1000
+        with self._lock:
+            self.lookups += 1
+            previous = self._entries.get(name)
+            if error:
+                self.failures += 1
+                if previous is not None and previous.addresses:
+                    # Serve the stale addresses rather than drop a target over a failed refresh
+                    logger.warning(f"Refreshing {name} failed, keeping {len(previous.addresses)} cached "
+                                   f"address(es): {error}")
+                    entry = DnsEntry(previous.addresses, None, duration_ms, NEGATIVE_TTL)
+                else:
+                    logger.warning(f"Could not resolve {name}: {error}")
+                    entry = DnsEntry((), error, duration_ms, NEGATIVE_TTL)
+            else:
+                if previous is None or previous.addresses != addresses:
+                    logger.info(f"Resolved {name} to {', '.join(addresses)} in {duration_ms:.1f}ms (TTL {ttl:.0f}s)")
+                entry = DnsEntry(addresses, None, duration_ms, ttl)
+            self._entries[name] = entry
+            del self._pending[name]
+        return entry
+
+    def close(self):
+        self._executor.shutdown(wait=False, cancel_futures=True)
+
+
+def _query(name: str) -> Tuple[Tuple[str, ...], float]:
+    """Addresses for name and how long to cache them"""
+    # getaddrinfo honours /etc/hosts, mDNS and the rest of the system's resolver configuration
+    infos = socket.getaddrinfo(name, None, type=socket.SOCK_STREAM)
+    addresses = []
+    for family, _, _, _, sockaddr in infos:
+        if family in (socket.AF_INET, socket.AF_INET6) and sockaddr[0] not in addresses:
+            addresses.append(sockaddr[0])
+    if not addresses:
+        raise OSError(f"no IPv4 or IPv6 addresses for {name}")
+    return tuple(addresses), _record_ttl(name)
+
+
+def _record_ttl(name: str) -> float:
+    """TTL of name's A/AAAA records from DNS, or DEFAULT_TTL when DNS does not know it"""
+    if dns is None:
+        return DEFAULT_TTL
+    ttls = []
+    try:
+        resolver = dns.resolver.Resolver()
+        for record_type in ('A', 'AAAA'):
+            try:
+                answer = resolver.resolve(name, record_type, lifetime=RESOLVE_TIMEOUT)
+            except dns.resolver.NoAnswer:
+                continue
+            ttls.append(answer.rrset.ttl)
+    except dns.exception.DNSException:
+        # NXDOMAIN for hosts-file and mDNS names, no resolv.conf, or DNS unreachable
+        pass
+    if not ttls:
+        return DEFAULT_TTL
+    return min(max(min(ttls), MIN_TTL), MAX_TTL)
@@ -0,0 +1,91 @@
+import threading
+import time
+from typing import Optional
+
+# Shortest interval the scheduler accepts, used for burst sampling
+MIN_INTERVAL_MS = 10
+# The last stretch before a deadline is slept with time.sleep, which uses
+# high resolution timers, instead of a coarser Event.wait
+FINE_SLEEP_MS = 2.0
+
+
+class Tick:
+    """One scheduler firing: when it was due, when it ran and how late it was"""
+
+    __slots__ = ('index', 'scheduled', 'fired', 'lateness_ms', 'skipped')
+
+    def __init__(self, index: int, scheduled: float, fired: float, skipped: int):
+        self.index = index
+        self.scheduled = scheduled
+        self.fired = fired
+        self.lateness_ms = max(0.0, (fired - scheduled) * 1000)
+        self.skipped = skipped
+
+
+class DeadlineScheduler:
+    """
+    Monotonic, drift-free tick source for the update loop.
+
+    Deadlines advance by whole intervals from the first tick, so processing
+    time does not accumulate as drift. Ticks that are missed entirely (for
+    example behind a probe that hit its timeout) are skipped, not replayed.
+    wait_next() returns early when the interval changes and None on stop.
+    """
+
+    def __init__(self, interval_ms: float):
+        self._interval = self._validate(interval_ms) / 1000
+        self._wake = threading.Event()
+        self._stopped = False
+        self._next_deadline = None
+        self._index = 0
+
+    @staticmethod
+    def _validate(interval_ms: float) -> float:
+        interval_ms = float(interval_ms)
+        if interval_ms < MIN_INTERVAL_MS:
+            raise ValueError(f"Interval must be at least {MIN_INTERVAL_MS}ms")
+        return interval_ms
+
+    @property
+    def interval_ms(self) -> float:
+        return self._interval * 1000
+
+    def set_interval(self, interval_ms: float):
+        """Change the interval; the next tick is re-planned from the last one"""
+        interval = self._validate(interval_ms) / 1000
+        if self._next_deadline is not None:
+            self._next_deadline += interval - self._interval
+        self._interval = interval
+        self._wake.set()
+
+    def stop(self):
+        """Make wait_next() return None as soon as possible"""
+        self._stopped = True
+        self._wake.set()
+
+    def wait_next(self) -> Optional[Tick]:
+        """Block until the next deadline and return the tick, or None once stopped"""
+        if self._next_deadline is None:
+            self._next_deadline = time.monotonic()
+
+        while not self._stopped:
+            remaining = self._next_deadline - time.monotonic()
+            if remaining <= 0:
+                break
+            if remaining * 1000 > FINE_SLEEP_MS:
+                if self._wake.wait(remaining - FINE_SLEEP_MS / 1000):
+                    # Interval changed or stop requested: re-evaluate the deadline
+                    self._wake.clear()
+                continue
+            time.sleep(remaining)
+
+        if self._stopped:
+            return None
+
+        fired = time.monotonic()
+        scheduled = self._next_deadline
+        # Skip whole intervals we have already missed instead of bursting to catch up
+        skipped = int((fired - scheduled) // self._interval)
+        self._next_deadline = scheduled + (skipped + 1) * self._interval
+        self._index += 1
+        return Tick(self._index, scheduled + skipped * self._interval, fired, skipped)
@@ -0,0 +1,482 @@
+import logging
+import math
+import multiprocessing
+import struct
+import time
+import zlib
+from multiprocessing import connection as mp_connection
+from multiprocessing.shared_memory import SharedMemory
+from typing import Dict, Iterable, List, Optional
+
+from engine import ProbeEngine
+from log_config import forward_worker_logs, setup_worker_logging
+from probers import DNS, ERROR, REFUSED, TIMEOUT, UNREACHABLE, Prober, TcpConnectProber, create_prober
+from stats import StreamingStats
+
+logger = logging.getLogger("NetworkMonitor.shard")
+
+# How long a round may overrun the probe timeout before its worker is restarted
+ROUND_GRACE = 1.0
+# How long a new worker may take to import and report ready
+STARTUP_TIMEOUT = 30.0
+# Replies to detect requests carry no probes, so they must be quick
+DETECT_TIMEOUT = 0.5
+# How long a running worker may take to apply a new configuration
+CONFIGURE_TIMEOUT = 5.0
+# Event ids a worker process may number before running into the next process's block
+EVENT_ID_BITS = 32
+
+REASONS = (TIMEOUT, REFUSED, UNREACHABLE, DNS, ERROR)
+# Fields before the train RTTs: latency, jitter, packetLoss, error reason,
+# DNS resolution time, train size (0 for a single probe), received, min,
+# median, max, train jitter and one loss count per reason. Missing values
+# are NaN. The probed address of a hostname target is not carried over.
+_HEAD_FIELDS = 11 + len(REASONS)
+_INT_FIELDS = ('count', 'samples')
+_MISSING = math.nan
+
+
+def _field_paths(snapshot, prefix=()):
+    for key, value in snapshot.items():
+        if isinstance(value, dict):
+            yield from _field_paths(value, prefix + (key,))
+        else:
+            yield prefix + (key,)
+
+
+# The statistics snapshot flattened to a fixed list of numbers, in snapshot order
+STATS_FIELDS = tuple(_field_paths(StreamingStats().snapshot()))
+
+
+def _number(value) -> float:
+    return _MISSING if value is None else float(value)
+
+
+def _value(number: float):
+    return None if math.isnan(number) else number
+
+
+class RecordLayout:
+    """
+    Fixed-size float64 record per target, so results cross the process
+    boundary through shared memory instead of as pickled dicts.
+    """
+
+    def __init__(self, train_size: int):
+        self.train_size = train_size
+        self.struct = struct.Struct(f'<{_HEAD_FIELDS + train_size + len(STATS_FIELDS)}d')
+        self.size = self.struct.size
+
+    def pack_into(self, buffer, index: int, result: Dict[str, object]):
+        train = result.get('train')
+        error = result.get('error')
+        values = [
+            result['latency'], result['jitter'], result['packetLoss'],
+            REASONS.index(error) if error in REASONS else _MISSING,
+            _number(result.get('dnsTime')),
+        ]
+        if train is not None:
+            values += [train['size'], train['received'], _number(train['min']), _number(train['median']),
+                       _number(train['max']), train['jitter']]
+            values += [train['errors'].get(reason, 0) for reason in REASONS]
+            rtts = train['rtts']
+        else:
+            values += [0] + [_MISSING] * 5 + [0] * len(REASONS)
+            rtts = ()
+        values += rtts
+        values += [_MISSING] * (self.train_size - len(rtts))
+        stats = result['stats']
+        for path in STATS_FIELDS:
+            value = stats
+            for key in path:
+                value = value[key]
+            values.append(_number(value))
+        self.struct.pack_into(buffer, index * self.size, *values)
+
+    def unpack_from(self, buffer, index: int) -> Dict[str, object]:
+        values = self.struct.unpack_from(buffer, index * self.size)
+        result = {'latency': values[0], 'jitter': values[1], 'packetLoss': values[2]}
+        stats: Dict[str, object] = {}
+        for path, number in zip(STATS_FIELDS, values[_HEAD_FIELDS + self.train_size:]):
+            node = stats
+            for key in path[:-1]:
+                node = node.setdefault(key, {})
+            value = _value(number)
+            node[path[-1]] = int(value) if value is not None and path[-1] in _INT_FIELDS else value
+        result['stats'] = stats
+        if not math.isnan(values[4]):
+            result['dnsTime'] = values[4]
+        if values[5]:
+            size = int(values[5])
+            received = int(values[6])
+            result['train'] = {
+                'size': size,
+                'received': received,
+                'min': _value(values[7]),
+                'median': _value(values[8]),
+                'max': _value(values[9]),
+                'jitter': values[10],
+                'rtts': list(values[_HEAD_FIELDS:_HEAD_FIELDS + received]),
+                'errors': {reason: int(count) for reason, count in zip(REASONS, values[11:_HEAD_FIELDS]) if count},
+            }
+        if not math.isnan(values[3]):
+            result['error'] = REASONS[int(values[3])]
+        return result
+
+
+def _worker_main(index: int, conn, config: Dict[str, object], log_queue, log_level: int):
+    """Probe loop of one worker process: run rounds on request, results into shared memory"""
+    setup_worker_logging(log_queue, log_level)
+    worker_logger = logging.getLogger(f"NetworkMonitor.shard.worker{index}")
+    engine = None
+    memory = None
+    layout = None
+
+    def configure(config):
+        nonlocal engine, memory, layout
+        prober = create_prober(config['prober'], timeout=config['timeout'])
+        if not config['targets']:
+            # An empty shard is never asked for a round; keep whatever engine there is
+            if engine is not None:
+                engine.set_prober(prober)
+            else:
+                prober.close()
+        elif engine is None:
+            engine = ProbeEngine(config['targets'], concurrency=config['concurrency'], prober=prober,
+                                 train_size=config['train_size'], train_spacing_ms=config['train_spacing_ms'])
+        else:
+            engine.set_targets(config['targets'])
+            engine.set_prober(prober)
+            engine.set_train(config['train_size'], config['train_spacing_ms'])
+        if memory is None or memory.name != config['memory']:
+            if memory is not None:
+                memory.close()
+            memory = SharedMemory(config['memory'])
+        layout = RecordLayout(config['train_size'])
+
+    try:
+        configure(config)
+        conn.send(('ready', None))
+        while True:
+            try:
+                message = conn.recv()
+            except (EOFError, OSError):
+                break
+            kind = message[0]
+            if kind == 'round':
+                results = engine.run_round()
+                for position, host in enumerate(engine.targets):
+                    layout.pack_into(memory.buf, position, results[host])
+                conn.send(('done', engine.last_overhead_ms))
+            elif kind == 'detect':
+                conn.send(('events', engine.detect_events(message[1])))
+            elif kind == 'configure':
+                try:
+                    configure(message[1])
+                    conn.send(('configured', None))
+                except Exception as e:
+                    conn.send(('configured', str(e)))
+            elif kind == 'stop':
+                break
+    except KeyboardInterrupt:
+        pass
+    except Exception as e:
+        worker_logger.error(f"Probe worker {index} failed: {e}", exc_info=True)
+        raise
+    finally:
+        if engine is not None:
+            engine.close()
+        if memory is not None:
+            memory.close()
+
+
+class _Worker:
+    __slots__ = ('index', 'targets', 'memory', 'layout', 'process', 'conn', 'ready', 'started', 'restarts')
+
+    def __init__(self, index: int):
+        self.index = index
+        self.targets: List[str] = []
+        self.memory: Optional[SharedMemory] = None
+        self.layout: Optional[RecordLayout] = None
+        self.process = None
+        self.conn = None
+        self.ready = False
+        self.started = 0.0
+        self.restarts = 0
+
+
+class ShardedProbeEngine:
+    """
+    ProbeEngine drop-in that splits the targets across worker processes.
+
+    Each worker runs its own ProbeEngine, so probing, statistics and event
+    detection for its shard happen outside this process's GIL. Targets are
+    assigned by a hash of the host, so a target keeps its worker (and its
+    history) when the target list changes. A round asks every worker to
+    probe, and each one writes fixed-size records into its own shared
+    memory block; only short control messages go through the pipes.
+
+    A worker that dies or misses the round deadline is restarted on its
+    own; until the replacement is ready its targets report errors while
+    the other shards carry on.
+    """
+
+    def __init__(self, targets: Iterable[str], workers: int, concurrency: int = 64,
+                 prober: Optional[Prober] = None, train_size: int = 1, train_spacing_ms: float = 0.0):
+        self.concurrency = max(1, int(concurrency))
+        self.prober = prober or TcpConnectProber()
+        self.last_overhead_ms = 0.0
+        self.train_size = 1
+        self.train_spacing = 0.0
+        self._targets: List[str] = []
+        self._context = multiprocessing.get_context('spawn')
+        self._log_queue = self._context.Queue()
+        self._log_listener = forward_worker_logs(self._log_queue)
+        self._workers = [_Worker(index) for index in range(max(1, int(workers)))]
+        self._closed = False
+        self.set_train(train_size, train_spacing_ms, _broadcast=False)
+        self.set_targets(targets, _broadcast=False)
+        for worker in self._workers:
+            self._start(worker)
+        # Wait for the first generation so the first rounds have no gaps
+        deadline = time.monotonic() + STARTUP_TIMEOUT
+        for worker in self._workers:
+            self._await_ready(worker, deadline)
+
+    @property
+    def targets(self) -> List[str]:
+        return list(self._targets)
+
+    @property
+    def workers(self) -> int:
+        return len(self._workers)
+
+    @property
+    def restarts(self) -> int:
+        return sum(worker.restarts for worker in self._workers)
+
+    def _config(self, worker: _Worker) -> Dict[str, object]:
+        return {
+            'targets': worker.targets,
+            'memory': worker.memory.name,
+            'prober': self.prober.name,
+            'timeout': self.prober.timeout,
+            'concurrency': self.concurrency,
+            'train_size': self.train_size,
+            'train_spacing_ms': self.train_spacing * 1000,
+        }
+
+    def _allocate(self, worker: _Worker):
+        """Make sure the worker's shared memory fits its shard at the current train size"""
+        worker.layout = RecordLayout(self.train_size)
+        needed = max(1, len(worker.targets)) * worker.layout.size
+        if worker.memory is not None and worker.memory.size >= needed:
+            return
+        if worker.memory is not None:
+            # A running worker keeps its mapping until it attaches to the new block
+            worker.memory.close()
+            worker.memory.unlink()
+        # Headroom so a few more targets do not need another block
+        worker.memory = SharedMemory(create=True, size=needed * 2)
+
+    def _start(self, worker: _Worker):
+        parent_conn, child_conn = self._context.Pipe()
+        worker.process = self._context.Process(
+            target=_worker_main, name=f"ProbeWorker-{worker.index}", daemon=True,
+            args=(worker.index, child_conn, self._config(worker), self._log_queue, logging.getLogger().level))
+        worker.process.start()
+        child_conn.close()
+        worker.conn = parent_conn
+        worker.ready = False
+        worker.started = time.monotonic()
+
+    def _restart(self, worker: _Worker, reason: str):
+        logger.warning(f"Restarting probe worker {worker.index} ({len(worker.targets)} targets): {reason}")
+        self._stop(worker, wait=0.2)
+        worker.restarts += 1
+        self._start(worker)
+
+    def _stop(self, worker: _Worker, wait: float):
+        if worker.conn is not None:
+            try:
+                worker.conn.send(('stop',))
+            except OSError:
+                pass
+            worker.conn.close()
+            worker.conn = None
+        if worker.process is not None:
+            worker.process.join(wait)
+            if worker.process.is_alive():
+                worker.process.kill()
+                worker.process.join(wait)
+            worker.process = None
+        worker.ready = False
+
+    def _receive(self, worker: _Worker):
+        """Next message from a worker, or None if it has gone away"""
+        try:
+            message = worker.conn.recv()
+        except (EOFError, OSError):
+            return None
+        if message[0] == 'ready':
+            worker.ready = True
+            logger.info(f"Probe worker {worker.index} ready with {len(worker.targets)} targets")
+        elif message[0] == 'configured' and message[1]:
+            logger.error(f"Probe worker {worker.index} rejected its configuration: {message[1]}")
+        return message
+
+    def _await_ready(self, worker: _Worker, deadline: float):
+        while not worker.ready:
+            remaining = deadline - time.monotonic()
+            if remaining <= 0 or not worker.conn.poll(remaining) or self._receive(worker) is None:
+                self._restart(worker, "did not start")
+                return
+
+    def _check(self, worker: _Worker):
+        """Restart a dead worker and pick up a pending ready message"""
+        if not worker.process.is_alive():
+            self._restart(worker, f"exited with code {worker.process.exitcode}")
+            return
+        while not worker.ready and worker.conn.poll():
+            if self._receive(worker) is None:
+                self._restart(worker, "closed its pipe")
+                return
+        if not worker.ready and time.monotonic() - worker.started > STARTUP_TIMEOUT:
+            self._restart(worker, "did not start")
+
+    def _collect(self, workers: List[_Worker], kind: str, deadline: float) -> Dict[int, object]:
+        """Wait for one reply of the given kind from each worker; restart the ones that miss the deadline"""
+        replies = {}
+        waiting = {worker.conn: worker for worker in workers}
+        while waiting:
+            remaining = deadline - time.monotonic()
+            if remaining <= 0:
+                break
+            for conn in mp_connection.wait(list(waiting), remaining):
+                worker = waiting[conn]
+                message = self._receive(worker)
+                if message is None:
+                    del waiting[conn]
+                    self._restart(worker, f"exited with code {worker.process.exitcode}")
+                elif message[0] == kind:
+                    del waiting[conn]
+                    replies[worker.index] = message[1]
+        for worker in waiting.values():
+            self._restart(worker, f"no {kind} reply in time")
+        return replies
+
+    def _broadcast(self, message) -> List[_Worker]:
+        sent = []
+        for worker in self._workers:
+            if not worker.ready or not worker.targets:
+                continue
+            try:
+                worker.conn.send(message)
+                sent.append(worker)
+            except OSError as e:
+                self._restart(worker, str(e))
+        return sent
+
+    def _reconfigure(self):
+        """Send every worker its new configuration; raise ValueError if a running one rejects it"""
+        sent = []
+        for worker in self._workers:
+            if worker.process is None:
+                continue
+            try:
+                worker.conn.send(('configure', self._config(worker)))
+            except OSError as e:
+                self._restart(worker, str(e))
+                continue
+            # A starting worker replies once it is up; a restart would pick up the new configuration anyway
+            if worker.ready:
+                sent.append(worker)
+        replies = self._collect(sent, 'configured', time.monotonic() + CONFIGURE_TIMEOUT)
+        errors = [f"worker {index}: {error}" for index, error in sorted(replies.items()) if error]
+        if errors:
+            raise ValueError(f"Probe workers rejected the configuration ({'; '.join(errors)})")
+
+    def set_targets(self, targets: Iterable[str], _broadcast: bool = True):
+        """Replace the target list; each target stays on the worker its host hashes to"""
+        hosts = [host for host in dict.fromkeys(host.strip() for host in targets) if host]
+        if not hosts:
+            raise ValueError("At least one target is required")
+        self._targets = hosts
+        for worker in self._workers:
+            worker.targets = [host for host in hosts if zlib.crc32(host.encode()) % len(self._workers) == worker.index]
+            self._allocate(worker)
+        if _broadcast:
+            self._reconfigure()
+
+    def set_prober(self, prober: Prober):
+        """Switch probe backend in every worker; takes effect from the next round"""
+        previous, self.prober = self.prober, prober
+        if previous is not prober:
+            previous.close()
+        # Workers build their own prober by name, so only the name and timeout carry over
+        self._reconfigure()
+
+    def set_train(self, size: int, spacing_ms: float = 0.0, _broadcast: bool = True):
+        """Probes per target per round and the gap between their sends; takes effect next round"""
+        size = int(size)
+        spacing_ms = float(spacing_ms)
+        if size < 1:
+            raise ValueError("Train size must be at least 1")
+        if spacing_ms < 0:
+            raise ValueError("Train spacing cannot be negative")
+        self.train_size = size
+        self.train_spacing = spacing_ms / 1000
+        if _broadcast:
+            for worker in self._workers:
+                self._allocate(worker)
+            self._reconfigure()
+
+    def run_round(self) -> Dict[str, Dict[str, object]]:
+        """Probe every target once across the workers and return metrics keyed by target"""
+        for worker in self._workers:
+            self._check(worker)
+        sent = self._broadcast(('round',))
+        deadline = time.monotonic() + self.prober.timeout + (self.train_size - 1) * self.train_spacing + ROUND_GRACE
+        overheads = self._collect(sent, 'done', deadline)
+        self.last_overhead_ms = max(overheads.values(), default=0.0)
+
+        results = {}
+        for worker in self._workers:
+            if worker.index in overheads:
+                for position, host in enumerate(worker.targets):
+                    results[host] = worker.layout.unpack_from(worker.memory.buf, position)
+            else:
+                # Starting or restarted worker: nothing was probed for its shard
+                empty = StreamingStats().snapshot()
+                for host in worker.targets:
+                    results[host] = {'latency': 0, 'jitter': 0, 'packetLoss': 100, 'error': ERROR, 'stats': empty}
+        return {host: results[host] for host in self._targets}
+
+    def detect_events(self, timestamp: float) -> List[Dict[str, object]]:
+        """Run each worker's spike/trend detectors on its last round"""
+        sent = self._broadcast(('detect', timestamp))
+        replies = self._collect(sent, 'events', time.monotonic() + DETECT_TIMEOUT)
+        events = []
+        for index in sorted(replies):
+            # Every worker process, and each restart of one, numbers its events from 1,
+            # so each gets its own block of ids; they stay integers below 2**53 for the UI
+            offset = (self._workers[index].restarts * len(self._workers) + index) << EVENT_ID_BITS
+            for event in replies[index]:
+                event['id'] += offset
+                events.append(event)
+        return events
+
+    def close(self):
+        """Stop the workers and release their shared memory"""
+        if self._closed:
+            return
+        self._closed = True
+        for worker in self._workers:
+            self._stop(worker, wait=1.0)
+            if worker.memory is not None:
+                worker.memory.close()
+                worker.memory.unlink()
+                worker.memory = None
+        self.prober.close()
+        self._log_listener.stop()
+        self._log_queue.close()
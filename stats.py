@@ -0,0 +1,218 @@
+import math
+import time
+from array import array
+from collections import deque
+from typing import Dict, Iterable, Optional, Tuple
+
+# Rolling windows reported for every target, as (label, span in seconds)
+DEFAULT_WINDOWS = (('10s', 10), ('1m', 60), ('15m', 900))
+# Enough slots for 15 minutes at 100 ms; faster sampling shortens the longest window
+DEFAULT_CAPACITY = 16384
+PERCENTILES = (50, 95, 99)
+
+# Log-spaced histogram buckets used for percentile estimates: each bucket is
+# 5% wider than the previous one, covering 0.05 ms up to about 60 s
+_HIST_MIN = 0.05
+_HIST_GROWTH = math.log(1.05)
+_HIST_BUCKETS = int(math.log(60000 / _HIST_MIN) / _HIST_GROWTH) + 2
+
+
+def bucket_index(value: float) -> int:
+    """Log-spaced histogram bucket holding a latency value"""
+    if value <= _HIST_MIN:
+        return 0
+    return min(_HIST_BUCKETS - 1, int(math.log(value / _HIST_MIN) / _HIST_GROWTH) + 1)
+
+
+def bucket_value(index: int) -> float:
+    """Geometric midpoint of a histogram bucket"""
+    if index == 0:
+        return _HIST_MIN
+    return _HIST_MIN * math.exp((index - 0.5) * _HIST_GROWTH)
+
+
+class RingBuffer:
+    """Fixed-size, array-backed buffer of (timestamp, value) pairs addressed by sample number"""
+
+    def __init__(self, capacity: int = DEFAULT_CAPACITY):
+        self.capacity = capacity
+        self.timestamps = array('d', bytes(8 * capacity))
+        self.values = array('d', bytes(8 * capacity))
+        self.written = 0  # Total samples ever appended
+
+    def append(self, timestamp: float, value: float) -> int:
+        index = self.written
+        slot = index % self.capacity
+        self.timestamps[slot] = timestamp
+        self.values[slot] = value
+        self.written += 1
+        return index
+
+    def __getitem__(self, index: int) -> Tuple[float, float]:
+        slot = index % self.capacity
+        return self.timestamps[slot], self.values[slot]
+
+
+class WindowStats:
+    """
+    Sliding time window over a shared RingBuffer.
+
+    Keeps a running sum, loss count, monotonic deques for min/max and a
+    log-bucket histogram for percentiles, so each sample costs amortised O(1).
+    Lost samples are stored as NaN.
+    """
+
+    def __init__(self, span: float, ring: RingBuffer):
+        self.span = span
+        self.ring = ring
+        self.tail = 0  # Oldest sample number still inside the window
+        self.count = 0
+        self.lost = 0
+        self.total = 0.0
+        self.histogram = [0] * _HIST_BUCKETS
+        self._min = deque()
+        self._max = deque()
+
+    def add(self, index: int, timestamp: float, value: float):
+        if math.isnan(value):
+            self.lost += 1
+        else:
+            self.count += 1
+            self.total += value
+            self.histogram[bucket_index(value)] += 1
+            values = self.ring.values
+            capacity = self.ring.capacity
+            while self._min and values[self._min[-1] % capacity] >= value:
+                self._min.pop()
+            self._min.append(index)
+            while self._max and values[self._max[-1] % capacity] <= value:
+                self._max.pop()
+            self._max.append(index)
+        self.expire(timestamp, index + 1)
+
+    def expire(self, now: float, head: int):
+        """Drop samples older than the span, or about to be overwritten in the ring"""
+        cutoff = now - self.span
+        oldest_kept = head - self.ring.capacity + 1
+        while self.tail < head:
+            timestamp, value = self.ring[self.tail]
+            if timestamp >= cutoff and self.tail >= oldest_kept:
+                break
+            if math.isnan(value):
+                self.lost -= 1
+            else:
+                self.count -= 1
+                self.total -= value
+                self.histogram[bucket_index(value)] -= 1
+                if self._min and self._min[0] == self.tail:
+                    self._min.popleft()
+                if self._max and self._max[0] == self.tail:
+                    self._max.popleft()
+            self.tail += 1
+
+    def percentiles(self, qs: Iterable[float] = PERCENTILES) -> Dict[float, Optional[float]]:
+        """Estimate several percentiles in one pass over the occupied buckets"""
+        if not self.count:
+            return {q: None for q in qs}
+        low, high = self.min, self.max
+        pending = sorted(qs)
+        result = {}
+        seen = 0
+        for index in range(bucket_index(low), bucket_index(high) + 1):
+            seen += self.histogram[index]
+            while pending and seen >= max(1, math.ceil(self.count * pending[0] / 100)):
+                result[pending.pop(0)] = min(max(bucket_value(index), low), high)
+            if not pending:
+                break
+        for q in pending:
+            result[q] = high
+        return result
+
+    @property
+    def min(self) -> Optional[float]:
+        return self.ring.values[self._min[0] % self.ring.capacity] if self._min else None
+
+    @property
+    def max(self) -> Optional[float]:
+        return self.ring.values[self._max[0] % self.ring.capacity] if self._max else None
+
+    def snapshot(self) -> Dict[str, float]:
+        sent = self.count + self.lost
+        result = {
+            'count': self.count,
+            'mean': _round(self.total / self.count) if self.count else None,
+            'min': _round(self.min),
+            'max': _round(self.max),
+            'packetLoss': round(self.lost * 100 / sent, 1) if sent else 0,
+        }
+        for q, value in self.percentiles().items():
+            result[f'p{q}'] = _round(value)
+        return result
+
+
+def _round(value: Optional[float]) -> Optional[float]:
+    return round(value, 1) if value is not None else None
+
+
+class StreamingStats:
+    """
+    Per-target latency statistics updated in O(1) per sample.
+
+    Tracks running mean/min/max, RFC 3550 interarrival jitter, an EWMA of
+    the RTT and rolling windows with percentile estimates.
+    """
+
+    def __init__(self, windows: Iterable[Tuple[str, float]] = DEFAULT_WINDOWS,
+                 capacity: int = DEFAULT_CAPACITY, ewma_alpha: float = 0.125):
+        self.ring = RingBuffer(capacity)
+        self.windows = {label: WindowStats(span, self.ring) for label, span in windows}
+        self.ewma_alpha = ewma_alpha
+        self.sent = 0
+        self.lost = 0
+        self.count = 0
+        self.total = 0.0
+        self.min = None
+        self.max = None
+        self.ewma = None
+        self.jitter = 0.0
+        self.jitter_total = 0.0
+        self._previous = None
+
+    def add(self, rtt: Optional[float], timestamp: Optional[float] = None):
+        """Record one probe; rtt is None for a lost probe"""
+        if timestamp is None:
+            timestamp = time.monotonic()
+        self.sent += 1
+        if rtt is None:
+            self.lost += 1
+            value = math.nan
+        else:
+            value = rtt
+            self.count += 1
+            self.total += rtt
+            self.min = rtt if self.min is None else min(self.min, rtt)
+            self.max = rtt if self.max is None else max(self.max, rtt)
+            self.ewma = rtt if self.ewma is None else self.ewma + self.ewma_alpha * (rtt - self.ewma)
+            if self._previous is not None:
+                # RFC 3550 section 6.4.1: J += (|D| - J) / 16
+                self.jitter += (abs(rtt - self._previous) - self.jitter) / 16
+            self.jitter_total += self.jitter
+            self._previous = rtt
+
+        index = self.ring.append(timestamp, value)
+        for window in self.windows.values():
+            window.add(index, timestamp, value)
+
+    def snapshot(self) -> Dict[str, object]:
+        """Current statistics, ready to be JSON encoded for the UI"""
+        return {
+            'mean': _round(self.total / self.count) if self.count else None,
+            'min': _round(self.min),
+            'max': _round(self.max),
+            'ewma': _round(self.ewma),
+            'jitter': _round(self.jitter),
+            'jitterMean': _round(self.jitter_total / self.count) if self.count else None,
+            'packetLoss': round(self.lost * 100 / self.sent, 1) if self.sent else 0,
+            'samples': self.sent,
+            'windows': {label: window.snapshot() for label, window in self.windows.items()},
+        }
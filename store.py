@@ -0,0 +1,381 @@
+import json
+import logging
+import math
+import mmap
+import os
+import queue
+import struct
+import threading
+import time
+from typing import Dict, Iterator, List, Optional, Tuple
+
+from stats import PERCENTILES, bucket_index, bucket_value
+
+logger = logging.getLogger("NetworkMonitor.store")
+
+# Raw sample: timestamp (s since epoch), target id, rtt ms (NaN if lost), jitter ms
+RAW_RECORD = struct.Struct('<dIff')
+# Rollup bucket: start, target id, samples, lost, min, max, mean, p50, p95, p99
+ROLLUP_RECORD = struct.Struct('<dIIIffffff')
+
+RAW = 'raw'
+# Rollup resolutions in seconds, with the span each segment file covers
+RESOLUTIONS = {'1s': 1, '1m': 60, '1h': 3600}
+SEGMENT_SPANS = {RAW: 3600, '1s': 3600, '1m': 86400, '1h': 30 * 86400}
+# Default retention per resolution, in seconds
+DEFAULT_RETENTION = {RAW: 2 * 86400, '1s': 7 * 86400, '1m': 90 * 86400, '1h': 730 * 86400}
+# Suffixes accepted by parse_retention
+DURATION_UNITS = {'s': 1, 'm': 60, 'h': 3600, 'd': 86400, 'w': 7 * 86400, 'y': 365 * 86400}
+
+# A query never returns more points than this unless raw data is explicitly requested
+DEFAULT_MAX_POINTS = 2000
+
+
+class _Bucket:
+    """Accumulates one rollup bucket; percentiles come from a sparse log histogram"""
+
+    __slots__ = ('start', 'count', 'lost', 'min', 'max', 'total', 'histogram')
+
+    def __init__(self, start: float):
+        self.start = start
+        self.count = 0
+        self.lost = 0
+        self.min = math.inf
+        self.max = -math.inf
+        self.total = 0.0
+        self.histogram = {}
+
+    def add(self, rtt: float):
+        if math.isnan(rtt):
+            self.lost += 1
+            return
+        self.count += 1
+        self.total += rtt
+        self.min = min(self.min, rtt)
+        self.max = max(self.max, rtt)
+        index = bucket_index(rtt)
+        self.histogram[index] = self.histogram.get(index, 0) + 1
+
+    def percentiles(self) -> List[float]:
+        if not self.count:
+            return [math.nan] * len(PERCENTILES)
+        ranks = [max(1, math.ceil(self.count * q / 100)) for q in PERCENTILES]
+        result = []
+        seen = 0
+        for index in sorted(self.histogram):
+            seen += self.histogram[index]
+            while ranks and seen >= ranks[0]:
+                ranks.pop(0)
+                result.append(min(max(bucket_value(index), self.min), self.max))
+        return result + [self.max] * len(ranks)
+
+    def pack(self, target_id: int) -> bytes:
+        if self.count:
+            low, high, mean = self.min, self.max, self.total / self.count
+        else:
+            low = high = mean = math.nan
+        return ROLLUP_RECORD.pack(self.start, target_id, self.count, self.lost,
+                                  low, high, mean, *self.percentiles())
+
+
+def parse_retention(spec: str) -> Dict[str, float]:
+    """Parse "raw=1d,1s=7d,..." into seconds per resolution; a plain number is seconds"""
+    retention = {}
+    for item in filter(None, (part.strip() for part in spec.split(','))):
+        resolution, _, duration = item.partition('=')
+        resolution, duration = resolution.strip(), duration.strip().lower()
+        if resolution not in SEGMENT_SPANS:
+            raise ValueError(f"unknown resolution {resolution!r}, expected one of {', '.join(SEGMENT_SPANS)}")
+        unit = DURATION_UNITS.get(duration[-1:])
+        try:
+            seconds = float(duration[:-1]) * unit if unit else float(duration)
+        except ValueError:
+            raise ValueError(f"invalid duration {duration!r} for {resolution}") from None
+        if not seconds > 0:
+            raise ValueError(f"retention for {resolution} must be positive")
+        retention[resolution] = seconds
+    return retention
+
+
+def _segment_start(timestamp: float, span: int) -> int:
+    return int(timestamp // span * span)
+
+
+def _iter_records(path: str, record: struct.Struct, start: float, end: float) -> Iterator[tuple]:
+    """Yield records with start <= timestamp < end from a memory-mapped segment"""
+    try:
+        f = open(path, 'rb')
+    except FileNotFoundError:
+        return
+    with f:
+        # A torn record at the end (crash mid-append) is ignored
+        count = os.fstat(f.fileno()).st_size // record.size
+        if not count:
+            return
+        with mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ) as mm:
+            # Records are appended in time order, so binary search the first one
+            low, high = 0, count
+            while low < high:
+                middle = (low + high) // 2
+                if struct.unpack_from('<d', mm, middle * record.size)[0] < start:
+                    low = middle + 1
+                else:
+                    high = middle
+            for index in range(low, count):
+                values = record.unpack_from(mm, index * record.size)
+                if values[0] >= end:
+                    break
+                yield values
+
+
+class TimeSeriesStore:
+    """
+    Append-only, time-segmented on-disk store for samples.
+
+    Raw samples are written as fixed-width binary records into hourly
+    segment files. A background thread does the writes and keeps running
+    1s/1m/1h rollup buckets (min/max/mean/p50/p95/p99), appending each one
+    when it completes. Reads memory-map the segments, and query() picks the
+    coarsest data that still gives enough points for the requested range.
+    Segments older than the retention for their resolution are deleted.
+    """
+
+    def __init__(self, path: str, retention: Optional[Dict[str, float]] = None,
+                 flush_interval: float = 1.0):
+        self.path = path
+        self.retention = dict(DEFAULT_RETENTION, **(retention or {}))
+        self.flush_interval = flush_interval
+        for resolution in SEGMENT_SPANS:
+            os.makedirs(os.path.join(path, resolution), exist_ok=True)
+        self._targets_path = os.path.join(path, 'targets.json')
+        self._target_ids: Dict[str, int] = self._load_targets()
+        self._target_names = {target_id: name for name, target_id in self._target_ids.items()}
+        self._queue = queue.SimpleQueue()
+        self._files = {}  # resolution -> (segment start, open file)
+        self._buckets: Dict[Tuple[str, int], _Bucket] = {}
+        self._stopped = threading.Event()
+        self._thread = None
+        self._last_sweep = 0.0
+
+    def _load_targets(self) -> Dict[str, int]:
+        try:
+            with open(self._targets_path, 'r') as f:
+                return {name: int(target_id) for name, target_id in json.load(f).items()}
+        except FileNotFoundError:
+            return {}
+        except (ValueError, OSError) as e:
+            logger.error(f"Could not read store target index: {e}")
+            return {}
+
+    def _target_id(self, name: str) -> int:
+        target_id = self._target_ids.get(name)
+        if target_id is None:
+            target_id = len(self._target_ids)
+            self._target_ids[name] = target_id
+            self._target_names[target_id] = name
+            temp_path = self._targets_path + '.tmp'
+            with open(temp_path, 'w') as f:
+                json.dump(self._target_ids, f)
+            os.replace(temp_path, self._targets_path)
+        return target_id
+
+    def start(self):
+        if self._thread and self._thread.is_alive():
+            return
+        self._stopped.clear()
+        self._thread = threading.Thread(target=self._run, name="TimeSeriesStore", daemon=True)
+        self._thread.start()
+
+    def close(self):
+        """Stop the writer, flushing pending samples and partial rollup buckets"""
+        self._stopped.set()
+        if self._thread and self._thread.is_alive():
+            self._thread.join(timeout=5.0)
+
+    def append(self, sample: Dict[str, object]):
+        """Queue one ping_host result; safe to call from the update loop"""
+        timestamp = sample.get('timestamp')
+        timestamp = timestamp / 1000 if timestamp is not None else time.time()
+        rows = []
+        for target, metrics in (sample.get('targets') or {}).items():
+            jitter = float(metrics.get('jitter') or 0)
+            train = metrics.get('train')
+            if train is not None:
+                # One row per probe of the train, so rollups see the true loss fraction
+                rows.extend((target, rtt, jitter) for rtt in train['rtts'])
+                rows.extend((target, math.nan, jitter) for _ in range(train['size'] - train['received']))
+                continue
+            lost = metrics.get('packetLoss') == 100
+            rtt = math.nan if lost else float(metrics.get('latency') or 0)
+            rows.append((target, rtt, jitter))
+        self._queue.put((timestamp, rows))
+
+    def _run(self):
+        last_flush = time.monotonic()
+        while True:
+            try:
+                item = self._queue.get(timeout=self.flush_interval)
+            except queue.Empty:
+                item = None
+            try:
+                if item is not None:
+                    self._write(*item)
+                now = time.monotonic()
+                if now - last_flush >= self.flush_interval or item is None:
+                    self._complete_buckets(time.time())
+                    self._flush_files()
+                    last_flush = now
+                if now - self._last_sweep >= 600:
+                    self._sweep()
+                    self._last_sweep = now
+            except Exception as e:
+                logger.error(f"Store write failed: {e}")
+            if self._stopped.is_set() and self._queue.empty():
+                break
+
+        # Flush partial buckets so a restart does not lose the tail end
+        try:
+            for key in list(self._buckets):
+                self._emit(key)
+            self._flush_files()
+        except Exception as e:
+            logger.error(f"Store shutdown flush failed: {e}")
+        for _, f in self._files.values():
+            f.close()
+        self._files.clear()
+
+    def _file(self, resolution: str, timestamp: float):
+        span = SEGMENT_SPANS[resolution]
+        segment = _segment_start(timestamp, span)
+        current = self._files.get(resolution)
+        if current is None or current[0] != segment:
+            if current is not None:
+                current[1].close()
+            path = os.path.join(self.path, resolution, f"{segment}.bin")
+            current = (segment, open(path, 'ab'))
+            self._files[resolution] = current
+        return current[1]
+
+    def _write(self, timestamp: float, rows):
+        raw = self._file(RAW, timestamp)
+        for target, rtt, jitter in rows:
+            target_id = self._target_id(target)
+            raw.write(RAW_RECORD.pack(timestamp, target_id, rtt, jitter))
+            for resolution, seconds in RESOLUTIONS.items():
+                key = (resolution, target_id)
+                start = _segment_start(timestamp, seconds)
+                bucket = self._buckets.get(key)
+                if bucket is not None and bucket.start != start:
+                    self._emit(key)
+                    bucket = None
+                if bucket is None:
+                    bucket = self._buckets[key] = _Bucket(start)
+                bucket.add(rtt)
+
+    def _complete_buckets(self, now: float):
+        """Write out buckets whose time span has ended even if no new sample arrived"""
+        for key, bucket in list(self._buckets.items()):
+            if bucket.start + RESOLUTIONS[key[0]] <= now:
+                self._emit(key)
+
+    def _emit(self, key):
+        bucket = self._buckets.pop(key)
+        resolution, target_id = key
+        self._file(resolution, bucket.start).write(bucket.pack(target_id))
+
+    def _flush_files(self):
+        for _, f in self._files.values():
+            f.flush()
+
+    def _sweep(self):
+        """Delete segments that fall entirely outside their retention"""
+        now = time.time()
+        for resolution, span in SEGMENT_SPANS.items():
+            cutoff = now - self.retention[resolution]
+            directory = os.path.join(self.path, resolution)
+            for name in os.listdir(directory):
+                try:
+                    segment = int(name.split('.')[0])
+                except ValueError:
+                    continue
+                if segment + span < cutoff:
+                    try:
+                        os.remove(os.path.join(directory, name))
+                        logger.info(f"Removed expired {resolution} segment {name}")
+                    except OSError as e:
+                        logger.error(f"Could not remove segment {name}: {e}")
+
+    def _segments(self, resolution: str, start: float, end: float) -> Iterator[str]:
+        span = SEGMENT_SPANS[resolution]
+        segment = _segment_start(start, span)
+        while segment < end:
+            yield os.path.join(self.path, resolution, f"{segment}.bin")
+            segment += span
+
+    def choose_resolution(self, start: float, end: float, max_points: int = DEFAULT_MAX_POINTS) -> str:
+        """Finest resolution that keeps the range within max_points buckets"""
+        for resolution, seconds in RESOLUTIONS.items():
+            if (end - start) / seconds <= max_points:
+                return resolution
+        return '1h'
+
+    def query(self, target: str, start: float, end: float,
+              resolution: Optional[str] = None, max_points: int = DEFAULT_MAX_POINTS) -> Dict[str, object]:
+        """
+        Read one target's history between two epoch timestamps as columns.
+
+        Without an explicit resolution, a rollup is chosen so the result has
+        at most about max_points rows; pass resolution='raw' for raw samples.
+        """
+        target_id = self._target_ids.get(target)
+        if resolution is None:
+            resolution = self.choose_resolution(start, end, max_points)
+        if resolution != RAW and resolution not in RESOLUTIONS:
+            raise ValueError(f"Unknown resolution '{resolution}'")
+
+        if resolution == RAW:
+            columns = {'t': [], 'latency': [], 'jitter': []}
+            if target_id is not None:
+                for path in self._segments(RAW, start, end):
+                    for timestamp, record_target, rtt, jitter in _iter_records(path, RAW_RECORD, start, end):
+                        if record_target == target_id:
+                            columns['t'].append(timestamp)
+                            columns['latency'].append(None if math.isnan(rtt) else round(rtt, 1))
+                            columns['jitter'].append(round(jitter, 1))
+            return {'target': target, 'resolution': RAW, **columns}
+
+        merged = {}
+        if target_id is not None:
+            # Align to bucket boundaries so the first partial bucket is included
+            aligned = _segment_start(start, RESOLUTIONS[resolution])
+            for path in self._segments(resolution, aligned, end):
+                for record in _iter_records(path, ROLLUP_RECORD, aligned, end):
+                    if record[1] != target_id:
+                        continue
+                    previous = merged.get(record[0])
+                    merged[record[0]] = record if previous is None else _merge_rollups(previous, record)
+
+        fields = ('count', 'lost', 'min', 'max', 'mean') + tuple(f'p{q}' for q in PERCENTILES)
+        columns = {'t': []}
+        columns.update({field: [] for field in fields})
+        for bucket_start in sorted(merged):
+            record = merged[bucket_start]
+            columns['t'].append(bucket_start)
+            for field, value in zip(fields, record[2:]):
+                if isinstance(value, float):
+                    value = None if math.isnan(value) else round(value, 1)
+                columns[field].append(value)
+        return {'target': target, 'resolution': resolution, **columns}
+
+
+def _merge_rollups(a: tuple, b: tuple) -> tuple:
+    """Combine two records for the same bucket, e.g. written on either side of a restart"""
+    count = a[2] + b[2]
+    if not a[2] or not b[2]:
+        values = (b if b[2] else a)[4:]
+    else:
+        mean = (a[6] * a[2] + b[6] * b[2]) / count
+        # Percentiles cannot be merged exactly; weight them by sample count
+        percentiles = tuple((x * a[2] + y * b[2]) / count for x, y in zip(a[7:], b[7:]))
+        values = (min(a[4], b[4]), max(a[5], b[5]), mean) + percentiles
+    return (a[0], a[1], count, a[3] + b[3]) + tuple(values)
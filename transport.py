@@ -0,0 +1,129 @@
+import json
+import logging
+import threading
+import time
+from typing import Callable, Dict, List, Optional
+
+from instrumentation import SERIALIZE, Instrumentation
+
+logger = logging.getLogger("NetworkMonitor.transport")
+
+# Roughly one animation frame at 60 Hz
+DEFAULT_FLUSH_INTERVAL_MS = 16
+# Samples kept while the UI is not draining; older ones are dropped
+DEFAULT_MAX_PENDING = 4096
+
+
+def columnar(samples: List[Dict[str, object]]) -> Dict[str, object]:
+    """
+    Turn a list of sample dicts into one column per scalar field.
+
+    Every key any sample has gets a column, with None where a sample lacks
+    it, so fields only some samples carry (error, stallReason) are kept.
+    List fields (events) are concatenated so none is lost. Nested fields
+    (stats, per-target maps) are only sent for the newest sample that has
+    them, since the UI only ever shows their latest value.
+    """
+    payload = {}
+    keys = dict.fromkeys(key for sample in samples for key in sample)
+    for key in keys:
+        value = next((sample[key] for sample in reversed(samples) if sample.get(key) is not None), None)
+        if isinstance(value, list):
+            payload[key] = [item for sample in samples for item in sample.get(key) or ()]
+        elif isinstance(value, dict):
+            payload[key] = value
+        else:
+            payload[key] = [sample.get(key) for sample in samples]
+    return payload
+
+
+class BatchChannel:
+    """
+    Single push channel from the backend to the UI.
+
+    publish() only appends to a list, so the probe loop never waits on the
+    UI. A flusher thread coalesces pending samples into one columnar batch
+    at most once per flush interval and hands the JSON to the sink. Each
+    batch carries the sequence number of its first sample, so a receiver
+    can spot samples dropped because the pending buffer overflowed.
+    """
+
+    def __init__(self, sink: Callable[[str], None],
+                 flush_interval_ms: float = DEFAULT_FLUSH_INTERVAL_MS,
+                 max_pending: int = DEFAULT_MAX_PENDING,
+                 instruments: Optional[Instrumentation] = None):
+        self.sink = sink
+        self.instruments = instruments
+        self.flush_interval = flush_interval_ms / 1000
+        self.max_pending = max_pending
+        self._pending = []
+        self._lock = threading.Lock()
+        self._has_data = threading.Event()
+        self._stopped = threading.Event()
+        self._thread: Optional[threading.Thread] = None
+        self._next_seq = 0  # Sequence number of the next published sample
+        self._pending_seq = 0  # Sequence number of self._pending[0]
+        self.batches_sent = 0
+        self.samples_dropped = 0
+
+    def publish(self, sample: Dict[str, object]):
+        with self._lock:
+            if not self._pending:
+                self._pending_seq = self._next_seq
+            self._pending.append(sample)
+            self._next_seq += 1
+            if len(self._pending) > self.max_pending:
+                overflow = len(self._pending) - self.max_pending
+                del self._pending[:overflow]
+                self._pending_seq += overflow
+                self.samples_dropped += overflow
+        self._has_data.set()
+
+    def start(self):
+        if self._thread and self._thread.is_alive():
+            return
+        self._stopped.clear()
+        self._thread = threading.Thread(target=self._run, name="BatchChannel", daemon=True)
+        self._thread.start()
+
+    def stop(self, timeout: float = 1.0):
+        self._stopped.set()
+        self._has_data.set()
+        if self._thread and self._thread.is_alive():
+            self._thread.join(timeout=timeout)
+
+    def _run(self):
+        last_flush = 0.0
+        while not self._stopped.is_set():
+            self._has_data.wait()
+            if self._stopped.is_set():
+                break
+            # Let samples accumulate until a full flush interval has passed
+            delay = last_flush + self.flush_interval - time.monotonic()
+            if delay > 0 and self._stopped.wait(delay):
+                break
+            last_flush = time.monotonic()
+            try:
+                self.flush()
+            except Exception as e:
+                # Log and continue, don't crash the thread
+                logger.error(f"Failed to push batch to UI: {e}")
+
+    def flush(self) -> bool:
+        """Send everything pending as one batch; returns False if there was nothing to send"""
+        with self._lock:
+            samples, self._pending = self._pending, []
+            seq = self._pending_seq
+            self._has_data.clear()
+        if not samples:
+            return False
+        start = time.perf_counter()
+        payload = columnar(samples)
+        payload['seq'] = seq
+        payload['count'] = len(samples)
+        encoded = json.dumps(payload, separators=(',', ':'))
+        if self.instruments is not None:
+            self.instruments.observe(SERIALIZE, (time.perf_counter() - start) * 1000)
+        self.sink(encoded)
+        self.batches_sent += 1
+        return True
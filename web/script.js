@@ -1,34 +1,48 @@
 // script.js
 let latencyChart;
-let chartLabels = [];
-let chartData = [];
-let lastLatency = 0;
 let isUpdating = false;
 let lastSpikes = [];
 const spikeHistorySize = 30;
-let latencyValues = [];
-let jitterValues = [];
-let packetLossValues = [];
-const maxHistoryLength = 100;
+// One hour of history at the default 500 ms interval
+const maxHistoryLength = 7200;
 
 let updateInterval = 500;
 let updateIntervalId = null;
-let interpolationIntervalId = null;
-let spikeHistoryIntervalId = null;
+let spikeAgeIntervalId = null;
 let jsReady = false;
 
-// Trend detection configuration
+// Sustained increases reported by the backend's change-point detector
 let latencyTrends = [];
-let previousLatencyValue = null;
-const trendThreshold = 15;
-const sustainedDuration = 1000; // 1 second
-let activeTrend = null;
+const maxLatencyTrends = 10;
 
-let qualityScoreHistory = [];
 let monitoringStartTime = null;
 
 let timeUpdateInterval = null;
 
+// Push transport state: batches from the backend are queued and applied
+// at most once per animation frame
+let pendingBatches = [];
+let batchFrameRequested = false;
+let nextSampleSeq = null;
+let droppedSamples = 0;
+const maxPendingBatches = 600;
+
+// Samples the backend flagged as taken while the monitor itself was stalled;
+// they are shown but kept out of spike and trend detection
+let stalledSamples = 0;
+
+// Debug overlay with the monitor's own timings (Ctrl+Shift+D or ?debug)
+const debugRefreshMs = 1000;
+let debugIntervalId = null;
+
+// Chart rendering: only real samples are drawn, at most once per animation
+// frame, downsampled to about one point per horizontal pixel
+let chartRangeMs = 60 * 1000;
+let chartFrameRequested = false;
+let chartHistory = null; // Older points from the backend store, for ranges beyond the in-memory buffer
+let chartHistoryFetchedAt = 0;
+const chartHistoryRefreshMs = 10000;
+
 let pywebviewReady = false;
 const pywebviewReadyPromise = new Promise((resolve) => {
     // Check if pywebview is already available
@@ -44,86 +58,230 @@ const pywebviewReadyPromise = new Promise((resolve) => {
     }
 });
 
+// Start the backend the moment the bridge exists, without waiting for Chart.js
+// or the dashboard: samples queue on the Python side and the first one is drawn
+// as soon as its batch arrives
+const backendReadyPromise = pywebviewReadyPromise.then(async () => {
+    if (typeof window.pywebview.api.js_ready !== 'function') {
+        console.warn("js_ready function not found in API");
+        return;
+    }
+    try {
+        await window.pywebview.api.js_ready();
+    } catch (err) {
+        console.error("Error calling js_ready:", err);
+    }
+});
+// Without a bridge by then the page runs on mock data
+const bridgeTimeoutMs = 4000;
+
+// Fixed-size ring buffer over a Float64Array. Running sums keep averages,
+// standard deviation and the recency-weighted sum O(1) per sample, and
+// memory stays constant however long the session runs.
+class MetricRing {
+    constructor(capacity) {
+        this.capacity = capacity;
+        this.values = new Float64Array(capacity);
+        this.start = 0; // Absolute index of the oldest value
+        this.length = 0;
+        this.sum = 0;
+        this.sumSquares = 0;
+        this.weightedSum = 0; // Sum of (i + 1) * value, i counted from the oldest value
+    }
+
+    valueAt(index) {
+        return this.values[index % this.capacity];
+    }
+
+    get lastIndex() {
+        return this.start + this.length - 1;
+    }
+
+    push(value) {
+        if (this.length === this.capacity) {
+            const evicted = this.values[this.start % this.capacity];
+            // Every remaining value moves one position closer to the oldest
+            this.weightedSum -= this.sum;
+            this.sum -= evicted;
+            this.sumSquares -= evicted * evicted;
+            this.start++;
+            this.length--;
+        }
+        this.values[(this.start + this.length) % this.capacity] = value;
+        this.length++;
+        this.sum += value;
+        this.sumSquares += value * value;
+        this.weightedSum += this.length * value;
+
+        // Resynchronise once per lap so floating point error cannot accumulate
+        if (this.start > 0 && this.start % this.capacity === 0 && this.length === this.capacity) {
+            this.recompute();
+        }
+    }
+
+    recompute() {
+        this.sum = 0;
+        this.sumSquares = 0;
+        this.weightedSum = 0;
+        for (let i = 0; i < this.length; i++) {
+            const value = this.valueAt(this.start + i);
+            this.sum += value;
+            this.sumSquares += value * value;
+            this.weightedSum += (i + 1) * value;
+        }
+    }
+
+    clear() {
+        this.start = 0;
+        this.length = 0;
+        this.sum = 0;
+        this.sumSquares = 0;
+        this.weightedSum = 0;
+    }
+
+    average() {
+        return this.length ? this.sum / this.length : 0;
+    }
+
+    standardDeviation() {
+        if (!this.length) return 0;
+        const avg = this.average();
+        return Math.sqrt(Math.max(0, this.sumSquares / this.length - avg * avg));
+    }
+
+    // Sum of the newest n values; callers keep n small and constant
+    sumOfLast(n) {
+        const count = Math.min(n, this.length);
+        let total = 0;
+        for (let i = 0; i < count; i++) {
+            total += this.valueAt(this.lastIndex - i);
+        }
+        return total;
+    }
+}
+
+// Sliding-window minimum over a MetricRing, amortised O(1) per sample
+class MonotonicMin {
+    constructor(ring) {
+        this.ring = ring;
+        this.indices = new Float64Array(ring.capacity);
+        this.head = 0;
+        this.size = 0;
+    }
+
+    // Call after every ring.push()
+    update() {
+        const capacity = this.ring.capacity;
+        const index = this.ring.lastIndex;
+        const value = this.ring.valueAt(index);
+        while (this.size > 0 &&
+            this.ring.valueAt(this.indices[(this.head + this.size - 1) % capacity]) >= value) {
+            this.size--;
+        }
+        this.indices[(this.head + this.size) % capacity] = index;
+        this.size++;
+        while (this.indices[this.head] < this.ring.start) {
+            this.head = (this.head + 1) % capacity;
+            this.size--;
+        }
+    }
+
+    min() {
+        return this.size ? this.ring.valueAt(this.indices[this.head]) : Infinity;
+    }
+}
+
+const latencyValues = new MetricRing(maxHistoryLength);
+const jitterValues = new MetricRing(maxHistoryLength);
+const packetLossValues = new MetricRing(maxHistoryLength);
+const qualityScoreHistory = new MetricRing(maxHistoryLength);
+const metricTimestamps = new MetricRing(maxHistoryLength);
+// One day at 1 s, or one hour at 40 ms; longer ranges come from the backend store
+const maxChartSamples = 86400;
+const chartTimes = new MetricRing(maxChartSamples);
+const chartLatencies = new MetricRing(maxChartSamples);
+const latencyMin = new MonotonicMin(latencyValues);
+// Spike impact of every latency sample against the current baseline, kept in
+// lockstep with latencyValues so the recency-weighted total is a running sum
+const spikeImpacts = new MetricRing(maxHistoryLength);
+let spikeBaseline = null;
+
 function updateMetrics(data) {
     const metrics = typeof data === 'string' ? JSON.parse(data) : data;
 
     updateDisplayValues(
         metrics.latency,
         metrics.jitter,
-        metrics.packetLoss
+        metrics.packetLoss,
+        metrics.stats,
+        Boolean(metrics.monitorStall),
+        metrics.timestamp
     );
 
     // Add this line to update card colors
     updateMetricCardColors(metrics.latency);
 }
 
-function updateLatencyTrends(latency) {
-    const now = Date.now();
-
-    const baselineThreshold = 40;
-    const minTrendDuration = 100;
-    const maxTrendDuration = 10000; // Increased to 10 seconds
-    const normalizedThreshold = 60; // Increased to better match typical variations
-    const trendThreshold = 30; // Increased to reduce sensitivity to small changes
-
-    if (previousLatencyValue !== null) {
-        const difference = latency - previousLatencyValue;
-
-        // Start new trend if we see a significant spike and no active trend
-        if (!activeTrend && difference >= trendThreshold) {
-            activeTrend = {
-                startTime: now,
-                startValue: previousLatencyValue,
-                currentValue: latency,
-                peakValue: latency,
-                duration: 0,
-                lastHighValue: now
-            };
-        }
-        // Handle existing trend
-        else if (activeTrend) {
-            // Update peak if we find a higher value
-            if (latency > activeTrend.peakValue) {
-                const oldPeak = activeTrend.peakValue;
-                activeTrend.peakValue = latency;
-                activeTrend.lastHighValue = now;
-            }
+// Called by the backend with one columnar batch: a value array per numeric
+// field, the latest stats, and seq = sequence number of the first sample
+function receiveBatch(data) {
+    const batch = typeof data === 'string' ? JSON.parse(data) : data;
+    pendingBatches.push(batch);
+    if (pendingBatches.length > maxPendingBatches) {
+        // Frames are not running (e.g. minimized); the seq gap records the loss
+        pendingBatches.shift();
+    }
+    if (!batchFrameRequested) {
+        batchFrameRequested = true;
+        requestAnimationFrame(applyPendingBatches);
+    }
+}
 
-            const currentDuration = now - activeTrend.startTime;
-            const timeSinceLastHigh = now - activeTrend.lastHighValue;
-
-            // End trend if:
-            // 1. Latency returns to baseline OR
-            // 2. We've been below normalizedThreshold for 3 seconds OR
-            // 3. Maximum trend duration exceeded AND we're below peak
-            if (latency <= baselineThreshold ||
-                (latency <= normalizedThreshold && timeSinceLastHigh >= 3000) ||
-                (currentDuration >= maxTrendDuration && latency < activeTrend.peakValue * 0.8)) {
-
-                if (currentDuration >= minTrendDuration &&
-                    (activeTrend.peakValue - activeTrend.startValue >= trendThreshold)) {
-
-                    const trend = {
-                        from: Number(activeTrend.startValue.toFixed(1)),
-                        to: Number(activeTrend.peakValue.toFixed(1)),
-                        duration: currentDuration,
-                        timestamp: new Date(activeTrend.startTime)
-                    };
-
-                    latencyTrends.push(trend);
-                    while (latencyTrends.length > 10) {
-                        latencyTrends.shift();
-                    }
+function applyPendingBatches() {
+    batchFrameRequested = false;
+    const batches = pendingBatches;
+    pendingBatches = [];
 
-                    displayLatencyTrends();
-                }
+    batches.forEach(batch => {
+        if (nextSampleSeq !== null && batch.seq > nextSampleSeq) {
+            droppedSamples += batch.seq - nextSampleSeq;
+            console.warn(`Dropped ${batch.seq - nextSampleSeq} sample(s), ${droppedSamples} in total`);
+        }
+        nextSampleSeq = batch.seq + batch.count;
+
+        for (let i = 0; i < batch.count; i++) {
+            const isLatest = i === batch.count - 1;
+            updateMetrics({
+                latency: batch.latency[i],
+                jitter: batch.jitter[i],
+                packetLoss: batch.packetLoss[i],
+                monitorStall: batch.monitorStall ? batch.monitorStall[i] : 0,
+                timestamp: batch.timestamp ? batch.timestamp[i] : undefined,
+                stats: isLatest ? batch.stats : undefined
+            });
+        }
 
-                activeTrend = null;
-            }
+        if (batch.events && batch.events.length && typeof applyDetectorEvents === 'function') {
+            // Cards follow the primary target, whose samples the chart shows
+            const primary = batch.primary[batch.count - 1];
+            applyDetectorEvents(batch.events.filter(event => event.target === primary));
         }
-    }
+    });
+}
+
+window.receiveBatch = receiveBatch;
 
-    previousLatencyValue = latency;
+function addLatencyTrend(event) {
+    latencyTrends.push({
+        from: event.baseline,
+        to: event.peak,
+        duration: event.duration,
+        timestamp: new Date(event.start)
+    });
+    while (latencyTrends.length > maxLatencyTrends) {
+        latencyTrends.shift();
+    }
+    displayLatencyTrends();
 }
 
 function displayLatencyTrends() {
@@ -167,17 +325,42 @@ function displayLatencyTrends() {
     });
 }
 
+function spikeImpactOf(deviation) {
+    // Impact calculation:
+    // - Small spikes (0-20ms): linear impact
+    // - Medium spikes (20-50ms): squared impact
+    // - Large spikes (50ms+): cubic impact
+    if (deviation <= 0) return 0;
+    return deviation < 20 ?
+        deviation * 0.5 :
+        deviation < 50 ?
+            Math.pow(deviation, 1.5) * 0.1 :
+            Math.pow(deviation, 2) * 0.05;
+}
+
+function updateSpikeImpacts(latency) {
+    const baseline = latencyMin.min();
+    if (baseline !== spikeBaseline) {
+        // The baseline only moves on a new minimum or when the old one ages
+        // out, so a full rebuild is rare; otherwise this is a single push
+        spikeBaseline = baseline;
+        spikeImpacts.clear();
+        for (let i = 0; i < latencyValues.length; i++) {
+            spikeImpacts.push(spikeImpactOf(latencyValues.valueAt(latencyValues.start + i) - baseline));
+        }
+    } else {
+        spikeImpacts.push(spikeImpactOf(latency - baseline));
+    }
+}
+
+// Expects latencyValues/packetLossValues to already include this sample
 function calculateQualityScore(latency, jitter, packetLoss) {
     // Convert inputs to numbers
     latency = Number(latency);
     jitter = Number(jitter);
     packetLoss = Number(packetLoss);
 
-    // Initialize timestamp tracking if not exists
-    if (!window.metricTimestamps) {
-        window.metricTimestamps = [];
-    }
-    window.metricTimestamps.push(Date.now());
+    metricTimestamps.push(Date.now());
 
     const scores = {
         currentLatency: 0,
@@ -189,74 +372,38 @@ function calculateQualityScore(latency, jitter, packetLoss) {
     // 1. Current Latency Score (25% weight)
     scores.currentLatency = Math.max(0, Math.min(100, (100 - latency) / 0.8));
 
+    const count = latencyValues.length;
+
     // 2. Historical Performance (25% weight)
-    if (latencyValues.length > 0) {
-        const weightedSum = latencyValues.reduce((sum, value, index) => {
-            const weight = (index + 1) / latencyValues.length;
-            return sum + (value * weight);
-        }, 0);
-        const weightedAvg = weightedSum / (latencyValues.length + 1) * 2;
+    if (count > 0) {
+        // Each value weighted by (index + 1) / count, newest highest
+        const weightedSum = latencyValues.weightedSum / count;
+        const weightedAvg = weightedSum / (count + 1) * 2;
         scores.historicalPerformance = Math.max(0, Math.min(100, (100 - weightedAvg) / 0.8));
     }
 
     // 3. Spike Analysis (30% weight)
-    const baselineLatency = Math.min(...latencyValues, latency);
-
-    let spikeImpact = 0;
-    let spikeCounts = { small: 0, medium: 0, large: 0 };
-
-    if (latencyValues.length > 0) {
-        latencyValues.forEach((value, index) => {
-            const deviation = value - baselineLatency;
-            if (deviation > 0) {
-                // Weight based on how recent and how severe
-                const recency = (index + 1) / latencyValues.length;
-
-                // Categorize spike
-                if (deviation >= 50) spikeCounts.large++;
-                else if (deviation >= 20) spikeCounts.medium++;
-                else spikeCounts.small++;
-
-                // Impact calculation:
-                // - Small spikes (0-20ms): linear impact
-                // - Medium spikes (20-50ms): squared impact
-                // - Large spikes (50ms+): cubic impact
-                const impact = deviation < 20 ?
-                    deviation * 0.5 :
-                    deviation < 50 ?
-                        Math.pow(deviation, 1.5) * 0.1 :
-                        Math.pow(deviation, 2) * 0.05;
-
-                spikeImpact += impact * recency;
-            }
-        });
-
-        // Current value impact
-        const currentDeviation = latency - baselineLatency;
-        if (currentDeviation > 0) {
-            const currentImpact = currentDeviation < 20 ?
-                currentDeviation * 0.5 :
-                currentDeviation < 50 ?
-                    Math.pow(currentDeviation, 1.5) * 0.1 :
-                    Math.pow(currentDeviation, 2) * 0.05;
-            spikeImpact += currentImpact * 2; // Double impact for current value
-
-            if (currentDeviation >= 50) spikeCounts.large++;
-            else if (currentDeviation >= 20) spikeCounts.medium++;
-            else spikeCounts.small++;
-        }
+    if (count > 0) {
+        const baselineLatency = Math.min(latencyMin.min(), latency);
+        // Weight based on how recent and how severe
+        let spikeImpact = spikeImpacts.weightedSum / count;
+        // Double impact for current value
+        spikeImpact += spikeImpactOf(latency - baselineLatency) * 2;
 
         scores.spikes = Math.max(0, 100 - (spikeImpact / 1000));
     }
 
     // 4. Packet Loss Score (20% weight)
     let weightedPacketLossScore = 100;
-    if (packetLossValues.length > 0) {
-        const recentLosses = packetLossValues.slice(-10);
-        const historicalLosses = packetLossValues.slice(0, -10);
+    const lossCount = packetLossValues.length;
+    if (lossCount > 0) {
+        const recentCount = Math.min(10, lossCount);
+        const recentSum = packetLossValues.sumOfLast(recentCount);
+        const historicalCount = lossCount - recentCount;
 
-        const recentLossAvg = average(recentLosses) * 1.5;
-        const historicalLossAvg = average(historicalLosses);
+        const recentLossAvg = recentSum / recentCount * 1.5;
+        const historicalLossAvg = historicalCount ?
+            (packetLossValues.sum - recentSum) / historicalCount : 0;
 
         const combinedLossImpact = (recentLossAvg + historicalLossAvg) / 2;
         weightedPacketLossScore = Math.max(0, 100 - (combinedLossImpact * 20));
@@ -282,39 +429,29 @@ function calculateQualityScore(latency, jitter, packetLoss) {
     return finalScore;
 }
 
-// Helper function for averaging
-function average(arr) {
-    return arr.length ? arr.reduce((a, b) => a + b, 0) / arr.length : 0;
-}
-
-function updateMetricHistory(array, value) {
+function updateMetricHistory(ring, value) {
     const numValue = Number(value);
     if (!isNaN(numValue)) {
-        array.push(numValue);
-        // Removed this if block since we want to keep all values
-        // if (array.length > maxHistoryLength) {
-        //     array.shift();
-        // }
-    } else {
-        console.warn(`Invalid value received: ${value}`);
+        ring.push(numValue);
+        return true;
     }
+    console.warn(`Invalid value received: ${value}`);
+    return false;
 }
 
 
-function updateAverage(metric, values, unit) {
-    if (!values || values.length === 0) {
+function updateAverage(metric, ring, unit) {
+    if (!ring || ring.length === 0) {
         console.warn(`No values available for ${metric}`);
         return;
     }
 
-    const validValues = values.filter(v => !isNaN(v));
-    if (validValues.length === 0) {
-        console.warn(`No valid numbers for ${metric}`);
-        return;
-    }
+    displayAverage(metric, ring.average(), unit);
+}
 
-    const avg = validValues.reduce((a, b) => a + b, 0) / validValues.length;
-    const formattedAvg = avg.toFixed(1);
+function displayAverage(metric, avg, unit) {
+    if (avg === null || avg === undefined || isNaN(avg)) return;
+    const formattedAvg = Number(avg).toFixed(1);
 
     const avgElement = document.querySelector(`.metric-${metric} .metric-avg`);
     if (avgElement) {
@@ -361,8 +498,10 @@ function getElapsedTimeText() {
     }
 }
 
-function updateDisplayValues(latency, jitter, packetLoss) {
-    if (!jsReady) return;
+// Runs before the dashboard has initialised too: the first samples fill the
+// cards and chart buffers, and are drawn once the chart exists
+function updateDisplayValues(latency, jitter, packetLoss, stats, stalled = false, timestamp = Date.now()) {
+    if (stalled) stalledSamples++;
 
     // Update basic metrics
     document.getElementById('latency').innerText = latency;
@@ -370,7 +509,10 @@ function updateDisplayValues(latency, jitter, packetLoss) {
     document.getElementById('packetLoss').innerText = packetLoss;
 
     // Update history arrays first, so they're available for quality score calculation
-    updateMetricHistory(latencyValues, latency);
+    if (updateMetricHistory(latencyValues, latency)) {
+        latencyMin.update();
+        updateSpikeImpacts(Number(latency));
+    }
     updateMetricHistory(jitterValues, jitter);
     updateMetricHistory(packetLossValues, packetLoss);
 
@@ -396,10 +538,16 @@ function updateDisplayValues(latency, jitter, packetLoss) {
         else qualityCard.classList.add('poor');
     }
 
-    // Update averages using your existing updateAverage function
-    updateAverage('latency', latencyValues, 'ms');
-    updateAverage('jitter', jitterValues, 'ms');
-    updateAverage('packetloss', packetLossValues, '%');
+    // Update averages, using the backend's running statistics when it sends them
+    if (stats) {
+        displayAverage('latency', stats.mean, 'ms');
+        displayAverage('jitter', stats.jitterMean, 'ms');
+        displayAverage('packetloss', stats.packetLoss, '%');
+    } else {
+        updateAverage('latency', latencyValues, 'ms');
+        updateAverage('jitter', jitterValues, 'ms');
+        updateAverage('packetloss', packetLossValues, '%');
+    }
     updateAverage('quality', qualityScoreHistory, '');
 
     // Show history size in UI if needed
@@ -408,20 +556,15 @@ function updateDisplayValues(latency, jitter, packetLoss) {
         historyCountElement.innerText = latencyValues.length;
     }
 
-    lastLatency = latency;
-    if (typeof updateGraph === 'function') {
-        updateGraph(latency, false);
-    }
-
-    updateLatencyTrends(latency);
+    updateGraph(latency, timestamp);
 }
 
 // Optional: Add stability calculation function
 function calculateStability() {
     if (latencyValues.length < 10) return "Insufficient data";
 
-    const latencyStdDev = calculateStandardDeviation(latencyValues);
-    const jitterStdDev = calculateStandardDeviation(jitterValues);
+    const latencyStdDev = latencyValues.standardDeviation();
+    const jitterStdDev = jitterValues.standardDeviation();
 
     // Combined stability score (lower is more stable)
     const stabilityScore = (latencyStdDev + jitterStdDev) / 2;
@@ -432,16 +575,6 @@ function calculateStability() {
     return "Unstable";
 }
 
-function calculateStandardDeviation(values) {
-    const avg = values.reduce((sum, val) => sum + val, 0) / values.length;
-    const squareDiffs = values.map(value => {
-        const diff = value - avg;
-        return diff * diff;
-    });
-    const avgSquareDiff = squareDiffs.reduce((sum, val) => sum + val, 0) / squareDiffs.length;
-    return Math.sqrt(avgSquareDiff);
-}
-
 function updateMetricCardColors(latency) {
     const metricCards = document.querySelectorAll('.metric-card');
 
@@ -471,6 +604,238 @@ window.updateDisplayValues = updateDisplayValues;
 
 let isMaximized = false;
 
+function formatClock(time) {
+    const date = new Date(time);
+    return date.getHours().toString().padStart(2, '0') + ':' +
+        date.getMinutes().toString().padStart(2, '0') + ':' +
+        date.getSeconds().toString().padStart(2, '0');
+}
+
+// Newest n values of a ring, oldest first
+function lastValues(ring, n) {
+    const count = Math.min(n, ring.length);
+    const values = new Array(count);
+    for (let i = 0; i < count; i++) {
+        values[i] = ring.valueAt(ring.lastIndex - count + 1 + i);
+    }
+    return values;
+}
+
+// Absolute index of the first value >= target in a ring of ascending values
+function lowerBound(ring, target) {
+    let low = ring.start;
+    let high = ring.start + ring.length;
+    while (low < high) {
+        const mid = (low + high) >>> 1;
+        if (ring.valueAt(mid) < target) low = mid + 1;
+        else high = mid;
+    }
+    return low;
+}
+
+// Largest-Triangle-Three-Buckets: keeps the points that preserve the visual
+// shape of the series, spikes included, in O(n)
+function lttb(xs, ys, threshold) {
+    const length = xs.length;
+    if (threshold >= length || threshold < 3) {
+        return Array.from(xs, (x, i) => ({ x, y: ys[i] }));
+    }
+    const points = [{ x: xs[0], y: ys[0] }];
+    const bucketSize = (length - 2) / (threshold - 2);
+    let selected = 0;
+    for (let bucket = 0; bucket < threshold - 2; bucket++) {
+        // Average of the next bucket is the third triangle corner
+        const nextStart = Math.floor((bucket + 1) * bucketSize) + 1;
+        const nextEnd = Math.min(Math.floor((bucket + 2) * bucketSize) + 1, length);
+        let avgX = 0;
+        let avgY = 0;
+        for (let i = nextStart; i < nextEnd; i++) {
+            avgX += xs[i];
+            avgY += ys[i];
+        }
+        avgX /= nextEnd - nextStart;
+        avgY /= nextEnd - nextStart;
+
+        const start = Math.floor(bucket * bucketSize) + 1;
+        const end = Math.floor((bucket + 1) * bucketSize) + 1;
+        const ax = xs[selected];
+        const ay = ys[selected];
+        let maxArea = -1;
+        for (let i = start; i < end; i++) {
+            const area = Math.abs((ax - avgX) * (ys[i] - ay) - (ax - xs[i]) * (avgY - ay));
+            if (area > maxArea) {
+                maxArea = area;
+                selected = i;
+            }
+        }
+        points.push({ x: xs[selected], y: ys[selected] });
+    }
+    points.push({ x: xs[length - 1], y: ys[length - 1] });
+    return points;
+}
+
+function updateGraph(latency, timestamp = Date.now()) {
+    const value = Number(latency);
+    if (isNaN(value)) return;
+    // Batches can arrive out of step with the clock; keep times ascending
+    const lastTime = chartTimes.length ? chartTimes.valueAt(chartTimes.lastIndex) : -Infinity;
+    chartTimes.push(Math.max(timestamp, lastTime));
+    chartLatencies.push(value);
+    scheduleChartRender();
+}
+
+function scheduleChartRender() {
+    if (!chartFrameRequested) {
+        chartFrameRequested = true;
+        requestAnimationFrame(renderChart);
+    }
+}
+
+function renderChart() {
+    chartFrameRequested = false;
+    if (!latencyChart) return;
+
+    const end = chartTimes.length ? chartTimes.valueAt(chartTimes.lastIndex) : Date.now();
+    const start = end - chartRangeMs;
+    const xs = [];
+    const ys = [];
+
+    // Stored history fills whatever the in-memory buffer does not cover
+    const bufferStart = chartTimes.length ? chartTimes.valueAt(chartTimes.start) : end;
+    if (chartHistory && start < bufferStart) {
+        for (let i = 0; i < chartHistory.times.length; i++) {
+            const time = chartHistory.times[i];
+            if (time >= start && time < bufferStart) {
+                xs.push(time);
+                ys.push(chartHistory.values[i]);
+            }
+        }
+    }
+    for (let i = lowerBound(chartTimes, start); i <= chartTimes.lastIndex; i++) {
+        xs.push(chartTimes.valueAt(i));
+        ys.push(chartLatencies.valueAt(i));
+    }
+
+    const area = latencyChart.chartArea;
+    const pixels = area ? Math.round(area.right - area.left) : latencyChart.width;
+    latencyChart.data.datasets[0].data = lttb(xs, ys, Math.max(3, pixels));
+    latencyChart.options.scales.x.min = start;
+    latencyChart.options.scales.x.max = end;
+    latencyChart.update('none');
+
+    if (start < bufferStart && Date.now() - chartHistoryFetchedAt > chartHistoryRefreshMs) {
+        fetchChartHistory(pixels);
+    }
+}
+
+// Load the part of the selected range that is older than the in-memory buffer
+async function fetchChartHistory(maxPoints) {
+    chartHistoryFetchedAt = Date.now();
+    if (!window.pywebview || !window.pywebview.api ||
+        typeof window.pywebview.api.get_history !== 'function') {
+        return;
+    }
+    try {
+        const history = JSON.parse(await window.pywebview.api.get_history(chartRangeMs / 1000, null, maxPoints));
+        if (!history.success) return;
+        const times = [];
+        const values = [];
+        for (let i = 0; i < history.t.length; i++) {
+            const time = history.t[i] * 1000;
+            if (history.resolution === 'raw') {
+                if (history.latency[i] === null) continue;
+                times.push(time);
+                values.push(history.latency[i]);
+            } else if (history.min[i] !== null) {
+                // Min and max of each rollup bucket, so spikes survive aggregation
+                times.push(time, time + 1);
+                values.push(history.min[i], history.max[i]);
+            }
+        }
+        chartHistory = { times, values };
+        scheduleChartRender();
+    } catch (error) {
+        console.error('Error fetching chart history:', error);
+    }
+}
+
+function setChartRange(rangeMs) {
+    chartRangeMs = rangeMs;
+    chartHistory = null;
+    chartHistoryFetchedAt = 0;
+    scheduleChartRender();
+}
+
+function formatTiming(value) {
+    return value === null || value === undefined ? '--' : value.toFixed(2);
+}
+
+// Per-hop latency and loss to the primary target, when path probing is on
+async function renderPathTable() {
+    if (typeof window.pywebview.api.get_path !== 'function') {
+        return '';
+    }
+    const path = JSON.parse(await window.pywebview.api.get_path());
+    if (!path.success) {
+        return '';
+    }
+    const rows = path.hops.map(hop =>
+        `<tr><td>${hop.ttl}</td><td>${hop.address || '???'}</td><td>${hop.packetLoss}%</td>` +
+        `<td>${formatTiming(hop.last)}</td><td>${formatTiming(hop.mean)}</td><td>${formatTiming(hop.max)}</td></tr>`
+    ).join('');
+    return `<table><thead><tr><th>hop</th><th>${path.target}</th><th>loss</th><th>last</th><th>avg</th>` +
+        `<th>max</th></tr></thead><tbody>${rows}</tbody></table>`;
+}
+
+async function refreshDebugOverlay() {
+    const overlay = document.getElementById('debugOverlay');
+    if (!overlay || !window.pywebview || !window.pywebview.api ||
+        typeof window.pywebview.api.get_instrumentation !== 'function') {
+        return;
+    }
+    try {
+        const data = JSON.parse(await window.pywebview.api.get_instrumentation());
+        const rows = Object.entries(data.timers).map(([name, timer]) =>
+            `<tr><td>${name}</td><td>${formatTiming(timer.last)}</td><td>${formatTiming(timer.p50)}</td>` +
+            `<td>${formatTiming(timer.p99)}</td><td>${formatTiming(timer.max)}</td></tr>`
+        ).join('');
+        const counters = Object.entries(data.counters)
+            .map(([name, value]) => `${name}: ${value}`)
+            .concat([`stalled_shown: ${stalledSamples}`, `dropped_in_ui: ${droppedSamples}`])
+            .join(' &middot; ');
+        overlay.innerHTML =
+            `<table><thead><tr><th>ms</th><th>last</th><th>p50</th><th>p99</th><th>max</th></tr></thead>` +
+            `<tbody>${rows}</tbody></table>` +
+            `<div class="debug-counters">${counters}</div>` +
+            `<div class="debug-counters">stall threshold: ${data.stallThresholdMs} ms</div>` +
+            await renderPathTable();
+    } catch (error) {
+        console.error('Error fetching instrumentation:', error);
+    }
+}
+
+function toggleDebugOverlay(show) {
+    const overlay = document.getElementById('debugOverlay');
+    if (!overlay) return;
+    const visible = show === undefined ? overlay.classList.contains('hidden') : show;
+    overlay.classList.toggle('hidden', !visible);
+    if (debugIntervalId) {
+        clearInterval(debugIntervalId);
+        debugIntervalId = null;
+    }
+    if (visible) {
+        refreshDebugOverlay();
+        debugIntervalId = setInterval(refreshDebugOverlay, debugRefreshMs);
+    }
+}
+
+document.addEventListener('keydown', (e) => {
+    if (e.ctrlKey && e.shiftKey && (e.key === 'D' || e.key === 'd')) {
+        e.preventDefault();
+        toggleDebugOverlay();
+    }
+});
+
 function minimizeWindow() {
     pywebview.api.minimize_window();
 }
@@ -496,31 +861,13 @@ document.addEventListener('DOMContentLoaded', async () => {
         const latencyCtx = document.getElementById('latencyGraph').getContext('2d');
         monitoringStartTime = new Date();
 
-        // Initialize chart data
-        const visiblePoints = 50;
-        const paddingPoints = 10;
-        const totalPoints = visiblePoints + paddingPoints;
-
-        // Pre-fill arrays with timestamps and values including padding
-        const now = new Date();
-        for (let i = 0; i < totalPoints; i++) {
-            const time = new Date(now - (totalPoints - i) * 200);
-            chartLabels.push(
-                time.getHours().toString().padStart(2, '0') + ':' +
-                time.getMinutes().toString().padStart(2, '0') + ':' +
-                time.getSeconds().toString().padStart(2, '0')
-            );
-            chartData.push(0);
-        }
-
         // Initialize chart configuration...
         latencyChart = new Chart(latencyCtx, {
             type: 'line',
             data: {
-                labels: chartLabels,
                 datasets: [{
                     label: 'Latency (ms)',
-                    data: chartData,
+                    data: [],
                     borderColor: '#61afef',
                     borderWidth: 2,
                     fill: true,
@@ -533,6 +880,9 @@ document.addEventListener('DOMContentLoaded', async () => {
             options: {
                 maintainAspectRatio: false,
                 responsive: true,
+                // Points are pre-sorted {x, y} objects in milliseconds
+                parsing: false,
+                normalized: true,
                 plugins: {
                     legend: {
                         display: false
@@ -562,7 +912,7 @@ document.addEventListener('DOMContentLoaded', async () => {
                         displayColors: false,
                         callbacks: {
                             title: function (tooltipItems) {
-                                return tooltipItems[0].label;
+                                return formatClock(tooltipItems[0].parsed.x);
                             },
                             label: function (context) {
                                 return `Latency: ${context.parsed.y.toFixed(1)} ms`;
@@ -584,161 +934,91 @@ document.addEventListener('DOMContentLoaded', async () => {
                         }
                     },
                     x: {
-                        min: paddingPoints,
-                        max: totalPoints - 1,
+                        type: 'linear',
                         grid: {
                             display: false
                         },
                         ticks: {
                             maxTicksLimit: 8,
                             maxRotation: 0,
-                            callback: function (value, index) {
-                                if (index >= paddingPoints && index < totalPoints - paddingPoints) {
-                                    return this.getLabelForValue(value);
-                                }
-                                return '';
+                            callback: function (value) {
+                                return formatClock(value);
                             }
                         }
                     }
                 },
-                animation: {
-                    duration: 100,
-                    easing: 'linear'
-                }
+                // Redrawn once per frame from renderChart; animating would redraw again
+                animation: false
             }
         });
+        // Samples that arrived while Chart.js was loading are already buffered
+        scheduleChartRender();
+
+        // Check if we're in "mock" mode (no Python backend pushing batches)
+        function isMockMode() {
+            return !window.pywebview || !window.pywebview.api;
+        }
 
-        async function updateData() {
+        function updateData() {
             if (!jsReady || isUpdating) return;
             isUpdating = true;
 
             try {
-                // Check if we're in "mock" mode (no Python backend)
-                const isMockMode = !window.pywebview ||
-                    !window.pywebview.api ||
-                    typeof window.pywebview.api.get_ping_data !== 'function';
-
-                if (isMockMode) {
-                    // Generate mock data for testing the UI
-                    const mockData = {
-                        latency: Math.round((Math.random() * 20 + 20) * 10) / 10,
-                        jitter: Math.round((Math.random() * 5 + 1) * 10) / 10,
-                        packetLoss: Math.round(Math.random() * 20) / 10
-                    };
-                    updateDisplayValues(mockData.latency, mockData.jitter, mockData.packetLoss);
-                    lastLatency = mockData.latency;
-                    await updateGraph(mockData.latency, false);
-                } else {
-                    // Real API mode
-                    const pingDataStr = await window.pywebview.api.get_ping_data();
-                    const pingData = JSON.parse(pingDataStr);
-                    updateDisplayValues(pingData.latency, pingData.jitter, pingData.packetLoss);
-                    lastLatency = pingData.latency;
-                    await updateGraph(pingData.latency, false);
-                }
+                // Generate mock data for testing the UI
+                const mockData = {
+                    latency: Math.round((Math.random() * 20 + 20) * 10) / 10,
+                    jitter: Math.round((Math.random() * 5 + 1) * 10) / 10,
+                    packetLoss: Math.round(Math.random() * 20) / 10
+                };
+                updateDisplayValues(mockData.latency, mockData.jitter, mockData.packetLoss);
             } catch (error) {
-                console.error('Error fetching data:', error);
+                console.error('Error generating mock data:', error);
             } finally {
                 isUpdating = false;
             }
         }
 
-        function interpolateLatency() {
-            if (!isUpdating && lastLatency !== 0) {
-                const variation = (Math.random() - 0.5) * 2;
-                const interpolatedValue = lastLatency + variation;
-                updateGraph(interpolatedValue, true);
-            }
-        }
-
-        function updateGraph(latency, isInterpolated) {
-            const now = new Date();
-            const time = now.getHours().toString().padStart(2, '0') + ':' +
-                now.getMinutes().toString().padStart(2, '0') + ':' +
-                now.getSeconds().toString().padStart(2, '0');
-
-            chartLabels.shift();
-            chartData.shift();
-            chartLabels.push(time);
-            chartData.push(latency);
-
-            latencyChart.update(isInterpolated ? 'none' : 'default');
-
-            updateLastSpikes(latency);
-        }
-
-        let previousLatency = 0;
-
-        // Track the current spike event
-        let activeSpike = null;
-        const SPIKE_COOLDOWN = 5000; // 5 seconds minimum between new spike recordings
-        const SPIKE_UPDATE_THRESHOLD = 1.1; // 10% increase needed to update existing spike
-        const MINIMUM_SPIKE_VALUE = 45; // Absolute minimum value to be considered a spike
-        const WARMUP_SAMPLES = 10; // Number of samples needed before detecting spikes
-
-        function updateLastSpikes(latency) {
-            const baselineThreshold = 30;  // Normal latency threshold
-            const spikeThreshold = 1.8;    // Multiplier for spike detection
-
-            // Wait for enough samples before starting spike detection
-            if (chartData.filter(v => v > 0).length < WARMUP_SAMPLES) {
-                return;
-            }
-
-            // Calculate moving average for baseline (last 10 values)
-            const recentValues = chartData.slice(-10).filter(v => v > 0);
-            if (recentValues.length === 0) return;
-
-            const baselineLatency = recentValues.reduce((sum, val) => sum + val, 0) / recentValues.length;
-
-            const now = new Date();
-            // Add minimum value check to spike detection
-            const isSpike = (latency > baselineLatency * spikeThreshold || latency > baselineThreshold * 2)
-                && latency >= MINIMUM_SPIKE_VALUE;
-
-            // Handle active spike event
-            if (activeSpike) {
-                // Update active spike if we find a higher value
-                if (latency > activeSpike.value * SPIKE_UPDATE_THRESHOLD) {
-                    activeSpike.value = latency;
-                    activeSpike.history = chartData.slice(-spikeHistorySize);
-                    activeSpike.timestamp = now;
-                    displayLastSpikes();
-                }
-
-                // End active spike if latency returns near baseline
-                if (latency <= baselineLatency * 1.2) {
-                    activeSpike = null;
-                }
-                // Or if it's been too long since the spike started
-                else if (now - activeSpike.timestamp > SPIKE_COOLDOWN) {
-                    activeSpike = null;
+        // Spike events from the backend detector, by event id, for updates and ends
+        const spikesById = new Map();
+
+        function applySpikeEvent(event) {
+            let spike = spikesById.get(event.id);
+            if (!spike) {
+                spike = { id: event.id, target: event.target, active: true };
+                spikesById.set(event.id, spike);
+                lastSpikes.unshift(spike);
+                if (lastSpikes.length > 30) {
+                    spikesById.delete(lastSpikes.pop().id);
                 }
             }
-            // Start new spike event
-            else if (isSpike) {
-                // Check if enough time has passed since last spike
-                const lastSpike = lastSpikes[0];
-                if (!lastSpike || now - lastSpike.timestamp > SPIKE_COOLDOWN) {
-                    activeSpike = {
-                        value: latency,
-                        baseline: baselineLatency,
-                        history: chartData.slice(-spikeHistorySize),
-                        timestamp: now
-                    };
-
-                    lastSpikes.unshift(activeSpike);
-                    if (lastSpikes.length > 30) {
-                        lastSpikes.pop();
-                    }
+            spike.value = event.peak;
+            spike.baseline = event.baseline;
+            spike.timestamp = new Date(event.peakTime);
+            // Also when only the end arrived (dropped batch, or a window attached mid-spike)
+            if (event.state !== 'end' || !spike.history) {
+                spike.history = lastValues(chartLatencies, spikeHistorySize);
+            }
+            spike.active = event.state !== 'end';
+        }
 
-                    displayLastSpikes();
+        function applyDetectorEvents(events) {
+            let spikesChanged = false;
+            events.forEach(event => {
+                if (event.kind === 'spike') {
+                    applySpikeEvent(event);
+                    spikesChanged = true;
+                } else if (event.kind === 'trend' && event.state === 'end') {
+                    addLatencyTrend(event);
                 }
+            });
+            if (spikesChanged) {
+                displayLastSpikes();
             }
-
-            previousLatency = latency;
         }
 
+        // applyPendingBatches hands every batch's events to this hook
+        window.applyDetectorEvents = applyDetectorEvents;
+
         // Helper function to get formatted duration
         function getSpikeDuration(timestamp) {
             const now = new Date();
@@ -748,23 +1028,13 @@ document.addEventListener('DOMContentLoaded', async () => {
             return `${Math.floor(duration / 60000)}m ago`;
         }
 
-        function updateSpikeHistory(latency) {
-            if (lastSpikes.length > 0) {
-                // Only update the most recent spike
-                const mostRecentSpike = lastSpikes[lastSpikes.length - 1];
-                mostRecentSpike.history.push(latency);
-                if (mostRecentSpike.history.length > spikeHistorySize) {
-                    mostRecentSpike.history.shift();
-                }
-            }
-        }
-
         function createSparkline(canvas, data) {
             const ctx = canvas.getContext('2d');
             const width = canvas.width;
             const height = canvas.height;
 
             ctx.clearRect(0, 0, width, height);
+            if (!data || data.length === 0) return;
 
             const maxValue = Math.max(...data);
             const minValue = Math.min(...data);
@@ -831,6 +1101,7 @@ document.addEventListener('DOMContentLoaded', async () => {
             lastSpikes.forEach((spike) => {
                 const spikeCard = document.createElement('div');
                 spikeCard.classList.add('spike-card');
+                spikeCard.title = `${spike.target}: ${spike.baseline.toFixed(1)} ms baseline`;
 
                 if (spike.value < 40) {
                     spikeCard.classList.add('low');
@@ -857,12 +1128,13 @@ document.addEventListener('DOMContentLoaded', async () => {
 
                 const timeText = document.createElement('span');
                 timeText.textContent = getSpikeDuration(spike.timestamp);
+                spike.ageElement = timeText;
                 timeIndicator.appendChild(timeText);
 
                 valueContainer.appendChild(timeIndicator);
 
                 // Show if this is an active spike
-                if (spike === activeSpike) {
+                if (spike.active) {
                     const activeIndicator = document.createElement('div');
                     activeIndicator.classList.add('active-indicator');
                     activeIndicator.textContent = '● Active';
@@ -886,9 +1158,13 @@ document.addEventListener('DOMContentLoaded', async () => {
             });
         }
 
-        function updateAllSpikeHistories(latency) {
-            updateSpikeHistory(latency);
-            displayLastSpikes();
+        // Histories come from the detector's events; between them only the ages change
+        function updateSpikeAges() {
+            lastSpikes.forEach(spike => {
+                if (spike.ageElement) {
+                    spike.ageElement.textContent = getSpikeDuration(spike.timestamp);
+                }
+            });
         }
 
 
@@ -898,10 +1174,14 @@ document.addEventListener('DOMContentLoaded', async () => {
         const closeButton = document.getElementById('closeSettings');
         const saveButton = document.getElementById('saveSettings');
         const intervalInput = document.getElementById('pingInterval');
+        const rangeSelect = document.getElementById('chartRange');
+
+        rangeSelect.addEventListener('change', () => setChartRange(Number(rangeSelect.value)));
 
         function openModal() {
             modal.classList.add('show');
             intervalInput.value = updateInterval;
+            rangeSelect.value = chartRangeMs;
         }
 
         function closeModal() {
@@ -914,7 +1194,7 @@ document.addEventListener('DOMContentLoaded', async () => {
             const spinner = saveButton.querySelector('.spinner');
             const newInterval = Number(intervalInput.value);
 
-            if (newInterval >= 100 && newInterval <= 2000) {
+            if (newInterval >= 10 && newInterval <= 2000) {
                 try {
                     // Check if pywebview is available
                     if (typeof window.pywebview === 'undefined') {
@@ -948,7 +1228,7 @@ document.addEventListener('DOMContentLoaded', async () => {
                     spinner.classList.add('hidden');
                 }
             } else {
-                alert('Please enter a value between 100 and 2000 milliseconds');
+                alert('Please enter a value between 10 and 2000 milliseconds');
             }
         }
 
@@ -957,28 +1237,21 @@ document.addEventListener('DOMContentLoaded', async () => {
             if (updateIntervalId) {
                 clearInterval(updateIntervalId);
             }
-            if (interpolationIntervalId) {
-                clearInterval(interpolationIntervalId);
-            }
-            if (spikeHistoryIntervalId) {
-                clearInterval(spikeHistoryIntervalId);
+            if (spikeAgeIntervalId) {
+                clearInterval(spikeAgeIntervalId);
             }
             if (timeUpdateInterval) {
                 clearInterval(timeUpdateInterval);
             }
 
-            // Start new intervals with updated timing
-            updateIntervalId = setInterval(() => {
-                updateData();
-            }, updateInterval);
-
-            interpolationIntervalId = setInterval(() => {
-                interpolateLatency();
-            }, updateInterval / 4);
+            // Real data is pushed by the backend; only poll in mock mode
+            if (isMockMode()) {
+                updateIntervalId = setInterval(() => {
+                    updateData();
+                }, updateInterval);
+            }
 
-            spikeHistoryIntervalId = setInterval(() => {
-                updateAllSpikeHistories(lastLatency);
-            }, updateInterval);
+            spikeAgeIntervalId = setInterval(updateSpikeAges, 1000);
 
             // Add the time update interval
             timeUpdateInterval = setInterval(() => {
@@ -1002,47 +1275,22 @@ document.addEventListener('DOMContentLoaded', async () => {
         jsReady = true;
         console.log("JS components initialized, setting jsReady = true");
 
-        // Now wait for pywebview with a timeout to prevent infinite waiting
-        let attempts = 0;
-        const maxAttempts = 20;
-
-        const waitForPywebview = async () => {
-            if (window.pywebview && window.pywebview.api) {
-                console.log("PyWebView detected, checking API functions...");
-
-                // Debug: List available API methods
-                const apiMethods = Object.getOwnPropertyNames(window.pywebview.api)
-                    .filter(prop => typeof window.pywebview.api[prop] === 'function');
-                console.log("Available API methods:", apiMethods);
-
-                // Check if our expected functions are available
-                const hasJsReady = typeof window.pywebview.api.js_ready === 'function';
-
-                if (hasJsReady) {
-                    try {
-                        await window.pywebview.api.js_ready();
-                    } catch (err) {
-                        console.error("Error calling js_ready:", err);
-                    }
-                } else {
-                    console.warn("js_ready function not found in API");
-                }
-
-                pywebviewReady = true;
-                restartIntervals();
-            } else if (attempts < maxAttempts) {
-                attempts++;
-                console.log(`Waiting for PyWebView API... (${attempts}/${maxAttempts})`);
-                setTimeout(waitForPywebview, 200);
-            } else {
-                console.error("PyWebView not available after maximum attempts");
-                restartIntervals();
-            }
-        };
-
-        // Start the waiting process
-        waitForPywebview();
+        if (new URLSearchParams(window.location.search).has('debug')) {
+            pywebviewReadyPromise.then(() => toggleDebugOverlay(true));
+        }
 
+        // Wait for the bridge event rather than polling for it
+        const bridgeUp = await Promise.race([
+            backendReadyPromise.then(() => true),
+            new Promise(resolve => setTimeout(() => resolve(false), bridgeTimeoutMs))
+        ]);
+        if (!bridgeUp) {
+            console.error(`PyWebView not available after ${bridgeTimeoutMs}ms`);
+        }
+        restartIntervals();
+        if (bridgeUp && typeof window.pywebview.api.mark_startup === 'function') {
+            window.pywebview.api.mark_startup('dashboard');
+        }
     } catch (error) {
         console.error('Error during initialization:', error);
     }